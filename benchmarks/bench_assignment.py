@@ -0,0 +1,116 @@
+"""
+Time of part_two.creating_session for large sessions: the former nested loop over the groups
+against the single pass of shared/assignment.py.
+
+    python -m benchmarks.bench_assignment [--participants 10000]
+
+Groups, players and participants are plain objects, so this measures the assignment logic
+only (no database).
+"""
+
+import argparse
+import itertools
+import time
+
+from part_two import C
+from shared.assignment import assign_treatments, build_schedule
+
+
+class Obj:
+    def field_maybe_none(self, name):
+        return getattr(self, name, None)
+
+
+class FakeGroup(Obj):
+    def __init__(self, id_in_subsession):
+        self.id_in_subsession = id_in_subsession
+        self.players = []
+
+    def get_players(self):
+        return self.players
+
+
+class FakeSubsession:
+    def __init__(self, num_participants):
+        self.groups = []
+        self.players = []
+        for g in range(num_participants // C.PLAYERS_PER_GROUP):
+            group = FakeGroup(g + 1)
+            for _ in range(C.PLAYERS_PER_GROUP):
+                p = Obj()
+                p.group = group
+                p.participant = Obj()
+                group.players.append(p)
+                self.players.append(p)
+            self.groups.append(group)
+
+    def get_groups(self):
+        return self.groups
+
+    def get_players(self):
+        return self.players
+
+
+def legacy_creating_session(subsession):
+    # Former part_two.creating_session
+    treatments = itertools.cycle(C.TREATMENTS)
+    for group in subsession.get_groups():
+        group.t_groups = next(treatments)
+        for p in group.get_players():
+            p.treatment_0 = group.t_groups == "T0"
+            p.treatment_1 = group.t_groups == "T1"
+            p.treatment_2 = group.t_groups == "T2"
+
+        is_fem_character = itertools.cycle(C.CHARACTERS)
+        for group in subsession.get_groups():
+            group.character_random = next(is_fem_character)
+            for p in group.get_players():
+                if group.id_in_subsession == "T1":
+                    p.character_random = group.character_random
+                    if p.character_random == C.CHARACTERS[0]:
+                        p.character_sex = C.CHARACTERS_SEX[0]
+                    else:
+                        p.character_sex = C.CHARACTERS_SEX[1]
+                else:
+                    p.character_random = None
+                participant = p.participant
+                participant.p2_character_random = p.field_maybe_none("character_random")
+                participant.p2_character_sex = p.field_maybe_none("character_sex")
+
+
+def creating_session(subsession, config):
+    groups = subsession.get_groups()
+    schedule = build_schedule(len(groups), config, C, seed=0)
+    assign_treatments(groups, subsession.get_players(), C, schedule)
+
+
+def timeit(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--participants", type=int, default=10000)
+    parser.add_argument("--skip-legacy", action="store_true", help="the legacy version is O(G^2)")
+    args = parser.parse_args()
+
+    print("{} participants".format(args.participants))
+    if not args.skip_legacy:
+        subsession = FakeSubsession(args.participants)
+        duration = timeit(lambda: legacy_creating_session(subsession))
+        print("{:<28} {:10.3f} s".format("legacy nested loop", duration))
+
+    for name, config in [
+        ("cycle", {}),
+        ("blocked randomization", {"assignment_blocked_randomization": True}),
+        ("precomputed schedule", {"assignment_schedule": "T1:Samantha, T0, T2, T1:Daniel, T2, T0"}),
+    ]:
+        subsession = FakeSubsession(args.participants)
+        duration = timeit(lambda: creating_session(subsession, config))
+        print("{:<28} {:10.3f} s".format(name, duration))
+
+
+if __name__ == "__main__":
+    main()
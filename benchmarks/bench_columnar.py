@@ -0,0 +1,98 @@
+"""
+Loading the participant data for analysis: parsing the wide CSV (shared/export.py) against
+memory-mapping the columnar .npy export (shared/columnar.py).
+
+    python -m benchmarks.bench_columnar [--participants 100000]
+
+Both files are written from the same synthetic database as benchmarks/bench_export.py. The
+analysis step is the share of risky choices per scenario, part and role.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_export import build_database, export_streaming
+from shared import columnar
+from shared.export import count_participants, header, stream_participants
+from shared.scenarios import decode_matrix
+from shared.summary import ROLES
+
+
+NUM_SCENARIOS = 4
+
+
+def analyse_csv(path):
+    columns = header()
+    role_index = columns.index("role")
+    risk_index = {part: columns.index(part + "_risk_bits") for part in ("p1", "p2")}
+    counts = {(part, role): [0] * NUM_SCENARIOS for part in ("p1", "p2") for role in ROLES}
+    totals = dict.fromkeys(ROLES, 0)
+    with open(path, newline="") as fp:
+        reader = csv.reader(fp)
+        next(reader)
+        for row in reader:
+            role = row[role_index]
+            totals[role] += 1
+            for part, index in risk_index.items():
+                part_counts = counts[part, role]
+                bits = int(row[index])
+                for i in range(NUM_SCENARIOS):
+                    if bits >> i & 1:
+                        part_counts[i] += 1
+    return {key: [n / totals[key[1]] for n in value] for key, value in counts.items()}
+
+
+def analyse_npy(path):
+    data = columnar.load(path)
+    role = data["role"]
+    shares = {}
+    for part in ("p1", "p2"):
+        risk = decode_matrix(data[part + "_risk_bits"], NUM_SCENARIOS)
+        for code, name in enumerate(ROLES):
+            shares[part, name] = risk[role == code].mean(axis=0).tolist()
+    return shares
+
+
+def timeit(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--participants", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "bench.sqlite3")
+        csv_path = os.path.join(tmp, "wide.csv")
+        npy_path = os.path.join(tmp, "choices.npy")
+        build_database(database, args.participants)
+        database_url = "sqlite:///" + database
+
+        export_streaming(database_url, csv_path)
+        write_time, _ = timeit(
+            columnar.write, npy_path, stream_participants(database_url),
+            count_participants(database_url),
+        )
+
+        csv_time, csv_shares = timeit(analyse_csv, csv_path)
+        npy_time, npy_shares = timeit(analyse_npy, npy_path)
+        for key in csv_shares:
+            assert np.allclose(csv_shares[key], npy_shares[key]), key
+
+        print("{} participants, .npy written in {:.2f} s".format(args.participants, write_time))
+        print("{:<10} {:>10} {:>12}".format("", "MB", "analyse s"))
+        print("{:<10} {:>10.1f} {:>12.3f}".format("csv", os.path.getsize(csv_path) / 1e6, csv_time))
+        print("{:<10} {:>10.1f} {:>12.3f}".format("npy", os.path.getsize(npy_path) / 1e6, npy_time))
+        print("speed-up {:.0f}x".format(csv_time / npy_time))
+
+
+if __name__ == "__main__":
+    main()
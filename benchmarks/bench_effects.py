@@ -0,0 +1,112 @@
+"""
+Bootstrap of the p1 -> p2 treatment effects (shared/effects.py): the vectorized replicates
+against a loop that resamples the participant rows of every replicate, as an R / pandas
+script would.
+
+    python -m benchmarks.bench_effects [--sessions 2000] [--replicates 100000] [--processes N]
+
+The data are simulated sessions (shared/simulate.py, behavior treatment_effect: T1 and T2 make
+participants more risk averse in part two), written as columnar records (shared/columnar.py).
+The loop is timed on a few hundred replicates and extrapolated.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from part_one import C as C1
+from part_two import C as C2
+from settings import SESSION_CONFIG_DEFAULTS, SESSION_CONFIGS
+from shared import columnar
+from shared.effects import bootstrap, effect_tables, prepare, print_tables
+from shared.scenarios import decode_matrix, parse_scenarios
+from shared.simulate import BEHAVIORS, constants, simulate
+from shared.summary import CHARACTERS, TREATMENTS
+
+
+def simulated_records(num_sessions, num_participants, seed=0):
+    config = dict(SESSION_CONFIG_DEFAULTS)
+    config.update(next(c for c in SESSION_CONFIGS if c["name"] == "my_experiment"))
+    safe_options = parse_scenarios(config["scenarios"])
+    result = simulate(num_sessions, num_participants, BEHAVIORS["treatment_effect"], constants(C1, safe_options),
+                      constants(C2, safe_options), config, seed=seed)
+
+    bits = 1 << np.arange(len(safe_options))
+    records = np.zeros(result.roles.size, dtype=columnar.dtype())
+    records["session_code"] = np.repeat(["s{}".format(i) for i in range(num_sessions)], num_participants)
+    records["role"] = result.roles.ravel()
+    records["num_scenarios"] = len(safe_options)
+    records["p1_done"] = records["p2_done"] = True
+    records["p2_group_id"] = result.group.ravel() + 1
+    records["p1_risk_bits"] = (result.risky[:, :, 0] * bits).sum(axis=-1).ravel()
+    records["p2_risk_bits"] = (result.risky[:, :, 1] * bits).sum(axis=-1).ravel()
+    codes = np.array([[(TREATMENTS.index(t), CHARACTERS.index(c)) for t, c in schedule]
+                      for schedule in result.treatments])
+    group = result.group.astype(np.int64)
+    records["p2_treatment"] = np.take_along_axis(codes[:, :, 0], group, axis=1).ravel()
+    records["p2_character"] = np.take_along_axis(codes[:, :, 1], group, axis=1).ravel()
+    return records, len(safe_options)
+
+
+def loop_bootstrap(records, num_scenarios, replicates, seed=0):
+    """Resample the groups of every arm and recompute the mean changes from the participant rows."""
+    rng = np.random.default_rng(seed)
+    change = (decode_matrix(records["p2_risk_bits"], num_scenarios).astype(float)
+              - decode_matrix(records["p1_risk_bits"], num_scenarios)).mean(axis=1)
+    arm = records["p2_treatment"].astype(int) * len(CHARACTERS) + records["p2_character"]
+    groups = {}
+    for index, key in enumerate(zip(records["session_code"].tolist(), records["p2_group_id"].tolist())):
+        groups.setdefault(key, []).append(index)
+    by_arm = {}
+    for rows in groups.values():
+        by_arm.setdefault(arm[rows[0]], []).append(rows)
+
+    results = []
+    for _ in range(replicates):
+        means = {}
+        for code, arm_groups in by_arm.items():
+            drawn = rng.integers(0, len(arm_groups), len(arm_groups))
+            rows = [row for i in drawn for row in arm_groups[i]]
+            for role in range(3):
+                selected = [row for row in rows if records["role"][row] == role]
+                means[code, role] = sum(change[row] for row in selected) / len(selected)
+        results.append(means)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--participants", type=int, default=18)
+    parser.add_argument("--replicates", type=int, default=100000)
+    parser.add_argument("--loop-replicates", type=int, default=200)
+    parser.add_argument("--processes", type=int, help="default: number of CPUs")
+    args = parser.parse_args()
+
+    records, num_scenarios = simulated_records(args.sessions, args.participants)
+
+    start = time.perf_counter()
+    data = prepare(records, num_scenarios)
+    prepared = time.perf_counter() - start
+    start = time.perf_counter()
+    replicated = bootstrap(data, args.replicates, processes=args.processes)
+    changes, effects = effect_tables(data, replicated)
+    vectorized = time.perf_counter() - start
+    print_tables(changes, effects, num_scenarios, 0.95)
+
+    start = time.perf_counter()
+    loop_bootstrap(records, num_scenarios, args.loop_replicates)
+    loop = (time.perf_counter() - start) / args.loop_replicates
+
+    print()
+    print("{} participants in {} groups, {} replicates".format(
+        len(records), sum(len(s) for s in data.sums), args.replicates))
+    print("vectorized: prepare {:.2f} s, bootstrap and tables {:.1f} s ({:.0f} us per replicate)".format(
+        prepared, vectorized, vectorized / args.replicates * 1e6))
+    print("row loop:   {:.1f} ms per replicate, {:.1f} h for {} replicates (extrapolated)".format(
+        loop * 1000, loop * args.replicates / 3600, args.replicates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Wide export of 100k participants: streaming (shared/export.py) against loading all rows first.
+
+    python -m benchmarks.bench_export [--participants 100000]
+
+Builds a temporary SQLite database with an otree_participant table filled like oTree does
+(participant.vars with the p1/p2 records), then writes the wide CSV to a temp file.
+Reports wall time and peak Python memory (tracemalloc, separate run) of both approaches.
+"""
+
+import argparse
+import binascii
+import csv
+import os
+import pickle
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from shared.export import header, stream_participants, wide_row
+from shared.scenarios import DEFAULT_SCENARIOS, encode, parse_scenarios
+from shared.summary import record
+
+
+ROLES = ["Just World", "Elite", "Non Elite"]
+SAFE_OPTIONS = parse_scenarios(DEFAULT_SCENARIOS)
+
+
+def build_database(path, num_participants, participants_per_session=300):
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE otree_participant (id INTEGER PRIMARY KEY, _session_code TEXT, "
+                 "code TEXT, label TEXT, id_in_session INTEGER, _vars TEXT)")
+
+    def rows():
+        for i in range(num_participants):
+            role = ROLES[i % 3]
+            parts = {}
+            for part in ("p1", "p2"):
+                risks = [rng.random() < 0.5 for _ in SAFE_OPTIONS]
+                scenario = rng.randint(1, len(SAFE_OPTIONS))
+                plays = risks[scenario - 1] or role == "Non Elite"
+                lottery = rng.choice([800, 0])
+                payoff = 800 - (lottery if plays else SAFE_OPTIONS[scenario - 1])
+                parts[part] = record(
+                    encode(risks), scenario, risks[scenario - 1], plays, lottery if plays else None,
+                    SAFE_OPTIONS[scenario - 1], payoff, role, group_id=i // 3 + 1,
+                    treatment=i // 3 % 3, character="Samantha" if i // 3 % 3 == 1 else None,
+                )
+            vars = dict(c_role=role, p2_character_random=None, p2_character_sex=None, **parts)
+            encoded = binascii.b2a_base64(pickle.dumps(vars)).decode("utf-8")
+            session = "s{:07d}".format(i // participants_per_session)
+            yield i + 1, session, "p{:07d}".format(i), None, i % participants_per_session + 1, encoded
+
+    conn.executemany("INSERT INTO otree_participant VALUES (?, ?, ?, ?, ?, ?)", rows())
+    conn.commit()
+    conn.close()
+
+
+def export_streaming(database_url, output):
+    with open(output, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header())
+        for participant in stream_participants(database_url):
+            writer.writerow(wide_row(*participant))
+
+
+def export_materialized(database_url, output):
+    # What a load-everything-then-join approach does: all participants in memory at once
+    participants = list(stream_participants(database_url))
+    rows = [wide_row(*participant) for participant in participants]
+    with open(output, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header())
+        writer.writerows(rows)
+
+
+def measure(fn, *args):
+    # Time and memory in separate runs, tracemalloc slows everything down
+    start = time.perf_counter()
+    fn(*args)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--participants", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        output = os.path.join(tmp, "wide.csv")
+        build_database(path, args.participants)
+        database_url = "sqlite:///" + path
+
+        print("{} participants".format(args.participants))
+        for name, fn in [("streaming", export_streaming), ("materialized", export_materialized)]:
+            duration, peak = measure(fn, database_url, output)
+            print("{:<14} {:8.2f} s  {:10.0f} rows/s  peak memory {:8.1f} MB".format(
+                name, duration, args.participants / duration, peak / 1e6))
+        print("CSV size {:.1f} MB".format(os.path.getsize(output) / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Session payment forecast (shared/forecast.py) against Monte Carlo: time and agreement.
+
+    python -m benchmarks.bench_forecast [--samples 100000]
+
+For every session size the exact forecast is timed and compared with the quantiles of
+--samples simulated sessions drawn from the same per-participant payments.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from part_one import C as C1
+from part_two import C as C2
+from shared.forecast import QUANTILES, forecast, participant_distributions
+from shared.scenarios import DEFAULT_SCENARIOS, parse_scenarios
+
+
+RISKY = [0.95, 0.75, 0.4, 0.1]
+SIZES = [18, 180, 1800, 9999]
+
+
+def monte_carlo(distributions, num_participants, samples, rng, batch=10000):
+    n = num_participants // len(distributions)
+    totals = []
+    for start in range(0, samples, batch):
+        size = min(batch, samples - start)
+        total = np.zeros(size)
+        for values, probs in distributions:
+            # sum of n draws = counts of every payment value (multinomial) times the values
+            total += rng.multinomial(n, probs, size=size) @ values
+        totals.append(total)
+    return np.concatenate(totals) / 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=100000)
+    args = parser.parse_args()
+
+    distributions = participant_distributions(C1, C2, parse_scenarios(DEFAULT_SCENARIOS), RISKY, RISKY, 0.0125, 4.0)
+    rng = np.random.default_rng(0)
+    # p99.9 needs more samples than the default to compare
+    quantiles = [q for q in QUANTILES if q < 0.999]
+    print("{:>6} {:>10} {:>12}   {} exact vs MC".format(
+        "N", "exact ms", "MC s", " / ".join("p{:g}".format(q * 100) for q in quantiles)))
+    for size in SIZES:
+        start = time.perf_counter()
+        f = forecast(size, distributions)
+        exact = time.perf_counter() - start
+
+        start = time.perf_counter()
+        totals = monte_carlo(distributions, size, args.samples, rng)
+        mc = time.perf_counter() - start
+        print("{:>6} {:>10.1f} {:>12.2f}   {}".format(size, exact * 1000, mc, "  ".join(
+            "{:.2f}/{:.2f}".format(f.quantiles[q], np.quantile(totals, q)) for q in quantiles)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Append and scan time of the audit journal (shared/journal.py), for months of sessions.
+
+    python -m benchmarks.bench_journal [--sessions 5000] [--participants 18]
+
+Every session appends what the callbacks of a real one do: its assignments at creation and
+its part 1 and part 2 results, one append per callback. The scans look up one participant,
+one session and one week over all records, from a cold memory map.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from shared.journal import ASSIGNMENT, RECORD_SIZE, RESULT, Journal, encode, files, scan
+from shared.summary import record
+
+
+def code(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--participants", type=int, default=18)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix="bench_journal_")
+    journal = Journal(directory)
+    summary = record(0b1011, 4, True, True, 800, 400, 0, "Elite", group_id=7, treatment="T1",
+                     character="Samantha")
+
+    # Three months of sessions
+    start_time = time.time() - 90 * 86400
+    appends = 0
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        now = start_time + i * 90 * 86400 / args.sessions
+        session = code(rng)
+        participants = [code(rng) for _ in range(args.participants)]
+        for kind, part in [(ASSIGNMENT, 2), (RESULT, 1), (RESULT, 2)]:
+            journal.append([encode(now, session, participant, kind, part, j // 3 + 1, j % 3 + 1, summary)
+                            for j, participant in enumerate(participants)], now)
+            appends += 1
+    journal.close()
+    write = time.perf_counter() - start
+
+    records = args.sessions * args.participants * 3
+    size = sum(path.stat().st_size for path in files(directory))
+    print("{} records ({} MB in {} files), {} appends in {:.2f} s: {:.1f} us per append".format(
+        records, size // 2 ** 20, len(files(directory)), appends, write, write / appends * 1e6))
+    assert size == records * RECORD_SIZE
+
+    for name, filters in [("participant", dict(participant=participants[0])),
+                          ("session", dict(session=session)),
+                          ("last week", dict(since=start_time + 83 * 86400, kind=RESULT))]:
+        start = time.perf_counter()
+        found = scan(directory, **filters)
+        print("scan {:<12} {:>8} records in {:6.1f} ms".format(name, len(found), (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
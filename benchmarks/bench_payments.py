@@ -0,0 +1,95 @@
+"""
+Bulk payment file (shared/payments.py) for many sessions: wall time and peak Python memory.
+
+    python -m benchmarks.bench_payments [--sessions 500 5000] [--participants 18]
+
+Builds a temporary SQLite database with otree_session and otree_participant tables filled like
+oTree does (pickled session config, participant.vars with the p1/p2 records, labels from
+the econ101 room), plus pooled sessions of another config that the file must skip.
+"""
+
+import argparse
+import binascii
+import csv
+import os
+import pickle
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+
+from shared.payments import room_labels, sessions, write_payments
+from shared.summary import record
+
+
+def _encode(value):
+    return binascii.b2a_base64(pickle.dumps(value)).decode("utf-8")
+
+
+def build_database(path, num_sessions, participants_per_session):
+    rng = random.Random(0)
+    labels = sorted(room_labels("econ101"))
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE otree_session (id INTEGER PRIMARY KEY, code TEXT, label TEXT, _created INTEGER, "
+                 "config TEXT, is_demo BOOLEAN)")
+    conn.execute("CREATE TABLE otree_participant (id INTEGER PRIMARY KEY, session_id INTEGER, code TEXT, "
+                 "label TEXT, visited BOOLEAN, _vars TEXT)")
+    config = _encode(dict(name="my_experiment", real_world_currency_per_point=0.0125, participation_fee=4.0))
+    other = _encode(dict(name="my_experiment_12", real_world_currency_per_point=0.0125, participation_fee=4.0))
+    start = int(time.time()) - 7 * 86400
+
+    participant_id = 0
+    for session_id in range(1, num_sessions + 1):
+        conn.execute("INSERT INTO otree_session VALUES (?, ?, ?, ?, ?, ?)",
+                     (session_id, "s{:07d}".format(session_id), "", start + session_id,
+                      config if session_id % 10 else other, False))
+        rows = []
+        for i in range(participants_per_session):
+            participant_id += 1
+            parts = {part: record(0, 1, False, False, None, 400, rng.choice([0, 400, 800]), "Elite",
+                                  group_id=participant_id // 3 + 1)
+                     for part in ("p1", "p2")}
+            rows.append((participant_id, session_id, "p{:07d}".format(participant_id),
+                         labels[i % len(labels)], i % 9 != 8, _encode(dict(c_role="Elite", **parts))))
+        conn.executemany("INSERT INTO otree_participant VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def run(database_url, output):
+    engine = create_engine(database_url)
+    with open(output, "w", newline="") as fp:
+        return write_payments(csv.writer(fp), engine, sessions(engine, "my_experiment"), room_labels("econ101"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--participants", type=int, default=18)
+    args = parser.parse_args()
+
+    print("{:>9} {:>13} {:>10} {:>12} {:>12}".format("sessions", "participants", "time s", "peak MB", "total"))
+    for num_sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "db.sqlite3")
+            build_database(path, num_sessions, args.participants)
+            url = "sqlite:///" + path
+            output = os.path.join(directory, "payments.csv")
+
+            start = time.perf_counter()
+            total, _ = run(url, output)
+            seconds = time.perf_counter() - start
+
+            tracemalloc.start()
+            run(url, output)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("{:>9} {:>13} {:>10.2f} {:>12.1f} {:>12}".format(
+                num_sessions, total.participants, seconds, peak / 2 ** 20, total.amount))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Resolution time per 1,000 groups: the former per-group loop of ResultsWaitPage against the
+batched engine in shared/payoffs.py.
+
+    python -m benchmarks.bench_payoffs [--groups 1000] [--repeat 20]
+
+Players are plain objects, so this measures the payoff logic only (no database).
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from otree.api import cu
+
+from part_one import C
+from shared.payoffs import resolve, resolve_groups
+from shared.scenarios import DEFAULT_SCENARIOS, decode, encode, parse_scenarios
+
+
+SAFE_OPTIONS = [cu(loss) for loss in parse_scenarios(DEFAULT_SCENARIOS)]
+
+
+class FakePlayer:
+    def __init__(self, risks):
+        self.risk_bits = encode(risks)
+        self.lottery_random = None
+
+    def field_maybe_none(self, name):
+        return getattr(self, name)
+
+
+class FakeGroup:
+    def __init__(self, players):
+        self.players = players
+
+    def get_players(self):
+        return self.players
+
+
+def make_groups(num_groups, rng):
+    return [FakeGroup([FakePlayer([rng.random() < 0.5 for _ in range(4)]) for _ in range(3)])
+            for _ in range(num_groups)]
+
+
+def legacy_after_all_players_arrive(group):
+    # Former ResultsWaitPage.after_all_players_arrive, without the participant storage
+    players = group.get_players()
+    for p in players:
+        p.scenario_random = random.randint(1, 4)
+        list_choices = decode(p.risk_bits, 4)
+        p.risk_random = list_choices[p.scenario_random - 1]
+        if p.risk_random:
+            p.risk_random_str = "Risky Lottery"
+            p.safe_random_str = " "
+        else:
+            p.risk_random_str = "Safe Option"
+            p.safe_random_str = str(SAFE_OPTIONS[p.scenario_random - 1])
+    players[2].safe_random_str = " "
+
+    for p in players[:2]:
+        if p.risk_random:
+            p.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
+            p.payoff = C.ENDOWMENT - p.lottery_random
+        else:
+            p.payoff = C.ENDOWMENT - SAFE_OPTIONS[p.scenario_random - 1]
+    players[2].lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
+    players[2].payoff = C.ENDOWMENT - players[2].lottery_random
+
+    for p in players:
+        p.lottery_random_str = str(p.field_maybe_none("lottery_random"))
+        if p.lottery_random_str == "None":
+            p.lottery_random_str = " "
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    groups = make_groups(args.groups, rng)
+    choices = np.array([[decode(p.risk_bits, 4) for p in g.players] for g in groups])
+    per_1000 = 1000 / args.groups
+
+    results = [
+        ("legacy per-group loop", lambda: [legacy_after_all_players_arrive(g) for g in groups]),
+        ("batched resolve_groups", lambda: resolve_groups(groups, C, SAFE_OPTIONS, np_rng)),
+        ("batched resolve (arrays only)", lambda: resolve(
+            choices, SAFE_OPTIONS, C.ENDOWMENT, [C.RISK_LOW, C.RISK_HIGH], np_rng)),
+    ]
+    print("{} groups, best of {}".format(args.groups, args.repeat))
+    for name, fn in results:
+        print("{:<32} {:8.3f} ms per 1,000 groups".format(name, timeit(fn, args.repeat) * 1000 * per_1000))
+
+
+if __name__ == "__main__":
+    main()
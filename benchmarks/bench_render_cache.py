@@ -0,0 +1,69 @@
+"""
+Latency of the role- and treatment-invariant pages with and without the render cache
+(shared/render_cache.py), when the whole lab loads the same page at the same moment.
+
+    # server as in benchmarks/load_test.py
+    python -m benchmarks.bench_render_cache --participants 150 --rest-key loadtest
+
+For each mode a session is created through the REST API (render_cache=true / false). Every
+simulated browser opens its start link (Introduction), waits at a barrier, and then all of
+them reload the page together, --repeat times.
+"""
+
+import argparse
+import threading
+
+from benchmarks.load_test import Browser, Stats, print_table, rest
+
+
+def burst(server, rest_key, participants, repeat, render_cache):
+    payload = dict(session_config_name="my_experiment", num_participants=participants,
+                   modified_session_config_fields=dict(render_cache=render_cache))
+    code = rest(server, "/api/sessions", rest_key, payload)["code"]
+    codes = [p["code"] for p in rest(server, "/api/get_session/{}".format(code), rest_key, {})["participants"]]
+
+    stats = Stats()
+    barrier = threading.Barrier(len(codes))
+
+    def play(participant_code):
+        browser = Browser(server, "/InitializeParticipant/{}".format(participant_code), Stats(), 0, 0, None)
+        try:
+            # the first load renders the page (and fills the cache); measure the reloads only
+            browser.follow("GET", browser.path)
+            page = browser.path
+            browser.stats = stats
+            for _ in range(repeat):
+                barrier.wait()
+                browser.request("GET", page)
+        except Exception as exc:
+            stats.add_error("{}: {}".format(participant_code, exc))
+            barrier.abort()
+
+    threads = [threading.Thread(target=play, args=(c,), daemon=True) for c in codes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", default="http://127.0.0.1:8000")
+    parser.add_argument("--participants", type=int, default=150, help="multiple of 3")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rest-key", help="value of OTREE_REST_KEY on the server")
+    args = parser.parse_args()
+
+    rows = []
+    for render_cache in (False, True):
+        stats = burst(args.server, args.rest_key, args.participants, args.repeat, render_cache)
+        if stats.errors:
+            print("render_cache={}: {} errors, e.g. {}".format(render_cache, len(stats.errors), stats.errors[0]))
+        for (page, method), values in sorted(stats.latency.items()):
+            rows.append(("{} render_cache={}".format(page, render_cache), values))
+    print_table("{} simultaneous reloads x {}".format(args.participants, args.repeat), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Replay of all sessions in a database (shared/replay.py): thousands of sessions, both parts.
+
+    python -m benchmarks.bench_replay [--sessions 2000] [--groups 6]
+
+Builds a temporary SQLite database with the tables the replay reads (otree_session with the
+seed in its vars and the scenario table in its config, and the player and group tables of both
+parts) for sessions whose payoffs
+were drawn from the seeded streams, then replays the whole database. One payoff is altered
+beforehand, so exactly one mismatch must be reported.
+"""
+
+import argparse
+import binascii
+import os
+import pickle
+import random
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from part_one import C as C1
+from part_two import C as C2
+from shared.replay import APPS, replay, replay_database
+from shared.scenarios import DEFAULT_SCENARIOS, encode, parse_scenarios
+
+
+def _encode(value):
+    # Same encoding as otree.database._PickleField
+    return binascii.b2a_base64(pickle.dumps(value)).decode("utf-8")
+
+
+def build_database(path, num_sessions, groups_per_session):
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE otree_session (id INTEGER PRIMARY KEY, code TEXT, _vars TEXT, config TEXT)")
+    seeds = [rng.getrandbits(64) for _ in range(num_sessions)]
+    conn.executemany("INSERT INTO otree_session VALUES (?, ?, ?, ?)", [
+        (s + 1, "s{:07d}".format(s), _encode(dict(rng_seed=seed)), _encode(dict(scenarios=DEFAULT_SCENARIOS)))
+        for s, seed in enumerate(seeds)
+    ])
+    safe_options = parse_scenarios(DEFAULT_SCENARIOS)
+    num_scenarios = len(safe_options)
+
+    session_ids = np.repeat(np.arange(1, num_sessions + 1), groups_per_session)
+    group_numbers = np.tile(np.arange(1, groups_per_session + 1), num_sessions)
+    for (app, part), C in zip(APPS, [C1, C2]):
+        conn.execute("CREATE TABLE {}_group (id INTEGER PRIMARY KEY, id_in_subsession INTEGER)".format(app))
+        conn.execute("CREATE TABLE {}_player (id INTEGER PRIMARY KEY, session_id INTEGER, group_id INTEGER, "
+                     "id_in_group INTEGER, risk_bits INTEGER, scenario_random INTEGER, lottery_random TEXT, "
+                     "_payoff TEXT)".format(app))
+
+        choices = np.array([[[rng.random() < 0.5 for _ in range(num_scenarios)] for _ in range(3)]
+                            for _ in range(len(session_ids))])
+        res = replay([seeds[s - 1] for s in session_ids], part, group_numbers, choices, C, safe_options)
+
+        conn.executemany("INSERT INTO {}_group VALUES (?, ?)".format(app),
+                         [(g + 1, int(number)) for g, number in enumerate(group_numbers)])
+        rows = []
+        for g in range(len(session_ids)):
+            for i in range(3):
+                lottery = str(res.lottery_random[g, i]) if res.plays_lottery[g, i] else None
+                rows.append((len(rows) + 1, int(session_ids[g]), g + 1, i + 1, encode(choices[g, i]),
+                             int(res.scenario_random[g, i]), lottery, str(res.payoff[g, i])))
+        placeholders = ", ".join("?" * len(rows[0]))
+        conn.executemany("INSERT INTO {}_player VALUES ({})".format(app, placeholders), rows)
+
+    conn.execute("UPDATE part_two_player SET _payoff = _payoff + 1 WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=6, help="groups per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        build_database(path, args.sessions, args.groups)
+
+        start = time.perf_counter()
+        reports = replay_database("sqlite:///" + path)
+        duration = time.perf_counter() - start
+
+    print("{} sessions x {} groups x 2 parts replayed in {:.2f} s".format(args.sessions, args.groups, duration))
+    for report in reports:
+        print("{:<9} {:6} groups {:6.2f} s  {} mismatches".format(
+            report.app, report.groups, report.seconds, len(report.mismatches)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Storage cost of the choices as the scenario table grows: one BooleanField per scenario (the
+former risk_1..risk_N) against the single risk_bits field (shared/scenarios.py).
+
+    python -m benchmarks.bench_scenarios [--players 20000] [--scenarios 4 12 20]
+
+For every table size a temporary SQLite player table is filled like the choice page does (one
+UPDATE per player with the submitted fields) and read back like the replay does. Reported are
+the database bytes per player, the time of the UPDATEs and of the SELECT, and the width of the
+choice columns in the wide CSV export.
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from shared.scenarios import decode_matrix, encode
+
+
+def build(path, num_players, num_scenarios, bits):
+    conn = sqlite3.connect(path)
+    choice_columns = ["risk_bits INTEGER"] if bits else \
+        ["risk_{} BOOLEAN".format(i) for i in range(1, num_scenarios + 1)]
+    conn.execute("CREATE TABLE player (id INTEGER PRIMARY KEY, session_id INTEGER, group_id INTEGER, "
+                 "id_in_group INTEGER, {}, scenario_random INTEGER, _payoff TEXT)".format(", ".join(choice_columns)))
+    conn.executemany("INSERT INTO player (id, session_id, group_id, id_in_group) VALUES (?, 1, ?, ?)",
+                     [(i + 1, i // 3 + 1, i % 3 + 1) for i in range(num_players)])
+    conn.commit()
+    return conn
+
+
+def submit(conn, choices, bits):
+    # One UPDATE per submitted Choices page, with the page's form fields
+    num_scenarios = len(choices[0])
+    if bits:
+        statement = "UPDATE player SET risk_bits = ? WHERE id = ?"
+        rows = [(encode(risks), i + 1) for i, risks in enumerate(choices)]
+    else:
+        statement = "UPDATE player SET {} WHERE id = ?".format(
+            ", ".join("risk_{} = ?".format(i) for i in range(1, num_scenarios + 1)))
+        rows = [(*risks, i + 1) for i, risks in enumerate(choices)]
+    for row in rows:
+        conn.execute(statement, row)
+    conn.commit()
+
+
+def read(conn, num_scenarios, bits):
+    if bits:
+        values = [row[0] for row in conn.execute("SELECT risk_bits FROM player ORDER BY id")]
+        return decode_matrix(values, num_scenarios)
+    columns = ", ".join("risk_{}".format(i) for i in range(1, num_scenarios + 1))
+    return [list(map(bool, row)) for row in conn.execute("SELECT {} FROM player ORDER BY id".format(columns))]
+
+
+def csv_width(choices, bits):
+    # Bytes of the choice columns of one part in the wide export, per participant
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for risks in choices:
+        writer.writerow([encode(risks)] if bits else [int(risk) for risk in risks])
+    return len(out.getvalue()) / len(choices)
+
+
+def measure(tmp, num_players, num_scenarios, bits, rng):
+    path = os.path.join(tmp, "{}_{}.sqlite3".format(num_scenarios, bits))
+    choices = [[rng.random() < 0.5 for _ in range(num_scenarios)] for _ in range(num_players)]
+    conn = build(path, num_players, num_scenarios, bits)
+
+    start = time.perf_counter()
+    submit(conn, choices, bits)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read(conn, num_scenarios, bits)
+    read_time = time.perf_counter() - start
+
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path) / num_players, write_time, read_time, csv_width(choices, bits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--players", type=int, default=20000)
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[4, 12, 20])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print("{} players".format(args.players))
+    print("{:>9} {:<12} {:>12} {:>10} {:>10} {:>12}".format(
+        "scenarios", "layout", "bytes/row", "UPDATE s", "SELECT s", "CSV bytes"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_scenarios in args.scenarios:
+            for bits, layout in [(False, "risk_1..N"), (True, "risk_bits")]:
+                size, write_time, read_time, width = measure(tmp, args.players, num_scenarios, bits, rng)
+                print("{:>9} {:<12} {:>12.1f} {:>10.3f} {:>10.3f} {:>12.1f}".format(
+                    num_scenarios, layout, size, write_time, read_time, width))
+
+
+if __name__ == "__main__":
+    main()
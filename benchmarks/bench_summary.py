@@ -0,0 +1,86 @@
+"""
+Serialized size and save time of participant.vars: the former 29 loose PARTICIPANT_FIELDS
+against the per-part records of shared/summary.py (one dict of plain values per part).
+
+    python -m benchmarks.bench_summary [--repeat 20000]
+
+The vars are encoded like oTree does on every save (base64 of the pickled dict).
+"""
+
+import argparse
+import binascii
+import pickle
+import time
+
+from otree.api import cu
+
+from shared.summary import record
+
+
+def legacy_vars():
+    # Values as stored by the former ResultsWaitPages for an Elite participant in T1
+    return dict(
+        p1_group_id=17, c_role="Elite",
+        p1_risk_1=True, p1_risk_2=False, p1_risk_3=False, p1_risk_4=True,
+        p1_scenario_random=2, p1_risk_random=False, p1_lottery_random=None, p1_payoff=cu(200),
+        p1_risk_random_str="Safe Option", p1_safe_random_str="600 tokens", p1_lottery_random_str=" ",
+        p2_risk_1=True, p2_risk_2=True, p2_risk_3=False, p2_risk_4=True,
+        p2_scenario_random=4, p2_risk_random=True, p2_lottery_random=cu(800), p2_payoff=cu(0),
+        p2_risk_random_str="Risky Lottery", p2_safe_random_str=" ", p2_lottery_random_str="800 tokens",
+        p2_character_random="Samantha", p2_character_sex="she",
+        treatment_0=False, treatment_1=True, treatment_2=False,
+    )
+
+
+def record_vars():
+    return dict(
+        c_role="Elite",
+        p1=record(0b1001, 2, False, False, None, 600, 200, "Elite", group_id=17),
+        p2=record(0b1011, 4, True, True, 800, 400, 0, "Elite", group_id=52,
+                  treatment="T1", character="Samantha"),
+        p2_character_random="Samantha", p2_character_sex="she",
+    )
+
+
+def encode(vars):
+    # otree.database._PickleField.process_bind_param
+    return binascii.b2a_base64(pickle.dumps(dict(vars))).decode("utf-8")
+
+
+def decode(value):
+    return pickle.loads(binascii.a2b_base64(value.encode("utf-8")))
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    rows = []
+    for name, vars in [("29 loose fields", legacy_vars()), ("p1/p2 records", record_vars())]:
+        encoded = encode(vars)
+        rows.append((
+            name,
+            len(encoded),
+            timeit(lambda: encode(vars), args.repeat),
+            timeit(lambda: decode(encoded), args.repeat),
+        ))
+
+    print("{:<24} {:>10} {:>12} {:>12}".format("", "bytes", "save us", "load us"))
+    for name, size, save, load in rows:
+        print("{:<24} {:>10} {:>12.2f} {:>12.2f}".format(name, size, save * 1e6, load * 1e6))
+
+    (_, old_size, old_save, old_load), (_, new_size, new_save, new_load) = rows
+    print("reduction: size {:.0%}, save time {:.0%}, load time {:.0%}".format(
+        1 - new_size / old_size, 1 - new_save / old_save, 1 - new_load / old_load))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Database writes of part_two's ResultsWaitPage.after_all_players_arrive: the fields set one by
+one (player.payoff commits on every assignment) against the batched writes of shared/bulk.py.
+
+    python -m benchmarks.bench_writes [--groups 10 100 1000] [--database-url postgresql://...]
+
+The player, group and participant tables are mirrored with oTree's column types (currency,
+pickled participant vars) in a fresh database per run, SQLite in a temporary directory unless
+--database-url is given. The callback resolves all groups (shared/payoffs.py) and stores the
+participant records (shared/summary.py). Reported are the UPDATE statements, commits and
+statements of any kind per group, counted on the connection, and the wall time per group
+including the final commit of the request.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from otree.database import CurrencyType, VarsDescriptor, VarsDict, _PickleField
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import object_session, relationship, sessionmaker
+
+from part_two import C
+from shared.bulk import batched_writes
+from shared.payoffs import resolve_groups
+from shared.scenarios import DEFAULT_SCENARIOS, parse_scenarios
+from shared.summary import summarize
+
+
+Base = declarative_base()
+SAFE_OPTIONS = parse_scenarios(DEFAULT_SCENARIOS)
+
+
+class Model(Base):
+    __abstract__ = True
+    id = Column(Integer, primary_key=True)
+
+    def field_maybe_none(self, name):
+        return getattr(self, name)
+
+
+class Participant(Model):
+    __tablename__ = "bench_participant"
+    payoff = Column(CurrencyType, default=0)
+    _vars = Column(VarsDict.as_mutable(_PickleField), default=VarsDict)
+
+    @property
+    def vars(self):
+        self._vars.changed()
+        return self._vars
+
+    c_role = VarsDescriptor("c_role")
+    p2 = VarsDescriptor("p2")
+
+
+class Group(Model):
+    __tablename__ = "bench_group"
+    t_groups = Column(String(10000))
+    character_random = Column(String(10000))
+    players = relationship("Player", order_by="Player.id_in_group")
+
+    def get_players(self):
+        return self.players
+
+
+class Player(Model):
+    __tablename__ = "bench_player"
+    group_id = Column(Integer, ForeignKey("bench_group.id"))
+    participant_id = Column(Integer, ForeignKey("bench_participant.id"))
+    participant = relationship(Participant)
+    id_in_group = Column(Integer)
+
+    risk_bits = Column(Integer)
+    scenario_random = Column(Integer)
+    risk_random = Column(Boolean)
+    risk_random_str = Column(String(10000))
+    safe_random_str = Column(String(10000))
+    lottery_random = Column(CurrencyType)
+    lottery_random_str = Column(String(10000))
+    _payoff = Column(CurrencyType, default=0)
+
+    @property
+    def payoff(self):
+        return self._payoff
+
+    @payoff.setter
+    def payoff(self, value):
+        # As oTree's Player.payoff
+        delta = value - self._payoff
+        self._payoff += delta
+        self.participant.payoff += delta
+        object_session(self).commit()
+
+
+def populate(Session, num_groups, rng):
+    session = Session()
+    for g in range(num_groups):
+        group = Group(t_groups=C.TREATMENTS[g % len(C.TREATMENTS)])
+        for i in range(C.PLAYERS_PER_GROUP):
+            participant = Participant(_vars=VarsDict(c_role=["Just World", "Elite", "Non Elite"][i]))
+            group.players.append(Player(id_in_group=i + 1, participant=participant,
+                                        risk_bits=rng.randrange(1 << len(SAFE_OPTIONS))))
+        session.add(group)
+    session.commit()
+    session.close()
+
+
+def callback(session, batch=None):
+    # part_two.ResultsWaitPage.after_all_players_arrive on the mirror tables
+    groups = session.query(Group).order_by(Group.id).all()
+    players, _ = resolve_groups(groups, C, SAFE_OPTIONS, np.random.default_rng(0), batch)
+    for group, group_players in zip(groups, players):
+        for p in group_players:
+            record = summarize(p, SAFE_OPTIONS, role=p.participant.c_role, group_id=group.id, treatment=group.t_groups)
+            if batch is None:
+                p.participant.p2 = record
+            else:
+                batch.set_vars(p.participant, p2=record)
+
+
+def legacy(session):
+    callback(session)
+
+
+def batched(session):
+    with batched_writes() as batch:
+        callback(session, batch)
+
+
+def measure(url, num_groups, run):
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    populate(Session, num_groups, random.Random(num_groups))
+
+    counts = dict(update=0, commit=0, total=0)
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counts["total"] += 1
+        counts["update"] += statement.lstrip().upper().startswith("UPDATE")
+
+    def on_commit(conn):
+        counts["commit"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    event.listen(engine, "commit", on_commit)
+
+    session = Session()
+    start = time.perf_counter()
+    run(session)
+    session.commit()
+    elapsed = time.perf_counter() - start
+    session.close()
+    event.remove(engine, "before_cursor_execute", on_execute)
+    event.remove(engine, "commit", on_commit)
+
+    # Both variants must store the same values
+    session = Session()
+    stored = [(p.scenario_random, str(p.payoff), str(p.participant.payoff), p.participant._vars["p2"])
+              for p in session.query(Player).order_by(Player.id)]
+    session.close()
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+    return counts, elapsed, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groups", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--database-url", help="e.g. postgresql://user@localhost/bench (default: temporary SQLite)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or "sqlite:///" + os.path.join(tmp, "bench_writes.sqlite3")
+        print(url.split("://")[0])
+        print("{:>7} {:<9} {:>12} {:>12} {:>12} {:>12}".format(
+            "groups", "writes", "UPDATE/grp", "commit/grp", "stmts/grp", "ms/grp"))
+        for num_groups in args.groups:
+            results = {}
+            for name, run in [("legacy", legacy), ("batched", batched)]:
+                counts, elapsed, results[name] = measure(url, num_groups, run)
+                print("{:>7} {:<9} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.3f}".format(
+                    num_groups, name, counts["update"] / num_groups, counts["commit"] / num_groups,
+                    counts["total"] / num_groups, elapsed * 1000 / num_groups))
+            assert results["legacy"] == results["batched"], "the batched writes stored different values"
+
+
+if __name__ == "__main__":
+    main()
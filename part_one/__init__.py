@@ -1,16 +1,29 @@
 from otree.api import *
 
 #further packages
-import random
+from shared.bulk import batched_writes
+from shared.export import wide_rows
+from shared.grouping import GroupFormationPage, form_group, wait_report
+from shared.live import count_choice, report as live_report, settle
+from shared.payoffs import last_group_resolved, resolve_groups
+from shared.render_cache import CachedPage
+from shared.release import ReleaseWaitPage, release_report
+from shared.rng import PART_ONE, group_streams, session_seed
+from shared.scenarios import ChoicesPage, max_bits, scenario_table
+from shared.journal import log_results
+from shared.snapshot import save as save_snapshot
+from shared.summary import summarize
+from shared.timing import report, timed
 
 
 doc = """
 There are three different clusters of players (roles): JW, E and NE. 
 JW participants ignore the existence of the world with inequalities for decision-making 
 opportunities. UW participants (E + NE) ignore the existence of the world without ex-ante 
-inequalities. Players receive a fix endowment and submit their risk preferences for four 
-independent contexts. All scenarios are in the loss domain with different levels for the 
-safe option. The risk-taking alternative remains constant across all four scenarios. 
+inequalities. Players receive a fix endowment and submit their risk preferences for several 
+independent contexts (the scenario table of the session config). All scenarios are in the loss 
+domain with different levels for the safe option. The risk-taking alternative remains constant 
+across all scenarios. 
 """
 
 
@@ -24,7 +37,7 @@ class C(BaseConstants):
     RISK_LOW = cu(800)
     RISK_HIGH = cu(0)
 
-    SAFE_OPTIONS = [cu(775), cu(600), cu(500), cu(400)]
+    # The safe option of every scenario comes from the session config (shared/scenarios.py)
 
 
     # Clusters
@@ -32,16 +45,8 @@ class C(BaseConstants):
     E_ROLE = "Elite"
     NE_ROLE = "Non Elite"
 
-    # Templates
-    INTRODUCTION_TEMPLATE = "part_one/temp_introduction.html"
-
-    COMPREHENSION_Q_JW_TEMPLATE = "part_one/temp_comprehension_q_JW.html"
-    COMPREHENSION_Q_UW_TEMPLATE = "part_one/temp_comprehension_q_UW.html"
-
-    INSTRUCTIONS_JW_TEMPLATE = "part_one/temp_instructions_JW.html"
-    INSTRUCTIONS_UW_TEMPLATE = "part_one/temp_instructions_UW.html"
-
-    CHOICES_TEMPLATE = "part_one/temp_choices.html"
+    # Templates (introduction, instructions and quiz are in part_one_intro)
+    CHOICES_TEMPLATE = "global/scenario_choices.html"
 
 
 
@@ -62,46 +67,9 @@ class Group(BaseGroup):
             #################################################################################
 
 class Player(BasePlayer):
-    # 4 random choices per player --> 4 risk scenarios --> 4 bools since var of interest (C) is binary
-
-    risk_1 = models.BooleanField(
-        label="Scenario 1:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -775 tokens with 100% probability"]
-        ]
-    )
-    risk_2 = models.BooleanField(
-        label="Scenario 2:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -600 tokens with 100% probability"]
-        ]
-    )
-    risk_3 = models.BooleanField(
-        label="Scenario 3:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -500 tokens with 100% probability"]
-        ]
-    )
-    risk_4 = models.BooleanField(
-        label="Scenario 4:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -400 tokens with 100% probability"]
-        ]
-    )
-
-    # Include comprehension questions. Note, additional question for UW.
-    quiz_1_all = models.IntegerField(label="1. How many scenarios will be presented?")
-    quiz_2_all = models.IntegerField(label="2. How many decisions will be implemented for the payment?")
-    quiz_UW = models.BooleanField(label=
-                                    "3. Assume you are assigned to the Non Elite group and you choose "
-                                    "the safe alternative in Scenario 3. Further, assume that Scenario "
-                                    "3 is selected by the computer for your payment. Will you get the "
-                                    "value of the safe option?",
-                                    choices=[[True, "Yes"], [False, "No"]])
+    # Choices in all scenarios of the session's table, bit i = risky lottery in scenario i + 1
+    # (see shared/scenarios.py)
+    risk_bits = models.IntegerField(min=0)
 
     # Vars for payoff
     scenario_random = models.IntegerField()
@@ -114,207 +82,178 @@ class Player(BasePlayer):
     lottery_random_str = models.StringField()
 
 
+# One bit per scenario of the session's table
+def risk_bits_max(player: Player):
+    return max_bits(player.session)
+
+
 ###############################################################################################################
 ##########################################     PAGES      #####################################################
 ###############################################################################################################
 
 #########################################
-##  Introduction for ALL participants  ##
+##  Group formation for ALL: by seats  ##
+##   or by arrival time after quiz     ##
 #########################################
 
-class Introduction(Page):
+class Group_Formation(GroupFormationPage):
+    # Must be the first page of the app (group_by_arrival_time); see shared/grouping.py
     pass
 
 
+def group_by_arrival_time_method(subsession, waiting_players):
+    session = subsession.session
+    # E / NE of groups formed by arrival are drawn from the session's seed (see shared/rng.py)
+    return form_group(waiting_players, session.config["p1_group_by_arrival_time"], session_seed(session))
+
+
 #########################################
-##    Instructions JW participants     ##
+##    Wait Page -- ALL participants    ##
 #########################################
 
-class Instructions_JW(Page):
-    @staticmethod
-    def is_displayed(participant):
-        return participant.role == "Just World"
+# Released in batches, optionally staggered (see shared/release.py)
+class Waiting_for_Others(ReleaseWaitPage):
+    pass
 
 
 #########################################
-##    Instructions UW participants     ##
+##  Decision Page -- ALL participants  ##
 #########################################
 
-class Instructions_UW(Page):
+# The radios of the scenarios are combined into risk_bits on the server (see shared/scenarios.py)
+class Choices(ChoicesPage):
     @staticmethod
-    def is_displayed(participant):
-        return participant.role != "Just World"
+    def before_next_page(player: Player, timeout_happened):
+        # Live counters of the admin report (see shared/live.py)
+        count_choice(player, PART_ONE)
+
 
 
 #########################################
-##  Comprehension quiz JW participants ##
+##  define vars and payoffs part_one   ##
+##        for ALL participants         ##
 #########################################
 
-class Comprehension_Quiz_JW(Page):
+class ResultsWaitPage(ReleaseWaitPage):
     form_model = "player"
-    form_fields = ["quiz_1_all", "quiz_2_all"]
+    form_fields = ["scenario_random", "risk_random", "lottery_random",
+                   "risk_random_str", "safe_random_str", "lottery_random_str"]
 
+    # Define payoffs part_one, for every group as soon as it is complete:
     @staticmethod
-    def is_displayed(participant):
-        return participant.role == "Just World"
+    @timed(__name__ + ".ResultsWaitPage.after_all_players_arrive")
+    def after_all_players_arrive(group: Group):
+        session = group.session
+        safe_options = scenario_table(session)
+
+        # Select a random scenario for payment and define payoffs according to role:
+        # JW and E participants have no restriction --> option chosen, option realized
+        # NE participants ALWAYS lottery --> same payoff irrespective of choice
+        # The group draws from its own seeded stream (see shared/rng.py) with the batched engine
+        # (see shared/payoffs.py). The writes are stored with bulk UPDATEs (see shared/bulk.py)
+        with batched_writes() as batch:
+            (players,), _ = resolve_groups([group], C, safe_options, group_streams(session, PART_ONE, [group]), batch)
+
+            # Last, store data at the participant level: one record per part (see shared/summary.py)
+            entries = []
+            for p in players:
+                record = summarize(p, safe_options, role=p.role, group_id=group.id)
+                batch.set_vars(p.participant, c_role=p.role, p1=record)
+                entries.append((p, group, record))
+
+        # Draws and payoffs in the audit journal (see shared/journal.py)
+        log_results(session, 1, entries)
+        # Exact live counters of part 1 for the admin report once all groups are resolved (see shared/live.py)
+        if last_group_resolved(session, PART_ONE, players):
+            settle(session, PART_ONE)
 
-    @staticmethod
-    def error_message(player: Player, values):
-        solutions = dict(quiz_1_all=4, quiz_2_all=1)
 
-        if values != solutions:
-            return "One or more answers were incorrect. Please correct your answers."
 
 #########################################
-##  Comprehension quiz UW participants ##
+##   UW learn assigned role: E / NE?   ##
 #########################################
 
-class Comprehension_Quiz_UW(Page):
-    form_model = "player"
-    form_fields = ["quiz_1_all", "quiz_2_all", "quiz_UW"]
+class Group_Assignment(CachedPage):
+    # Rendered once per session and role (see shared/render_cache.py)
+    cache_fields = ["participant.c_role"]
 
     @staticmethod
     def is_displayed(participant):
         return participant.role != "Just World"
 
-    @staticmethod
-    def error_message(player: Player, values):
-        solutions = dict(quiz_1_all=4, quiz_2_all=1, quiz_UW=False)
-
-        if values != solutions:
-            return "One or more answers were incorrect. Please correct your answers."
-
 
 #########################################
-##    Wait Page -- ALL participants    ##
+##   End Part I for ALL participants   ##
 #########################################
 
-class Waiting_for_Others(WaitPage):
-    pass
+class End_Part_I(CachedPage):
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
 
 
 #########################################
-##  Decision Page -- ALL participants  ##
+##  Hand over to part_two: only with   ##
+##  arrival groups or snapshots        ##
 #########################################
 
-class Choices(Page):
-    form_model = "player"
-    form_fields = ["risk_1", "risk_2", "risk_3", "risk_4"]
-
+class HandoverWaitPage(ReleaseWaitPage):
+    # Per group: a group formed by arrival moves on to part_two as soon as it is through part_one
 
+    @staticmethod
+    def is_displayed(player: Player):
+        return player.session.config["p1_group_by_arrival_time"]
 
-#########################################
-##  define vars and payoffs part_one   ##
-##        for ALL participants         ##
-#########################################
-
-class ResultsWaitPage(WaitPage):
-    form_model = "player"
-    form_fields = ["scenario_random", "risk_random", "lottery_random",
-                   "risk_random_str", "safe_random_str", "lottery_random_str"]
-
-    # Define payoffs part_one:
     @staticmethod
+    @timed(__name__ + ".HandoverWaitPage.after_all_players_arrive")
     def after_all_players_arrive(group: Group):
+        # Groups formed by arrival differ from the seats part_two was grouped by at session
+        # creation: give part_two the same group (and roles)
+        from part_two import group_like_part_one
+        group_like_part_one(group.session, group.get_players())
 
-        # First, access players by groups
-        p1_player_lists = group.get_players()
-
-        # Second, select a random scenario for payment:
-        for p in p1_player_lists:
-            # First, generate random number
-            p.scenario_random = random.randint(1, 4)
-            # Second, create a list of the choices
-            list_choices = [p.risk_1, p.risk_2, p.risk_3, p.risk_4]
-            # Last, access the data from the selected scenario -> index: player.scenario_random-1
-            p.risk_random = list_choices[p.scenario_random - 1]
-
-            # Define risk_random as string --> for convenience while writing results template
-            if p.risk_random:
-                p.risk_random_str = "Risky Lottery"
-                p.safe_random_str = " "
-            else:
-                p.risk_random_str = "Safe Option"
-                p.safe_random_str = str(C.SAFE_OPTIONS[p.scenario_random - 1])
-
-            if p.role == C.NE_ROLE:
-                p.safe_random_str = " "
-
-
-        # Third, assign a name to each type of player according to index within group
-        p1_JW = p1_player_lists[0]
-        p1_E = p1_player_lists[1]
-        p1_NE = p1_player_lists[2]
-
-
-        # Fourth, define payoffs according to role:
-        # JW participants have no restriction --> option chosen, option realized
-        if p1_JW.risk_random:
-            p1_JW.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-            p1_JW.payoff = C.ENDOWMENT - p1_JW.lottery_random
-        else:
-            p1_JW.payoff = C.ENDOWMENT - C.SAFE_OPTIONS[p1_JW.scenario_random - 1]
-
-        # E participants have no restriction --> option chosen, option realized
-        if p1_E.risk_random:
-            p1_E.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-            p1_E.payoff = C.ENDOWMENT - p1_E.lottery_random
-        else:
-            p1_E.payoff = C.ENDOWMENT - C.SAFE_OPTIONS[p1_E.scenario_random - 1]
-
-        # NE participants ALWAYS lottery --> same payoff irrespective of choice
-        p1_NE.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-        p1_NE.payoff = C.ENDOWMENT - p1_NE.lottery_random
-
-        # Last, store data at the participant level
-        for p in group.get_players():
-            participant = p.participant
 
-            participant.p1_payoff = p.payoff
-            participant.p1_group_id = group.id
-            participant.c_role = p.role
-            participant.p1_risk_1 = p.risk_1
-            participant.p1_risk_2 = p.risk_2
-            participant.p1_risk_3 = p.risk_3
-            participant.p1_risk_4 = p.risk_4
-            participant.p1_scenario_random = p.scenario_random
-            participant.p1_risk_random = p.risk_random
-            participant.p1_risk_random_str = p.risk_random_str
-            participant.p1_safe_random_str = p.safe_random_str
-            participant.p1_lottery_random = p.field_maybe_none("lottery_random")
+class SnapshotWaitPage(ReleaseWaitPage):
+    # The only wait for all groups of part_one, and only where the snapshot needs the whole session
+    wait_for_all_groups = True
 
-            # Define lottery_random as string --> for convenience while writing results template
-            p.lottery_random_str = str(p.field_maybe_none("lottery_random"))
-
-            if p.lottery_random_str == "None":
-                p.lottery_random_str = " "
-
-            participant.p1_lottery_random_str = p.lottery_random_str
+    @staticmethod
+    def is_displayed(player: Player):
+        return bool(player.session.config.get("snapshot_dir"))
 
+    @staticmethod
+    @timed(__name__ + ".SnapshotWaitPage.after_all_players_arrive")
+    def after_all_players_arrive(subsession: Subsession):
+        # The session as part_two starts, for restoring it there (see shared/snapshot.py)
+        save_snapshot(subsession.session, __name__)
 
 
 #########################################
-##   UW learn assigned role: E / NE?   ##
+##   Wide export for ALL participants  ##
 #########################################
 
-class Group_Assignment(Page):
-    @staticmethod
-    def is_displayed(participant):
-        return participant.role != "Just World"
+def custom_export(players):
+    # Generator, see shared/export.py
+    yield from wide_rows(players)
 
 
 #########################################
-##   End Part I for ALL participants   ##
+##   Server timings (admin report)     ##
 #########################################
 
-class End_Part_I(Page):
-    pass
+def vars_for_admin_report(subsession):
+    # Pages and callbacks of this app (shared/timing.py), the wait page releases (shared/release.py),
+    # the wait for group formation and the live choice counters (shared/live.py)
+    return dict(
+        **report(subsession.session.code, prefix=__name__ + "."),
+        **release_report(subsession.session.code, prefix=__name__ + "."),
+        **wait_report(subsession.session.get_participants(), subsession.session.config["p1_group_by_arrival_time"]),
+        **live_report(subsession.session),
+    )
+
 
-page_sequence = [Introduction,
-                 Instructions_JW, Instructions_UW,
-                 Comprehension_Quiz_JW, Comprehension_Quiz_UW,
-                 Waiting_for_Others, Choices, ResultsWaitPage,
+page_sequence = [Group_Formation, Choices, ResultsWaitPage,
                  Group_Assignment, Waiting_for_Others,
-                 End_Part_I]
+                 End_Part_I, HandoverWaitPage, SnapshotWaitPage]
 
 
@@ -0,0 +1,91 @@
+from otree.api import Currency as c, currency_range, expect, Bot, Submission, SubmissionMustFail
+from . import *
+from shared.grouping import uw_order
+from shared.payoffs import choice_matrix
+from shared.replay import replay
+from shared.rng import PART_ONE, session_seed
+from shared.scenarios import choice_post, encode, max_bits, scenario_table
+from shared.summary import Summary
+
+
+# Choices per case: all safe, all risky, or a mix that differs between the roles of a group
+def bot_choices(case, id_in_group, num_scenarios):
+    if case == "safe":
+        return [False] * num_scenarios
+    if case == "risky":
+        return [True] * num_scenarios
+    return [(i + id_in_group) % 2 == 0 for i in range(num_scenarios)]
+
+
+class PlayerBot(Bot):
+    cases = ["safe", "risky", "mixed"]
+
+    # Note: do not keep self.player / self.participant in a variable across a yield.
+    # The kept object is the one loaded before the wait page and shows stale data.
+    def play_round(self):
+        # Group_Formation (a wait page) comes first
+        self.check_group()
+
+        choices = bot_choices(self.case, self.player.id_in_group, len(scenario_table(self.session)))
+        if self.case == "mixed":
+            # The last scenario unanswered: an error on risk_bits, built from the radios on the server
+            yield SubmissionMustFail(Choices, choice_post(choices[:-1]), error_fields=["risk_bits"])
+            # The page is shown again with the answers given so far
+            expect(self.html.count(" checked "), len(choices) - 1)
+            expect("missing: scenario {}".format(len(choices)), "in", self.html)
+        yield Choices, choice_post(choices)
+
+        self.check_payoffs(choices)
+        if self.player.role != C.JW_ROLE:
+            yield Group_Assignment
+        yield End_Part_I
+
+    def check_group(self):
+        # Every group has one participant of each role; the JW seat of part_one_intro gets JW
+        roles = [p.role for p in self.group.get_players()]
+        expect(roles, [C.JW_ROLE, C.E_ROLE, C.NE_ROLE])
+        expect(self.player.role == C.JW_ROLE, self.participant.p1_slot[1] == 1)
+        if not self.session.config["p1_group_by_arrival_time"]:
+            expect(self.participant.p1_slot[1], self.player.id_in_group)
+            return
+        # By arrival: E / NE are the group's UW participants in arrival order, drawn from the seed
+        jw, e, ne = self.group.get_players()
+        uw = sorted([e, ne], key=lambda p: (p.participant._vars["p1_arrival"], p.id_in_subsession))
+        expect([uw[i].id_in_subsession for i in uw_order(session_seed(self.session), jw.id_in_subsession)],
+               [e.id_in_subsession, ne.id_in_subsession])
+
+    def check_payoffs(self, choices):
+        # Payoffs are resolved for the group on ResultsWaitPage
+        player = self.player
+        participant = self.participant
+
+        expect(participant.c_role, player.role)
+        safe_options = scenario_table(self.session)
+        expect(player.risk_bits, encode(choices))
+        if self.case == "risky":
+            # Every bit set, still a positive signed 32-bit integer (IntegerField on PostgreSQL)
+            expect(player.risk_bits, max_bits(self.session))
+            expect(player.risk_bits, "<", 2 ** 31)
+        expect(player.risk_random, choices[player.scenario_random - 1])
+        if player.role == C.NE_ROLE or player.risk_random:
+            expect(player.lottery_random, "in", [C.RISK_LOW, C.RISK_HIGH])
+            expect(player.payoff, C.ENDOWMENT - player.lottery_random)
+        else:
+            expect(player.payoff, C.ENDOWMENT - safe_options[player.scenario_random - 1])
+
+        # Same draws as a replay from the session seed (shared/replay.py)
+        group = player.group
+        replayed = replay([session_seed(self.session)], PART_ONE, [group.id_in_subsession],
+                          choice_matrix([group.get_players()], len(safe_options)), C, safe_options)
+        expect(player.scenario_random, int(replayed.scenario_random[0, player.id_in_group - 1]))
+        expect(int(player.payoff), int(replayed.payoff[0, player.id_in_group - 1]))
+
+        # The stored record of the part (shared/summary.py)
+        p1 = Summary(participant.p1)
+        expect(p1.risk_bits, player.risk_bits)
+        expect(p1.payoff, player.payoff)
+        expect(p1.scenario_random, player.scenario_random)
+        expect(p1.risk_random_str, player.risk_random_str)
+        expect(p1.safe_random_str, player.safe_random_str)
+        expect(p1.lottery_random_str, player.lottery_random_str)
+        expect(p1.group_id, player.group.id)
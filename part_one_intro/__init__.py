@@ -0,0 +1,244 @@
+from otree.api import *
+
+#further packages
+import shared
+from shared.rng import session_seed
+from shared.render_cache import CachedPage
+from shared.scenarios import scenario_table
+from shared.timing import TimedPage, report, timed
+
+
+# The /pools, /jobs and /live admin pages, shard codes and the wait page release
+# (see shared/__init__.py for what each of them replaces in oTree)
+shared.install()
+
+
+doc = """
+Introduction, instructions and comprehension quiz of the first part. Participants are seated in
+fixed groups of three here: the first seat of every group gets the JW instructions, the other two
+the UW instructions. The actual groups (and the E / NE roles) are formed on the first page of
+part_one, either by these seats or by arrival time (see shared/grouping.py).
+"""
+
+
+class C(BaseConstants):
+    NAME_IN_URL = 'part_one_intro'
+    PLAYERS_PER_GROUP = 3
+    NUM_ROUNDS = 1
+
+    # Parameters (shown in the instructions)
+    ENDOWMENT = cu(800)
+
+    # Clusters, same as part_one
+    JW_ROLE = "Just World"
+    E_ROLE = "Elite"
+    NE_ROLE = "Non Elite"
+
+    # Templates
+    INTRODUCTION_TEMPLATE = "part_one_intro/temp_introduction.html"
+
+    COMPREHENSION_Q_JW_TEMPLATE = "part_one_intro/temp_comprehension_q_JW.html"
+    COMPREHENSION_Q_UW_TEMPLATE = "part_one_intro/temp_comprehension_q_UW.html"
+
+    INSTRUCTIONS_JW_TEMPLATE = "part_one_intro/temp_instructions_JW.html"
+    INSTRUCTIONS_UW_TEMPLATE = "part_one_intro/temp_instructions_UW.html"
+
+    # Comprehension quiz, checked on the server only (the browser never sees the solutions).
+    # quiz_1_all, the number of scenarios, is added from the session's table (quiz_solutions)
+    QUIZ_SOLUTIONS_JW = dict(quiz_2_all=1)
+    QUIZ_SOLUTIONS_UW = dict(quiz_2_all=1, quiz_UW=False)
+    QUIZ_ERROR = "One or more answers were incorrect. Please correct your answers."
+    # quiz_UW asks about this scenario, or the last one of a shorter table (quiz_UW_label)
+    QUIZ_SCENARIO = 3
+    QUIZ_UW_LABEL = ("3. Assume you are assigned to the Non Elite group and you choose "
+                     "the safe alternative in Scenario {0}. Further, assume that Scenario "
+                     "{0} is selected by the computer for your payment. Will you get the "
+                     "value of the safe option?")
+
+
+
+###############################################################################################################
+#########################################   CLASSES      ######################################################
+###############################################################################################################
+
+
+class Subsession(BaseSubsession):
+    pass
+
+
+# Remember every participant's seat: part_one forms its groups from it.
+# The session's seed for the payoff draws of both parts is fixed here as well (shared/rng.py),
+# and a malformed scenario table fails here rather than on the first choice page.
+@staticmethod
+@timed(__name__ + ".creating_session")
+def creating_session(subsession):
+    session_seed(subsession.session)
+    scenario_table(subsession.session)
+    for p in subsession.get_players():
+        p.participant.p1_slot = (p.group.id_in_subsession, p.id_in_group)
+
+
+class Group(BaseGroup):
+    pass
+
+
+class Player(BasePlayer):
+    # Include comprehension questions. Note, additional question for UW.
+    quiz_1_all = models.IntegerField(label="1. How many scenarios will be presented?")
+    quiz_2_all = models.IntegerField(label="2. How many decisions will be implemented for the payment?")
+    # The page shows the label for the session's table (quiz_UW_label)
+    quiz_UW = models.BooleanField(label=C.QUIZ_UW_LABEL.format(C.QUIZ_SCENARIO),
+                                  choices=[[True, "Yes"], [False, "No"]])
+
+    # Answer sets checked until all answers were correct (live checks and form submissions)
+    quiz_attempts = models.IntegerField(initial=0)
+    # The last live check was correct, so the final submission is not another attempt
+    quiz_passed = models.BooleanField(initial=False)
+
+
+###############################################################################################################
+#########################################   QUIZ CHECK   ######################################################
+###############################################################################################################
+
+# The quiz pages check the answers through their live_method: the browser sends the answers
+# over the page's websocket, gets back the wrong fields and submits the form only once all
+# answers are correct. error_message still validates that final submission, and is the whole
+# check when the websocket is not open or does not answer in time (quiz_check.html).
+
+def _parse(value, solution):
+    # Live data comes as the form values (strings)
+    if isinstance(solution, bool):
+        return {"True": True, "False": False}.get(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def quiz_solutions(player: Player, solutions):
+    return dict(solutions, quiz_1_all=len(scenario_table(player.session)))
+
+
+def quiz_UW_label(session):
+    return C.QUIZ_UW_LABEL.format(min(C.QUIZ_SCENARIO, len(scenario_table(session))))
+
+
+def check_quiz(player: Player, data, solutions):
+    solutions = quiz_solutions(player, solutions)
+    values = {name: _parse(data.get(name), solution) for name, solution in solutions.items()}
+    wrong = [name for name, solution in solutions.items() if values[name] != solution]
+
+    player.quiz_attempts += 1
+    player.quiz_passed = not wrong
+    return {player.id_in_group: dict(wrong=wrong, message=C.QUIZ_ERROR if wrong else "")}
+
+
+def quiz_error_message(player: Player, values, solutions):
+    solutions = quiz_solutions(player, solutions)
+    if values != solutions:
+        player.quiz_attempts += 1
+        player.quiz_passed = False
+        return C.QUIZ_ERROR
+    if not player.quiz_passed:
+        # Submitted without a live check (quiz_live=False, no open websocket or no live reply in time)
+        player.quiz_attempts += 1
+
+
+###############################################################################################################
+##########################################     PAGES      #####################################################
+###############################################################################################################
+
+#########################################
+##  Introduction for ALL participants  ##
+#########################################
+
+class Introduction(CachedPage):
+    # Same HTML for everyone, rendered once per session (see shared/render_cache.py)
+    pass
+
+
+#########################################
+##    Instructions JW participants     ##
+#########################################
+
+class Instructions_JW(CachedPage):
+    @staticmethod
+    def is_displayed(participant):
+        return participant.role == "Just World"
+
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
+
+
+#########################################
+##    Instructions UW participants     ##
+#########################################
+
+class Instructions_UW(CachedPage):
+    @staticmethod
+    def is_displayed(participant):
+        return participant.role != "Just World"
+
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
+
+
+#########################################
+##  Comprehension quiz JW participants ##
+#########################################
+
+class Comprehension_Quiz_JW(TimedPage):
+    form_model = "player"
+    form_fields = ["quiz_1_all", "quiz_2_all"]
+
+    @staticmethod
+    def is_displayed(participant):
+        return participant.role == "Just World"
+
+    @staticmethod
+    def live_method(player: Player, data):
+        return check_quiz(player, data, C.QUIZ_SOLUTIONS_JW)
+
+    @staticmethod
+    def error_message(player: Player, values):
+        return quiz_error_message(player, values, C.QUIZ_SOLUTIONS_JW)
+
+#########################################
+##  Comprehension quiz UW participants ##
+#########################################
+
+class Comprehension_Quiz_UW(TimedPage):
+    form_model = "player"
+    form_fields = ["quiz_1_all", "quiz_2_all", "quiz_UW"]
+
+    @staticmethod
+    def is_displayed(participant):
+        return participant.role != "Just World"
+
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(quiz_UW_label=quiz_UW_label(player.session))
+
+    @staticmethod
+    def live_method(player: Player, data):
+        return check_quiz(player, data, C.QUIZ_SOLUTIONS_UW)
+
+    @staticmethod
+    def error_message(player: Player, values):
+        return quiz_error_message(player, values, C.QUIZ_SOLUTIONS_UW)
+
+
+#########################################
+##   Server timings (admin report)     ##
+#########################################
+
+def vars_for_admin_report(subsession):
+    # Pages of this app, see shared/timing.py
+    return report(subsession.session.code, prefix=__name__ + ".")
+
+
+page_sequence = [Introduction,
+                 Instructions_JW, Instructions_UW,
+                 Comprehension_Quiz_JW, Comprehension_Quiz_UW]
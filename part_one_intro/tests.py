@@ -0,0 +1,68 @@
+from otree.api import Currency as c, currency_range, expect, Bot, Submission, SubmissionMustFail
+from . import *
+
+
+WRONG_JW = dict(quiz_1_all=3, quiz_2_all=1)
+WRONG_UW = dict(quiz_1_all=4, quiz_2_all=1, quiz_UW=True)
+
+
+def solutions(player, page_class):
+    # quiz_1_all is the number of scenarios of the session's table
+    return quiz_solutions(player, C.QUIZ_SOLUTIONS_JW if page_class == Comprehension_Quiz_JW else C.QUIZ_SOLUTIONS_UW)
+
+
+class PlayerBot(Bot):
+    # live: the quiz is checked through live_method before the one submission (quiz_check.html),
+    # form: answers are submitted until error_message accepts them
+    cases = ["live", "form"]
+
+    def play_round(self):
+        yield Introduction
+
+        # JW and UW participants see different instructions and comprehension quizzes
+        if self.player.role == C.JW_ROLE:
+            yield Instructions_JW
+            if self.case == "form":
+                yield SubmissionMustFail(Comprehension_Quiz_JW, WRONG_JW)
+            yield Comprehension_Quiz_JW, solutions(self.player, Comprehension_Quiz_JW)
+        else:
+            yield Instructions_UW
+            if self.case == "form":
+                yield SubmissionMustFail(Comprehension_Quiz_UW, WRONG_UW)
+                # quiz_UW asks about a scenario of the session's table
+                expect(quiz_UW_label(self.session), "in", self.html)
+            yield Comprehension_Quiz_UW, solutions(self.player, Comprehension_Quiz_UW)
+
+        # One wrong and one correct answer set either way
+        expect(self.player.quiz_attempts, 2)
+
+        # part_one forms its groups from these seats (see shared/grouping.py)
+        expect(self.participant.p1_slot, (self.group.id_in_subsession, self.player.id_in_group))
+
+
+def _send(method, id_in_group, answers):
+    # The browser sends the form values as strings
+    data = {name: str(value) for name, value in answers.items()}
+    for retval in _run(method(id_in_group, data)):
+        return retval[id_in_group]
+
+
+def _run(results):
+    # live_method results come back as an async generator
+    import asyncio
+
+    async def collect():
+        return [retval async for retval in results]
+
+    return asyncio.run(collect())
+
+
+def call_live_method(method, case, page_class, group, **kwargs):
+    if case != "live":
+        return
+    wrong = WRONG_JW if page_class == Comprehension_Quiz_JW else WRONG_UW
+
+    for player in group.get_players():
+        if page_class.is_displayed(player):
+            expect(_send(method, player.id_in_group, wrong)["wrong"], "!=", [])
+            expect(_send(method, player.id_in_group, solutions(player, page_class))["wrong"], [])
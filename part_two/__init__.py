@@ -1,7 +1,18 @@
 from otree.api import *
 
-import random
-import itertools
+from shared.assignment import assign_treatments, build_schedule
+from shared.bulk import batched_writes
+from shared.export import wide_rows
+from shared.live import count_choice, report as live_report, settle
+from shared.payoffs import last_group_resolved, resolve_groups
+from shared.render_cache import CachedPage
+from shared.release import ReleaseWaitPage, release_report
+from shared.rng import PART_TWO, group_streams, session_seed
+from shared.scenarios import ChoicesPage, max_bits, scenario_table
+from shared.journal import log_assignments, log_results
+from shared.snapshot import restore as restore_snapshot
+from shared.summary import Summary, summarize
+from shared.timing import TimedPage, report, timed
 
 doc = """
 Participants keep their roles from the first part. Now they will submit their preferences after 
@@ -27,11 +38,13 @@ class C(BaseConstants):
     RISK_LOW = cu(800)
     RISK_HIGH = cu(0)
 
-    SAFE_OPTIONS = [cu(775), cu(600), cu(500), cu(400)]
+    # The safe option of every scenario comes from the session config (shared/scenarios.py)
 
     TREATMENTS = ["T0", "T1", "T2"]
     CHARACTERS = ["Samantha", "Daniel"]
     CHARACTERS_SEX = ["she", "he"]
+    # Only this treatment presents the fictional character
+    CHARACTER_TREATMENT = "T1"
 
 
     # Templates
@@ -39,7 +52,7 @@ class C(BaseConstants):
     INSTRUCTIONS_T1_TEMPLATE = "part_two/temp_instructions_T1.html"
     INSTRUCTIONS_T2_TEMPLATE = "part_two/temp_instructions_T2.html"
 
-    CHOICES_TEMPLATE = "part_two/temp_choices.html"
+    CHOICES_TEMPLATE = "global/scenario_choices.html"
     FINAL_RESULTS_TEMPLATE = "part_two/temp_final_results.html"
 
 
@@ -60,51 +73,63 @@ class Subsession(BaseSubsession):
 
 # Randomly allocate the 3 treatments at the group level:
 @staticmethod
+@timed(__name__ + ".creating_session")
 def creating_session(subsession):
 
-    # First, Since we want balanced groups use itertools
-    treatments = itertools.cycle(C.TREATMENTS)
-
-    for group in subsession.get_groups():
-        group.t_groups = next(treatments)
-        
-
-        # Second, store group level data into player data.
-        # Important for later showing the correct pages and for storing data into participant level
-        for p in group.get_players():
-            p.treatment_0 = group.t_groups == "T0"
-            p.treatment_1 = group.t_groups == "T1"
-            p.treatment_2 = group.t_groups == "T2"
-
-        # Last, since we want to test whether the sex of the fictional character plays a role,
-        # split T1 participants into "Samantha" group and "Daniel" group
-        # To this end:
-            # Since we want balanced data, use itertools at the group level
-
-        is_fem_character = itertools.cycle(C.CHARACTERS)
-
-        for group in subsession.get_groups():
-            group.character_random = next(is_fem_character)
-
-            # Yet, we want to store the data in the player level, BUT ONLY for T1 participants
-            # T0 and T2 participants do not need this random assignment, thus set to "None".
-            for p in group.get_players():
-                if group.id_in_subsession == "T1":
-                    p.character_random = group.character_random
-
-                    # Necessary for template
-                    if p.character_random == C.CHARACTERS[0]:
-                        p.character_sex = C.CHARACTERS_SEX[0]
-                    else:
-                        p.character_sex = C.CHARACTERS_SEX[1]
-
-                else:
-                    p.character_random = None
-
-            # Store data at the participant level. Important for showing correct pages and templates
-                participant = p.participant
-                participant.p2_character_random = p.field_maybe_none("character_random")
-                participant.p2_character_sex = p.field_maybe_none("character_sex")
+    # A session restored from a part_one snapshot (see shared/snapshot.py) gets the groups,
+    # treatments and part_one results of the original session
+    if subsession.session.config.get("snapshot"):
+        restore_snapshot(subsession, subsession.session.config["snapshot"])
+    else:
+        # First, build the treatment schedule for all groups. Since we want balanced groups,
+        # treatments rotate over the groups (or are randomized in balanced blocks, see
+        # shared/assignment.py). To test whether the sex of the fictional character plays a role,
+        # T1 groups are split into a "Samantha" group and a "Daniel" group in the same way.
+        groups = subsession.get_groups()
+        schedule = build_schedule(len(groups), subsession.session.config, C, session_seed(subsession.session))
+
+        # Second, store group level data into player and participant data.
+        # Important for later showing the correct pages and templates
+        assign_treatments(groups, subsession.get_players(), C, schedule)
+
+    # Treatments and characters in the audit journal (see shared/journal.py). Groups formed by
+    # arrival are logged as they are handed over, in their final composition
+    config = subsession.session.config
+    if config.get("snapshot") or not config["p1_group_by_arrival_time"]:
+        log_assignments(subsession.session, subsession.get_groups(), subsession.get_players())
+
+
+# With groups formed by arrival time in part_one (see shared/grouping.py), part_one's
+# HandoverWaitPage hands over each group as it finishes: same triple, same JW / E / NE order.
+# Every part_one group has one JW participant, who sits at position 1 of their seat group here:
+# E and NE move into that group and keep its treatment from the schedule, the two players there
+# take their places. Groups handed over before are never touched (their members are elsewhere).
+def group_like_part_one(session, part_one_players):
+    participants = [p.participant for p in part_one_players]
+    players = {p.participant: p for p in Player.objects_filter(Player.participant_id.in_([pp.id for pp in participants]))}
+    handed_over = [players[participant] for participant in participants]
+    group = handed_over[0].group
+    seats = {p.id_in_group: p for p in group.get_players()}
+
+    changed = []
+    for id_in_group, p in enumerate(handed_over, start=1):
+        other = seats[id_in_group]
+        if other is p:
+            continue
+        old_group, old_id_in_group = p.group, p.id_in_group
+        p.group, p.id_in_group = group, id_in_group
+        other.group, other.id_in_group = old_group, old_id_in_group
+        seats[id_in_group] = p
+        if old_group is group:
+            seats[old_id_in_group] = other
+        changed += [p, other]
+
+    # Treatment fields of the players that changed groups, from the treatments of their new groups
+    groups = list({p.group.id: p.group for p in changed}.values())
+    with batched_writes() as batch:
+        assign_treatments(groups, changed, C, [(g.t_groups, g.field_maybe_none("character_random")) for g in groups],
+                          batch)
+    log_assignments(session, [group], handed_over)
 
 
 # Contrary to the first part, in this app we need data at the group level
@@ -115,34 +140,9 @@ class Group(BaseGroup):
 
 # Same scenarios as in part_one plus additional models
 class Player(BasePlayer):
-    risk_1 = models.BooleanField(
-        label="Scenario 1:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -775 tokens with 100% probability"]
-        ]
-    )
-    risk_2 = models.BooleanField(
-        label="Scenario 2:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -600 tokens with 100% probability"]
-        ]
-    )
-    risk_3 = models.BooleanField(
-        label="Scenario 3:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -500 tokens with 100% probability"]
-        ]
-    )
-    risk_4 = models.BooleanField(
-        label="Scenario 4:",
-        choices=[
-            [True, "A: -800 tokens with 50% probability, or -0 tokens with 50% probability"],
-            [False, "B: -400 tokens with 100% probability"]
-        ]
-    )
+    # Choices in all scenarios of the session's table, bit i = risky lottery in scenario i + 1
+    # (see shared/scenarios.py)
+    risk_bits = models.IntegerField(min=0)
 
     treatment_0 = models.BooleanField(initial=False)
     treatment_1 = models.BooleanField(initial=False)
@@ -161,6 +161,11 @@ class Player(BasePlayer):
     lottery_random_str = models.StringField()
 
 
+# One bit per scenario of the session's table
+def risk_bits_max(player: Player):
+    return max_bits(player.session)
+
+
 ###############################################################################################################
 ##########################################     PAGES      #####################################################
 ###############################################################################################################
@@ -170,39 +175,62 @@ class Player(BasePlayer):
 ##    Instructions T0 participants     ##
 #########################################
 
-class Instructions_T0(Page):
+class Instructions_T0(CachedPage):
+    # Rendered once per session and variant (see shared/render_cache.py)
+    cache_fields = ["group.t_groups"]
+
     @staticmethod
     def is_displayed(player):
         return player.treatment_0
 
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
+
 
 #########################################
 ##    Instructions T1 participants     ##
 #########################################
 
-class Instructions_T1(Page):
+class Instructions_T1(CachedPage):
+    cache_fields = ["group.t_groups", "participant.c_role", "participant.p2_character_random",
+                    "participant.p2_character_sex"]
+
     @staticmethod
     def is_displayed(player):
         return player.treatment_1
 
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
+
 
 #########################################
 ##    Instructions T2 participants     ##
 #########################################
 
-class Instructions_T2(Page):
+class Instructions_T2(CachedPage):
+    cache_fields = ["group.t_groups", "participant.c_role"]
+
     @staticmethod
     def is_displayed(player):
         return player.treatment_2
 
+    @staticmethod
+    def vars_for_template(player: Player):
+        return dict(num_scenarios=len(scenario_table(player.session)))
+
 
 #########################################
 ##  Decision Page -- ALL participants  ##
 #########################################
 
-class Choices(Page):
-    form_model = "player"
-    form_fields = ["risk_1", "risk_2", "risk_3", "risk_4"]
+# The radios of the scenarios are combined into risk_bits on the server (see shared/scenarios.py)
+class Choices(ChoicesPage):
+    @staticmethod
+    def before_next_page(player: Player, timeout_happened):
+        # Live counters of the admin report (see shared/live.py)
+        count_choice(player, PART_TWO)
 
 
 #########################################
@@ -210,84 +238,70 @@ class Choices(Page):
 ##        for ALL participants         ##
 #########################################
 
-class ResultsWaitPage(WaitPage):
+class ResultsWaitPage(ReleaseWaitPage):
     form_model = "player"
     form_fields = ["scenario_random", "risk_random", "lottery_random",
                    "risk_random_str", "safe_random_str", "lottery_random_str"]
 
-    # Define payoffs part_two:
+    # Define payoffs part_two, analogous to Part I:
     @staticmethod
+    @timed(__name__ + ".ResultsWaitPage.after_all_players_arrive")
     def after_all_players_arrive(group: Group):
+        session = group.session
+        safe_options = scenario_table(session)
+        # The group draws from its own seeded stream (see shared/rng.py), the writes are
+        # stored with bulk UPDATEs (see shared/bulk.py)
+        with batched_writes() as batch:
+            (players,), _ = resolve_groups([group], C, safe_options, group_streams(session, PART_TWO, [group]), batch)
+
+            # Store data at the participant level (see shared/summary.py)
+            entries = []
+            for p in players:
+                participant = p.participant
+                record = summarize(p, safe_options, role=participant.c_role, group_id=group.id,
+                                   treatment=group.t_groups, character=group.field_maybe_none("character_random"))
+                batch.set_vars(participant, p2=record)
+                entries.append((p, group, record))
 
-        # Analogous to Part I
-        p2_player_lists = group.get_players()
-
-        # Select a random scenario for payment:
-        for p in p2_player_lists:
-            p.scenario_random = random.randint(1, 4)
-            list_choices = [p.risk_1, p.risk_2, p.risk_3, p.risk_4]
-            p.risk_random = list_choices[p.scenario_random - 1]
-
-            if p.risk_random:
-                p.risk_random_str = "Risky Lottery"
-                p.safe_random_str = " "
-            else:
-                p.risk_random_str = "Safe Option"
-                p.safe_random_str = str(C.SAFE_OPTIONS[p.scenario_random - 1])
-
-            if p.participant.c_role == "Non Elite":
-                p.safe_random_str = " "
-
-        p2_JW = p2_player_lists[0]
-        p2_E = p2_player_lists[1]
-        p2_NE = p2_player_lists[2]
-
-        # JW participants have no restriction --> option chosen, option realized
-        if p2_JW.risk_random:
-            p2_JW.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-            p2_JW.payoff = C.ENDOWMENT - p2_JW.lottery_random
-        else:
-            p2_JW.payoff = C.ENDOWMENT - C.SAFE_OPTIONS[p2_JW.scenario_random - 1]
-
-        # E participants have no restriction --> option chosen, option realized
-        if p2_E.risk_random:
-            p2_E.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-            p2_E.payoff = C.ENDOWMENT - p2_E.lottery_random
-        else:
-            p2_E.payoff = C.ENDOWMENT - C.SAFE_OPTIONS[p2_E.scenario_random - 1]
-
-        # NE participants ALWAYS lottery --> same payoff irrespective of choice
-        p2_NE.lottery_random = random.choice([C.RISK_LOW, C.RISK_HIGH])
-        p2_NE.payoff = C.ENDOWMENT - p2_NE.lottery_random
+        # Draws and payoffs in the audit journal (see shared/journal.py)
+        log_results(session, 2, entries)
+        # Exact live counters of part 2 and of the switching for the admin report, once all
+        # groups are resolved (see shared/live.py)
+        if last_group_resolved(session, PART_TWO, players):
+            settle(session, PART_TWO)
 
 
-        # Store data at the participant level
-        for p in group.get_players():
-            participant = p.participant
 
-            participant.p2_payoff = p.payoff
-            participant.p2_risk_1 = p.risk_1
-            participant.p2_risk_2 = p.risk_2
-            participant.p2_risk_3 = p.risk_3
-            participant.p2_risk_4 = p.risk_4
-            participant.p2_scenario_random = p.scenario_random
-            participant.p2_risk_random = p.risk_random
-            participant.p2_risk_random_str = p.risk_random_str
-            participant.p2_safe_random_str = p.safe_random_str
-            participant.p2_lottery_random = p.field_maybe_none("lottery_random")
 
-            p.lottery_random_str = str(p.field_maybe_none("lottery_random"))
+class Final_Results(TimedPage):
+    @staticmethod
+    def vars_for_template(player: Player):
+        # The stored records of both parts, decoded for the results table (see shared/summary.py)
+        participant = player.participant
+        return dict(p1=Summary(participant.p1), p2=Summary(participant.p2))
 
-            if p.lottery_random_str == "None":
-                p.lottery_random_str = " "
 
-            participant.p2_lottery_random_str = p.lottery_random_str
+#########################################
+##   Wide export for ALL participants  ##
+#########################################
 
+def custom_export(players):
+    # Generator, see shared/export.py
+    yield from wide_rows(players)
 
 
+#########################################
+##   Server timings (admin report)     ##
+#########################################
 
-class Final_Results(Page):
-    pass
+def vars_for_admin_report(subsession):
+    # Pages and callbacks of this app (shared/timing.py), the wait page releases (shared/release.py)
+    # and the live choice counters (shared/live.py)
+    return dict(
+        **report(subsession.session.code, prefix=__name__ + "."),
+        **release_report(subsession.session.code, prefix=__name__ + "."),
+        **live_report(subsession.session),
+    )
 
 
 page_sequence = [Instructions_T0, Instructions_T1, Instructions_T2,
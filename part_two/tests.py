@@ -0,0 +1,138 @@
+from otree.api import Currency as c, currency_range, expect, Bot, Submission, SubmissionMustFail
+from . import *
+from sqlalchemy.orm import object_session
+from settings import JOURNAL_DIR
+from shared.assignment import build_schedule
+from shared.journal import ASSIGNMENT, HEADER, RESULT, scan
+from shared.payoffs import choice_matrix
+from shared.replay import replay
+from shared.rng import PART_TWO, session_seed
+from shared.scenarios import choice_post, encode, scenario_table
+from shared.summary import TREATMENTS, Summary, to_bytes
+
+
+# Same cases as part_one: all safe, all risky, or a mix that differs between the roles of a group
+def bot_choices(case, id_in_group, num_scenarios):
+    if case == "safe":
+        return [False] * num_scenarios
+    if case == "risky":
+        return [True] * num_scenarios
+    return [(i + id_in_group) % 2 == 1 for i in range(num_scenarios)]
+
+
+class PlayerBot(Bot):
+    cases = ["safe", "risky", "mixed"]
+
+    # Note: do not keep self.player / self.participant in a variable across a yield.
+    # The kept object is the one loaded before the wait page and shows stale data.
+    def play_round(self):
+        self.check_treatment()
+
+        if self.player.treatment_0:
+            yield Instructions_T0
+        if self.player.treatment_1:
+            yield Instructions_T1
+        if self.player.treatment_2:
+            yield Instructions_T2
+
+        choices = bot_choices(self.case, self.player.id_in_group, len(scenario_table(self.session)))
+        if self.case == "mixed":
+            # The last scenario unanswered: an error on risk_bits, built from the radios on the server
+            yield SubmissionMustFail(Choices, choice_post(choices[:-1]), error_fields=["risk_bits"])
+        yield Choices, choice_post(choices)
+
+        self.check_payoffs(choices)
+        self.check_live_counts()
+        self.check_journal()
+        yield Final_Results
+
+    def check_treatment(self):
+        player = self.player
+
+        # The part_one group in its JW / E / NE order, also when groups were formed by arrival
+        members = player.group.get_players()
+        expect(len({Summary(p.participant.p1).group_id for p in members}), 1)
+        expect([p.participant.c_role for p in members], ["Just World", "Elite", "Non Elite"])
+
+        # The treatment creating_session scheduled for the group's seat, from the session's seed
+        # like in shared/simulate.py
+        group = player.group
+        schedule = build_schedule(len(self.subsession.get_groups()), self.session.config, C, session_seed(self.session))
+        expect((group.t_groups, group.field_maybe_none("character_random")), schedule[group.id_in_subsession - 1])
+
+        # Every participant sees exactly one of the three treatments
+        expect([player.treatment_0, player.treatment_1, player.treatment_2].count(True), 1)
+
+        # Only T1 participants get the fictional character
+        if player.treatment_1:
+            expect(player.character_random, "in", C.CHARACTERS)
+        else:
+            expect(player.field_maybe_none("character_random"), None)
+
+    def check_payoffs(self, choices):
+        # Payoffs are resolved for the group on ResultsWaitPage
+        player = self.player
+        participant = self.participant
+
+        safe_options = scenario_table(self.session)
+        expect(player.risk_bits, encode(choices))
+        expect(player.risk_random, choices[player.scenario_random - 1])
+        if participant.c_role == "Non Elite" or player.risk_random:
+            expect(player.payoff, C.ENDOWMENT - player.lottery_random)
+        else:
+            expect(player.payoff, C.ENDOWMENT - safe_options[player.scenario_random - 1])
+
+        # Same draws as a replay from the session seed (shared/replay.py)
+        group = player.group
+        replayed = replay([session_seed(self.session)], PART_TWO, [group.id_in_subsession],
+                          choice_matrix([group.get_players()], len(safe_options)), C, safe_options)
+        expect(player.scenario_random, int(replayed.scenario_random[0, player.id_in_group - 1]))
+        expect(int(player.payoff), int(replayed.payoff[0, player.id_in_group - 1]))
+
+        # The stored records of both parts (shared/summary.py)
+        p1 = Summary(participant.p1)
+        p2 = Summary(participant.p2)
+        expect(p2.risk_bits, player.risk_bits)
+        expect(p2.payoff, player.payoff)
+        expect(p2.scenario_random, player.scenario_random)
+        expect(p2.lottery_random_str, player.lottery_random_str)
+        expect(p2.treatment, player.group.t_groups)
+        expect(p2.group_id, player.group.id)
+        expect(participant.p2_character_random, player.field_maybe_none("character_random"))
+        expect(participant.payoff, p1.payoff + p2.payoff)
+
+        # The bot is on Final_Results now, which reads the stored records of both parts
+        expect("<td>{}</td>".format(p1.payoff), "in", self.html)
+        expect("<td>{}</td>".format(p2.payoff), "in", self.html)
+
+    def check_live_counts(self):
+        # Counters of the admin report (shared/live.py), settled when the last group of a part
+        # is resolved on its ResultsWaitPage; other groups may still be choosing until then
+        # Reload the bot's session object, loaded before the other groups moved on: once part 2 is
+        # settled the counters are read from the persisted state
+        object_session(self.session).refresh(self.session)
+        live = live_report(self.session)
+        rows = {row["label"]: row for row in live["live_choice_rows"] + live["live_switch_rows"]}
+        num_participants = len(self.session.get_participants())
+        resolved = self.session._vars["resolved_players"]
+        for label, part in [("Part 1 all", 1), ("Part 2 all", 2), ("p1 -> p2 all", 2)]:
+            if resolved.get(part, 0) == num_participants:
+                expect(rows[label]["n"], num_participants)
+            else:
+                expect(rows[label]["n"], "<=", num_participants)
+
+        if self.case == "risky":
+            expect(set(rows["Part 2 all"]["cells"]), {"100%"})
+            expect(rows["p1 -> p2 all"]["rate"], "0%")
+
+    def check_journal(self):
+        # The audit journal (shared/journal.py) has the participant's assignment and part 2 result
+        if not JOURNAL_DIR:
+            return
+        records = scan(session=self.session.code, participant=self.participant.code)
+        results = records[(records["kind"] == RESULT) & (records["part"] == 2)]
+        expect(len(results), 1)
+        expect(results[0].tobytes()[HEADER.size:], to_bytes(self.participant.p2))
+        assignment = records[records["kind"] == ASSIGNMENT][-1]
+        expect(int(assignment["flags"]) >> 4 & 3, TREATMENTS.index(self.player.group.t_groups))
+        expect(int(assignment["id_in_group"]), self.player.id_in_group)
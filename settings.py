@@ -5,9 +5,55 @@ SESSION_CONFIGS = [
     dict(
         name='my_experiment',
         display_name="my_experiment",
-        app_sequence=['part_one', 'part_two'],
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
         num_demo_participants=18,
     ),
+    dict(
+        name='my_experiment_arrival',
+        display_name="my_experiment (groups formed by arrival time)",
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
+        num_demo_participants=18,
+        p1_group_by_arrival_time=True,
+    ),
+    dict(
+        name='my_experiment_12',
+        display_name="my_experiment (12 scenarios)",
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
+        num_demo_participants=18,
+        scenarios="775, 725, 675, 625, 575, 525, 475, 425, 375, 325, 275, 225",
+    ),
+    dict(
+        name='my_experiment_20',
+        display_name="my_experiment (20 scenarios)",
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
+        num_demo_participants=18,
+        scenarios="775, 750, 725, 700, 675, 650, 625, 600, 575, 550, 525, 500, 475, 450, 425, 400, 375, 350, 325, 300",
+    ),
+    dict(
+        # the largest table (shared/scenarios.py); the "risky" bots set every bit of risk_bits
+        name='my_experiment_31',
+        display_name="my_experiment (31 scenarios)",
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
+        num_demo_participants=18,
+        scenarios="775, 750, 725, 700, 675, 650, 625, 600, 575, 550, 525, 500, 475, 450, 425, 400, 375, 350, "
+                  "325, 300, 275, 250, 225, 200, 175, 150, 125, 100, 75, 50, 25",
+    ),
+    dict(
+        name='my_experiment_snapshot',
+        display_name="my_experiment (writes a part_one snapshot to _snapshots)",
+        app_sequence=['part_one_intro', 'part_one', 'part_two'],
+        num_demo_participants=18,
+        # the source of snapshots like part_two/tests.snap (shared/snapshot.py)
+        snapshot_dir="_snapshots",
+    ),
+    dict(
+        name='my_experiment_part_two',
+        display_name="my_experiment from part_two (restored from a part_one snapshot)",
+        app_sequence=['part_two'],
+        num_demo_participants=18,
+        # written by a session at the end of part_one (shared/snapshot.py)
+        snapshot="part_two/tests.snap",
+    ),
 ]
 
 # if you set a property in SESSION_CONFIG_DEFAULTS, it will be inherited by all configs
@@ -16,20 +62,39 @@ SESSION_CONFIGS = [
 # e.g. self.session.config['participation_fee']
 
 SESSION_CONFIG_DEFAULTS = dict(
-    real_world_currency_per_point=0.0125, participation_fee=4.00, doc=""
+    real_world_currency_per_point=0.0125, participation_fee=4.00, doc="",
+    # loss of the safe option in each scenario of both parts, in the order shown (shared/scenarios.py)
+    scenarios="775, 600, 500, 400",
+    # part_two treatment assignment (see shared/assignment.py): rotate treatments over the groups,
+    # shuffle them in balanced blocks, or follow a fixed schedule like "T1:Samantha, T0, T2, T1:Daniel"
+    assignment_blocked_randomization=False,
+    assignment_schedule="",
+    # part_one groups: fixed by seat, or formed from whoever finishes the quiz first (shared/grouping.py)
+    p1_group_by_arrival_time=False,
+    # check the comprehension quiz over the page websocket instead of one form submission per try
+    quiz_live=True,
+    # seed of the payoff draws, e.g. "12345"; empty draws a new one per session (shared/rng.py)
+    rng_seed="",
+    # write a snapshot of the session at the end of part_one into this directory, "" = off (shared/snapshot.py).
+    # Off by default: it adds a wait for all groups at the end of part_one (SnapshotWaitPage)
+    snapshot_dir="",
+    # serve the role/treatment-invariant pages from memory (shared/render_cache.py)
+    render_cache=True,
+    # wait page release (shared/release.py): notifications of one page within this many ms are sent
+    # together, spread over wait_page_stagger_ms so the browsers reload in slices (0 = all at once)
+    wait_page_coalesce_ms=20,
+    wait_page_stagger_ms=0,
 )
 
-PARTICIPANT_FIELDS = ["p1_group_id", "c_role",
-                      "p1_risk_1", "p1_risk_2", "p1_risk_3", "p1_risk_4",
-                      "p1_scenario_random", "p1_risk_random", "p1_lottery_random", "p1_payoff",
-                      "p1_risk_random_str", "p1_safe_random_str", "p1_lottery_random_str",
-                      "p2_risk_1", "p2_risk_2", "p2_risk_3", "p2_risk_4",
-                      "p2_scenario_random", "p2_risk_random", "p2_lottery_random", "p2_payoff",
-                      "p2_risk_random_str", "p2_safe_random_str", "p2_lottery_random_str",
-                      "p2_character_random", "p2_character_sex",
-                      "treatment_0", "treatment_1", "treatment_2"]
+# p1 / p2 hold the results of each part as one dict of plain values (shared/summary.py),
+# p1_slot / p1_arrival / p1_grouped the group formation of part_one (shared/grouping.py)
+PARTICIPANT_FIELDS = ["c_role", "p1", "p2", "p2_character_random", "p2_character_sex",
+                      "p1_slot", "p1_arrival", "p1_grouped"]
 
-SESSION_FIELDS = ["t_groups", "character_random"]
+# rng_seed: seed of the payoff draws (shared/rng.py), live_counts: choice counters of the admin
+# report (shared/live.py), pool: pooled session of a room (shared/pool.py), resolved_players:
+# players resolved per part on the ResultsWaitPages (shared/payoffs.py)
+SESSION_FIELDS = ["t_groups", "character_random", "rng_seed", "live_counts", "pool", "resolved_players"]
 
 # ISO-639 code
 # for example: de, fr, ja, ko, zh-hans
@@ -49,6 +114,27 @@ ROOMS = [
     dict(name='live_demo', display_name='Room for live demo (no participant labels)'),
 ]
 
+# Sessions created ahead of time by the worker process; the admin opens the room with one on the
+# /pools page (shared/pool.py). num_participants defaults to the room's labels.
+SESSION_POOLS = [
+    dict(room='econ101', session_config='my_experiment', size=1, max_age_hours=24),
+]
+
+# Sharded deployment (`python -m shared.shards`): one server process and database per shard behind
+# a local router. A shard owns the rooms listed here, unlisted rooms belong to the first shard.
+SHARDS = [
+    dict(rooms=['econ101']),
+    dict(rooms=['live_demo']),
+]
+
+# Append-only journal of every draw, assignment and payoff, for audits (shared/journal.py). "" = off.
+# Set it to a persistent directory: the project folder is reset when a Heroku / oTree Hub dyno restarts
+JOURNAL_DIR = environ.get('OTREE_JOURNAL_DIR', '')
+
+# Result files of the background jobs (shared/jobs.py), written by the worker and downloaded through
+# the web process: both need this directory, e.g. a shared volume when they run on separate hosts
+JOBS_DIR = environ.get('OTREE_JOBS_DIR', '_jobs')
+
 ADMIN_USERNAME = 'admin'
 # for security, best to set admin password in an environment variable
 ADMIN_PASSWORD = environ.get('OTREE_ADMIN_PASSWORD')
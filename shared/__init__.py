@@ -0,0 +1,43 @@
+"""
+Code shared by part_one and part_two that does not belong to a single app.
+
+install() puts the server-side extensions in place. part_one_intro calls it once, when oTree
+imports the apps (all apps of SESSION_CONFIGS, at startup), so before oTree builds its routes and
+before `otree prodserver` starts. Each extension replaces or extends one piece of oTree:
+
+- pool      adds the /pools admin page, which opens a room with a pooled session (shared/pool.py)
+- shards    the column defaults of Session.code, Participant.code and Session._anonymous_code:
+            in the sharded mode the codes carry the shard (shared/shards.py)
+- jobs      adds the /jobs admin pages to otree.channels.routing.websocket_routes (shared/jobs.py)
+- live      adds the /live/<code> counters the admin reports poll (shared/live.py)
+- release   otree.channels.utils.sync_group_send: wait page notifications go to the releaser
+            (shared/release.py)
+- warmup    in the server process (otree prodserver, prodserver1of2, devserver), fills oTree's
+            template cache once the apps are imported (shared/warmup.py, warm_server)
+
+The template check (shared/warmup.py) also runs as a deploy step of its own, `python -m
+shared.warmup`, and the worker (shared/worker.py) is the Procfile's worker process, `python -m
+shared.worker`.
+
+shared/timing.py (the engine's cursor events) hooks in when it is imported.
+"""
+
+_installed = False
+
+
+def install():
+    """Install the extensions above; later calls do nothing."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from shared import jobs, live, pool, release, shards, warmup
+
+    pool.install()
+    shards.install()
+    jobs.install()
+    live.install()
+    release.install()
+    if warmup.is_server():
+        warmup.warm_server()
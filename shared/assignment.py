@@ -0,0 +1,115 @@
+"""
+Treatment and character assignment for part_two.creating_session.
+
+Every group gets a treatment (T0/T1/T2). Groups in the character treatment (T1) additionally
+get a fictional character (Samantha/Daniel). The schedule is built once for all groups and then
+written in a single pass over the players. Three ways to build the schedule are supported:
+
+- cycle (default): treatments rotate over the groups, characters rotate over the T1 groups.
+- blocked randomization: treatments are shuffled within consecutive blocks of len(treatments)
+  groups, and characters within consecutive blocks of len(characters) T1 groups, so both stay
+  balanced at any session size. The shuffles draw from the session's seed (shared/rng.py), so
+  a session and its simulation (shared/simulate.py) get the same schedule.
+- a precomputed schedule from the session config, e.g. "T1:Samantha, T0, T2, T1:Daniel".
+  It is repeated if the session has more groups than entries.
+"""
+
+import itertools
+
+from shared.bulk import DirectWrites
+from shared.rng import GROUPING, stream
+
+
+# Number of the assignment's stream among the GROUPING streams (the others are numbered from 1)
+SCHEDULE_STREAM = 0
+
+
+def cycle_schedule(num_groups, treatments, characters, character_treatment):
+    treatment_cycle = itertools.cycle(treatments)
+    character_cycle = itertools.cycle(characters)
+
+    schedule = []
+    for _ in range(num_groups):
+        treatment = next(treatment_cycle)
+        character = next(character_cycle) if treatment == character_treatment else None
+        schedule.append((treatment, character))
+    return schedule
+
+
+def blocked_schedule(num_groups, treatments, characters, character_treatment, rng):
+    def blocks(items):
+        while True:
+            block = list(items)
+            rng.shuffle(block)
+            yield from block
+
+    treatment_blocks = blocks(treatments)
+    character_blocks = blocks(characters)
+
+    schedule = []
+    for _ in range(num_groups):
+        treatment = next(treatment_blocks)
+        character = next(character_blocks) if treatment == character_treatment else None
+        schedule.append((treatment, character))
+    return schedule
+
+
+def parse_schedule(text, treatments, characters, character_treatment):
+    """Parse "T1:Samantha, T0, T2, T1:Daniel" into [(treatment, character or None), ...]."""
+    schedule = []
+    for entry in text.split(","):
+        treatment, _, character = entry.strip().partition(":")
+        character = character.strip() or None
+
+        if treatment not in treatments:
+            raise ValueError("Unknown treatment in assignment_schedule: {!r}".format(entry))
+        if (treatment == character_treatment) != (character in characters):
+            raise ValueError(
+                "assignment_schedule: {} groups need one of {} as character, "
+                "other treatments none: {!r}".format(character_treatment, characters, entry)
+            )
+        schedule.append((treatment, character))
+
+    if not schedule:
+        raise ValueError("assignment_schedule is empty")
+    return schedule
+
+
+def build_schedule(num_groups, config, C, seed):
+    """Pick the schedule according to the session config; seed: the session's seed (shared/rng.py)."""
+    args = (C.TREATMENTS, C.CHARACTERS, C.CHARACTER_TREATMENT)
+
+    if config.get("assignment_schedule"):
+        schedule = parse_schedule(config["assignment_schedule"], *args)
+        return list(itertools.islice(itertools.cycle(schedule), num_groups))
+    if config.get("assignment_blocked_randomization"):
+        return blocked_schedule(num_groups, *args, stream(seed, GROUPING, SCHEDULE_STREAM))
+    return cycle_schedule(num_groups, *args)
+
+
+def assign_treatments(groups, players, C, schedule, batch=None):
+    """
+    Write the schedule to the groups, players and participants in one pass.
+    batch: a shared.bulk.WriteBatch collecting the writes, by default they are set directly.
+    """
+    character_sex = dict(zip(C.CHARACTERS, C.CHARACTERS_SEX))
+    if batch is None:
+        batch = DirectWrites()
+
+    for group, (treatment, character) in zip(groups, schedule):
+        batch.set(group, t_groups=treatment, character_random=character)
+
+    # Pass subsession.get_players(): loaded in one query, p.group then comes from the groups above
+    for p in players:
+        group = p.group
+        character = group.field_maybe_none("character_random")
+        batch.set(p, treatment_0=group.t_groups == C.TREATMENTS[0],
+                  treatment_1=group.t_groups == C.TREATMENTS[1],
+                  treatment_2=group.t_groups == C.TREATMENTS[2])
+
+        # T0 and T2 participants do not need the character, thus it is "None". Assigned in any
+        # case, so that assigning again after a regrouping does not leave a stale character.
+        batch.set(p, character_random=character, character_sex=character_sex.get(character))
+
+        # Store data at the participant level. Important for showing correct pages and templates
+        batch.set_vars(p.participant, p2_character_random=character, p2_character_sex=character_sex.get(character))
@@ -0,0 +1,128 @@
+"""
+Batched database writes for the wait-page callbacks (after_all_players_arrive).
+
+Setting fields one by one on the players and participants of a whole subsession makes the ORM
+write every row with its own UPDATE, and player.payoff commits the transaction on every
+assignment (it also adds to participant.payoff). A WriteBatch instead collects the new values
+of all rows of one resolution and writes them, at the end of the `with batched_writes()` block,
+with one bulk UPDATE per table and set of columns:
+
+    UPDATE part_one_player
+       SET scenario_random = CASE WHEN id IN (1, 5) THEN 2 WHEN id IN (2, 3, 4) THEN 4 END, ...
+     WHERE id IN (1, 2, 3, 4, 5)
+
+Rows are grouped by value in every CASE, so the statement grows with the number of distinct
+values, not with rows times columns. The UPDATEs go through the ORM session of the objects and
+are committed with the rest of the request, in one transaction. The objects get the values
+right away as their committed state, so they read the new values and the ORM does not write
+them a second time.
+
+DirectWrites has the same interface and simply sets the attributes (plain objects in the
+benchmarks, session creation).
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import case, cast, literal
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+# Rows per statement: keeps the bound parameters below SQLite's limit
+MAX_ROWS = 500
+
+
+class WriteBatch:
+    def __init__(self, max_rows=MAX_ROWS):
+        self.max_rows = max_rows
+        self.statements = 0
+        # table -> {row id: (object, {column: value})}
+        self._rows = defaultdict(dict)
+
+    def set(self, obj, **values):
+        """Set columns of a player, group or participant (column names, e.g. _payoff)."""
+        _, columns = self._rows[obj.__table__].setdefault(obj.id, (obj, {}))
+        for column, value in values.items():
+            set_committed_value(obj, column, value)
+            columns[column] = value
+
+    def set_payoff(self, player, payoff):
+        # As the player.payoff setter: the change is added to participant.payoff as well
+        participant = player.participant
+        self.set(participant, payoff=participant.payoff + (payoff - player._payoff))
+        self.set(player, _payoff=payoff)
+
+    def set_vars(self, participant, **fields):
+        """PARTICIPANT_FIELDS, stored in the pickled participant.vars."""
+        # Updated in place: the dict stays the one the ORM tracks for later changes
+        vars = participant._vars
+        dict.update(vars, fields)
+        self.set(participant, _vars=vars)
+
+    def flush(self):
+        for table, rows in self._rows.items():
+            by_columns = defaultdict(list)
+            for row_id, (obj, values) in rows.items():
+                by_columns[tuple(sorted(values))].append((row_id, values))
+
+            session = object_session(next(iter(rows.values()))[0])
+            for columns, group in by_columns.items():
+                for start in range(0, len(group), self.max_rows):
+                    session.execute(bulk_update(table, columns, group[start:start + self.max_rows]))
+                    self.statements += 1
+        self._rows.clear()
+
+
+class DirectWrites:
+    def set(self, obj, **values):
+        for column, value in values.items():
+            setattr(obj, column, value)
+
+    def set_payoff(self, player, payoff):
+        player.payoff = payoff
+
+    def set_vars(self, participant, **fields):
+        for name, value in fields.items():
+            setattr(participant, name, value)
+
+    def flush(self):
+        pass
+
+
+def _key(value):
+    try:
+        return type(value), value, hash(value)
+    except TypeError:
+        return id(value)
+
+
+def bulk_update(table, columns, rows):
+    """One UPDATE for rows = [(id, {column: value})], all with the given columns."""
+    ids = [row_id for row_id, _ in rows]
+    assignments = {}
+    for column in columns:
+        column_type = table.c[column].type
+        by_value = {}
+        for row_id, values in rows:
+            value = values[column]
+            by_value.setdefault(_key(value), (value, []))[1].append(row_id)
+
+        if len(by_value) == 1:
+            (value, _), = by_value.values()
+            assignments[column] = literal(value, column_type)
+        else:
+            # Cast: PostgreSQL would otherwise type the CASE of bare parameters as text
+            assignments[column] = case(
+                [(table.c.id.in_(row_ids), cast(literal(value, column_type), column_type))
+                 for value, row_ids in by_value.values()],
+                else_=table.c[column],
+            )
+    return table.update().where(table.c.id.in_(ids)).values(assignments)
+
+
+@contextmanager
+def batched_writes(max_rows=MAX_ROWS):
+    batch = WriteBatch(max_rows)
+    yield batch
+    batch.flush()
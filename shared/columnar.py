@@ -0,0 +1,199 @@
+"""
+Columnar export: the same data as the wide export (shared/export.py), written as one typed
+numpy structured array (.npy), one record per participant.
+
+Analysis scripts open the file with np.load(path, mmap_mode="r") and slice columns without
+parsing any text; hundreds of session files can be memory-mapped at once (see load_many).
+
+    python -m shared.columnar choices.npy [--session CODE] [--database-url URL]
+
+Columns (pN = p1 / p2):
+
+    session_code, participant_code                      fixed-width bytes
+    participant_label                                   UTF-8, as wide as the longest label (at least 32)
+    id_in_session                                       uint32
+    role                                                uint8, index into ROLES (JW, E, NE)
+    num_scenarios                                       uint8, scenarios of the session's table (0 = not known)
+    pN_done                                             bool, False if the part was not finished
+    pN_group_id                                         uint32
+    pN_risk_bits                                        uint32, bit i = risky in scenario i + 1
+    pN_scenario_random                                  uint8, 1-based
+    pN_risk_random, pN_plays_lottery                    bool
+    pN_lottery_random, pN_payoff                        int16
+    p2_treatment                                        uint8, index into TREATMENTS (T0, T1, T2)
+    p2_character                                        uint8, index into CHARACTERS (none, Samantha, Daniel)
+    payoff                                              int32, p1 + p2
+
+Role, treatment and character codes are the same as in the stored records (shared/summary.py).
+MISSING (255) codes a role that is not known yet (part_one not finished) and the treatment and
+character of a participant without a part 2 record; readers drop these rows or select codes
+explicitly, so they never count as JW or T0.
+The record has the same size whatever the number of scenarios; the choices of one scenario are
+(a["p1_risk_bits"] >> (scenario - 1)) & 1, all of them shared.scenarios.decode_matrix with the
+num_scenarios of the record.
+"""
+
+import argparse
+import itertools
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from shared.export import count_participants, default_database_url, session_scenarios, stream_participants
+from shared.summary import CHARACTERS, ROLES, TREATMENTS, values
+
+
+# Code of a role, treatment or character that is not known
+MISSING = 255
+# Narrowest participant_label column, so that exports of the usual labels share one dtype
+LABEL_WIDTH = 32
+
+
+def dtype(label_width=LABEL_WIDTH):
+    fields = [
+        ("session_code", "S16"),
+        ("participant_code", "S16"),
+        ("participant_label", "S{}".format(label_width)),
+        ("id_in_session", "<u4"),
+        ("role", "u1"),
+        ("num_scenarios", "u1"),
+    ]
+    for part in ("p1", "p2"):
+        fields += [
+            (part + "_done", "?"),
+            (part + "_group_id", "<u4"),
+            (part + "_risk_bits", "<u4"),
+            (part + "_scenario_random", "u1"),
+            (part + "_risk_random", "?"),
+            (part + "_plays_lottery", "?"),
+            (part + "_lottery_random", "<i2"),
+            (part + "_payoff", "<i2"),
+        ]
+    fields += [
+        ("p2_treatment", "u1"),
+        ("p2_character", "u1"),
+        ("payoff", "<i4"),
+    ]
+    return np.dtype(fields)
+
+
+def _part_values(stored):
+    if stored is None:
+        return (False, 0, 0, 0, False, False, 0, 0), 0, MISSING, MISSING
+
+    v = values(stored)
+    columns = (
+        True, v.group_id, v.risk_bits,
+        v.scenario_random, v.risk_random, v.plays_lottery,
+        v.lottery_random if v.plays_lottery else 0, v.payoff,
+    )
+    return columns, v.payoff, v.treatment, v.character
+
+
+def record(session_code, participant_code, label, id_in_session, vars, num_scenarios=0):
+    """One participant as a tuple matching dtype(); num_scenarios: of the session (session_scenarios)."""
+    role = vars.get("c_role")
+    p1, p1_payoff, _, _ = _part_values(vars.get("p1"))
+    p2, p2_payoff, treatment, character = _part_values(vars.get("p2"))
+    return (
+        session_code, participant_code, (label or "").encode("utf-8"), id_in_session,
+        ROLES.index(role) if role in ROLES else MISSING, num_scenarios,
+    ) + p1 + p2 + (treatment, character, p1_payoff + p2_payoff)
+
+
+def label_width(records):
+    """participant_label width that holds the labels of the given records."""
+    return max([LABEL_WIDTH] + [len(r[2]) for r in records])
+
+
+def _widen(path, out, written, label_width, batch_size):
+    """The file again with a wider participant_label column; the first written records are copied."""
+    partial = "{}.partial".format(path)
+    wider = open_memmap(partial, mode="w+", dtype=dtype(label_width), shape=out.shape)
+    for start in range(0, written, batch_size):
+        stop = min(start + batch_size, written)
+        wider[start:stop] = out[start:stop].astype(wider.dtype)
+    wider.flush()
+    del out, wider
+    os.replace(partial, path)
+    return open_memmap(path, mode="r+")
+
+
+def write(path, participants, count, batch_size=10000, label_width=None, scenarios=None):
+    """
+    Write count participants (tuples as yielded by stream_participants) to a .npy file.
+    The file is created at its final size and filled through a memory map one batch at a time,
+    so memory stays bounded. participant_label is as wide as the longest UTF-8 encoded label
+    (at least LABEL_WIDTH), measured in the same pass: a longer label widens the file, and the
+    records written so far are copied once per widening. With a fixed label_width, a longer label
+    raises ValueError (numpy would cut it). scenarios: number of scenarios by session code
+    (session_scenarios), 0 for the sessions not in it. Returns the number of records written.
+    """
+    scenarios = scenarios or {}
+    width = label_width or LABEL_WIDTH
+    out = open_memmap(path, mode="w+", dtype=dtype(width), shape=(count,))
+    written = 0
+    batch = []
+    # Rows added after the count (live session) are left for the next export
+    for participant in itertools.islice(participants, count):
+        row = record(*participant, num_scenarios=scenarios.get(participant[0], 0))
+        if len(row[2]) > width:
+            if label_width:
+                raise ValueError("participant {}: label of {} bytes, the export has {}".format(
+                    participant[1], len(row[2]), label_width))
+            out[written:written + len(batch)] = batch
+            written += len(batch)
+            batch = []
+            width = len(row[2])
+            out = _widen(path, out, written, width, batch_size)
+        batch.append(row)
+        if len(batch) == batch_size:
+            out[written:written + len(batch)] = batch
+            written += len(batch)
+            batch = []
+    if batch:
+        out[written:written + len(batch)] = batch
+        written += len(batch)
+    out.flush()
+    del out
+    if written != count:
+        raise ValueError("expected {} participants, got {}".format(count, written))
+    return written
+
+
+def load(path):
+    return np.load(path, mmap_mode="r")
+
+
+def load_many(paths):
+    """Memory-map several export files; concatenating copies only the columns you select."""
+    return [load(path) for path in paths]
+
+
+def concatenate(arrays):
+    """Several exports as one array; participant_label as wide as in the widest of them."""
+    width = max([LABEL_WIDTH] + [array.dtype["participant_label"].itemsize for array in arrays])
+    return np.concatenate([np.asarray(array).astype(dtype(width)) for array in arrays])
+
+
+def labels(name):
+    """Lookup list for a coded column: role, p2_treatment or p2_character (MISSING is not in it)."""
+    return {"role": ROLES, "p2_treatment": TREATMENTS, "p2_character": CHARACTERS}[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the participant data as a typed .npy array.")
+    parser.add_argument("output", help=".npy file")
+    parser.add_argument("--session", help="only this session code")
+    parser.add_argument("--database-url", default=default_database_url())
+    args = parser.parse_args()
+
+    count = count_participants(args.database_url, args.session)
+    participants = stream_participants(args.database_url, args.session)
+    written = write(args.output, participants, count, scenarios=session_scenarios(args.database_url))
+    print("{} participants written to {}".format(written, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Treatment effects on the change from part one to part two, with bootstrap confidence intervals.
+
+The outcome of a participant is the change of their choices from p1 to p2: per scenario
+p2_risk_k - p1_risk_k (-1, 0 or 1), and overall the change of the share of risky choices. The
+tables break it down by treatment arm (T0, T1, T1 by character, T2) and role (JW / E / NE), and
+give the effect of every arm against T0 (difference in the mean change).
+
+Input is the columnar export (shared/columnar.py), any number of .npy files pooled, or the
+database directly:
+
+    python -m shared.effects [EXPORT.npy ...] [--database-url URL] [--scenarios N]
+                             [--replicates 100000] [--processes N] [--seed 0]
+                             [--unit group] [--level 0.95]
+
+Only participants who finished both parts count. Treatments are assigned to groups, so the
+bootstrap resamples part two groups (--unit participant: single participants) with replacement
+within every treatment / character stratum. The data are first reduced to one row of sums per
+group (participants and outcome sums by role); a replicate is then a vector of draw counts per
+group, built from an index array with np.bincount, and its sums are one matrix product. No
+participant-level data is touched inside the replicates. Replicates run in chunks on a process
+pool; every chunk has its own seed derived from --seed, so the results do not depend on the
+number of processes. Intervals are percentile intervals, p values two-sided bootstrap p values
+(k + 1) / (B + 1), never 0 with B replicates.
+
+The number of scenarios is taken from the records (num_scenarios of the columnar export).
+Sessions with different scenario tables are not pooled: prepare() refuses them. --scenarios
+checks the number, and gives it for older exports that do not store it.
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from shared.columnar import MISSING
+from shared.scenarios import decode_matrix
+from shared.summary import CHARACTERS, TREATMENTS
+
+
+ROLE_NAMES = ["JW", "E", "NE"]
+CHUNK_SIZE = 1000
+
+
+class Data(NamedTuple):
+    sums: list          # per stratum: (groups, roles * (1 + outcomes)), count and outcome sums
+    strata: list        # per stratum: (treatment, character) codes
+    num_scenarios: int
+
+
+def scenario_count(records, num_scenarios=None):
+    """Number of scenarios of the records' sessions; num_scenarios: expected, or for records without it."""
+    known = sorted(set(np.unique(records["num_scenarios"]).tolist()) - {0})
+    if len(known) > 1:
+        raise ValueError("sessions with {} scenarios cannot be pooled".format(
+            " and ".join(str(n) for n in known)))
+    if known and num_scenarios is not None and known[0] != num_scenarios:
+        raise ValueError("{} scenarios expected, the sessions have {}".format(num_scenarios, known[0]))
+    if known:
+        return known[0]
+    if num_scenarios is None and len(records):
+        raise ValueError("the records do not store the number of scenarios, give it (--scenarios)")
+    return num_scenarios or 0
+
+
+def prepare(records, num_scenarios=None, unit="group"):
+    """Reduce columnar records (shared/columnar.py) to the sums per group and stratum."""
+    # Unknown role or treatment (MISSING) never counts as JW or T0
+    records = records[records["p1_done"] & records["p2_done"]
+                      & (records["role"] != MISSING) & (records["p2_treatment"] != MISSING)]
+    num_scenarios = scenario_count(records, num_scenarios)
+    if not len(records):
+        return Data([], [], num_scenarios)
+    p1 = decode_matrix(records["p1_risk_bits"], num_scenarios)
+    p2 = decode_matrix(records["p2_risk_bits"], num_scenarios)
+    change = p2.astype(np.float64) - p1
+    # Outcome 0: change of the risky share, 1..K: change in scenario k
+    outcomes = np.concatenate([change.mean(axis=1, keepdims=True), change], axis=1)
+
+    if unit == "group":
+        # Group ids are per database: with the session code, unique across pooled exports.
+        # Records of part two without a group id (older sessions) have the groups of part one
+        groups = np.zeros(len(records), dtype=[("session", records.dtype["session_code"]), ("group", "<u4")])
+        groups["session"] = records["session_code"]
+        groups["group"] = np.where(records["p2_group_id"] != 0, records["p2_group_id"], records["p1_group_id"])
+        _, cluster = np.unique(groups, return_inverse=True)
+    else:
+        cluster = np.arange(len(records))
+    cluster = cluster.ravel()
+    num_clusters = cluster.max() + 1 if len(records) else 0
+
+    # Per group and role: participants, then the outcome sums
+    sums = np.zeros((num_clusters, len(ROLE_NAMES), 1 + outcomes.shape[1]))
+    np.add.at(sums, (cluster, records["role"]), np.concatenate([np.ones((len(records), 1)), outcomes], axis=1))
+    sums = sums.reshape(num_clusters, -1)
+
+    stratum = np.zeros(num_clusters, dtype=np.int64)
+    stratum[cluster] = records["p2_treatment"].astype(np.int64) * len(CHARACTERS) + records["p2_character"]
+    strata = sorted(set(stratum.tolist()))
+    return Data([sums[stratum == code] for code in strata],
+                [divmod(code, len(CHARACTERS)) for code in strata], num_scenarios)
+
+
+def bootstrap_chunk(seed, index, count, sums):
+    """count replicates: (count, strata, roles * (1 + outcomes)) sums of the resampled groups."""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+    out = np.empty((count, len(sums), sums[0].shape[1]))
+    offsets = np.arange(count)[:, None]
+    for s, stratum_sums in enumerate(sums):
+        n = len(stratum_sums)
+        draws = rng.integers(0, n, size=(count, n))
+        weights = np.bincount((draws + offsets * n).ravel(), minlength=count * n).reshape(count, n)
+        out[:, s] = weights @ stratum_sums
+    return out
+
+
+def bootstrap(data, replicates, seed=0, processes=None, chunk_size=CHUNK_SIZE, progress=None):
+    """progress(replicates done, replicates) after every chunk (shared/jobs.py, may raise to stop)."""
+    chunks = [(index, min(chunk_size, replicates - start))
+              for index, start in enumerate(range(0, replicates, chunk_size))]
+    parts = []
+
+    def done(part):
+        parts.append(part)
+        if progress is not None:
+            progress(sum(len(p) for p in parts), replicates)
+
+    if processes == 1:
+        for index, count in chunks:
+            done(bootstrap_chunk(seed, index, count, data.sums))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(bootstrap_chunk, seed, index, count, data.sums) for index, count in chunks]
+            try:
+                for future in futures:
+                    done(future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    return np.concatenate(parts)
+
+
+###############################################################################################
+##  Tables
+###############################################################################################
+
+
+def arms(strata):
+    """(name, stratum indices): T0, T1, T1 by character (if split), T2, ..."""
+    result = []
+    for treatment in sorted({t for t, _ in strata}):
+        members = [i for i, (t, _) in enumerate(strata) if t == treatment]
+        result.append((TREATMENTS[treatment], members))
+        characters = [strata[i][1] for i in members]
+        if len(members) > 1 or characters != [0]:
+            result += [(TREATMENTS[treatment] + " " + CHARACTERS[c], [i]) for i, c in zip(members, characters) if c]
+    return result
+
+
+def mean_changes(sums, data):
+    """(..., strata, roles * (1 + outcomes)) sums into (..., arms, all + roles, outcomes) means and counts."""
+    sums = sums.reshape(sums.shape[:-1] + (len(ROLE_NAMES), -1))
+    sums = np.concatenate([sums.sum(axis=-2, keepdims=True), sums], axis=-2)
+    by_arm = np.stack([sums[..., members, :, :].sum(axis=-3) for _, members in arms(data.strata)], axis=-3)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return by_arm[..., 1:] / by_arm[..., :1], by_arm[..., 0]
+
+
+def interval(replicates, level):
+    tail = (1 - level) / 2 * 100
+    return np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+
+
+def p_value(replicates):
+    """Two-sided bootstrap p value of a zero effect, (k + 1) / (B + 1) so that it is never 0."""
+    below = np.sum(replicates <= 0, axis=0)
+    above = np.sum(replicates >= 0, axis=0)
+    return np.minimum(1, 2 * (np.minimum(below, above) + 1) / (len(replicates) + 1))
+
+
+def effect_tables(data, replicated, level=0.95):
+    """Rows (arm, role, n, estimate, low, high[, p]) of the change and the effect tables."""
+    point, counts = mean_changes(np.stack([s.sum(axis=0) for s in data.sums]), data)
+    boot, _ = mean_changes(replicated, data)
+    names = [name for name, _ in arms(data.strata)]
+    roles = ["all"] + ROLE_NAMES
+
+    low, high = interval(boot, level)
+    changes = [(arm, role, int(counts[a, r]), point[a, r], low[a, r], high[a, r])
+               for a, arm in enumerate(names) for r, role in enumerate(roles)]
+
+    effects = []
+    if TREATMENTS[0] in names:
+        control = names.index(TREATMENTS[0])
+        differences = boot - boot[:, control:control + 1]
+        low, high = interval(differences, level)
+        p = p_value(differences)
+        estimate = point - point[control:control + 1]
+        effects = [(arm, role, int(counts[a, r]), estimate[a, r], low[a, r], high[a, r], p[a, r])
+                   for a, arm in enumerate(names) if a != control for r, role in enumerate(roles)]
+    return changes, effects
+
+
+def print_tables(changes, effects, num_scenarios, level):
+    scenarios = range(1, num_scenarios + 1)
+    percent = "{:.0%}".format(level)
+
+    print()
+    print("Change of the risky share p1 -> p2 (mean, {} interval)".format(percent))
+    print("{:<14} {:<4} {:>6} {:>24}".format("arm", "role", "n", "share"))
+    for arm, role, n, estimate, low, high in changes:
+        print("{:<14} {:<4} {:>6} {:>+8.3f} [{:+.3f}, {:+.3f}]".format(arm, role, n, estimate[0], low[0], high[0]))
+
+    if not effects:
+        print("No T0 groups: no effects against T0")
+        return
+    print()
+    print("Effect against T0: difference in the change of the risky share ({} interval, p)".format(percent))
+    print("{:<14} {:<4} {:>6} {:>24} {:>7}".format("arm", "role", "n", "effect", "p"))
+    for arm, role, n, estimate, low, high, p in effects:
+        print("{:<14} {:<4} {:>6} {:>+8.3f} [{:+.3f}, {:+.3f}] {:>7.4f}".format(
+            arm, role, n, estimate[0], low[0], high[0], p[0]))
+
+    print()
+    print("Effect against T0 by scenario, all roles")
+    print("{:<14} ".format("arm") + " ".join("{:>24}".format("scenario {}".format(k)) for k in scenarios))
+    for arm, role, n, estimate, low, high, p in effects:
+        if role == "all":
+            print("{:<14} ".format(arm) + " ".join(
+                "{:>+8.3f} [{:+.3f}, {:+.3f}]".format(estimate[k], low[k], high[k]) for k in scenarios))
+
+
+def load_records(paths, database):
+    from shared import columnar
+    if paths:
+        return columnar.concatenate(columnar.load_many(paths))
+    from shared.export import session_scenarios, stream_participants
+    scenarios = session_scenarios(database)
+    records = [columnar.record(*participant, num_scenarios=scenarios.get(participant[0], 0))
+               for participant in stream_participants(database)]
+    return np.array(records, dtype=columnar.dtype(columnar.label_width(records)))
+
+
+def main():
+    from shared.export import default_database_url
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="columnar exports (.npy); default: the database")
+    parser.add_argument("--database-url", default=default_database_url())
+    parser.add_argument("--scenarios", type=int, help="default: from the records")
+    parser.add_argument("--replicates", type=int, default=10000)
+    parser.add_argument("--processes", type=int, help="default: number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unit", choices=["group", "participant"], default="group", help="resampled unit")
+    parser.add_argument("--level", type=float, default=0.95)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        data = prepare(load_records(args.paths, args.database_url), args.scenarios, args.unit)
+    except ValueError as error:
+        raise SystemExit(error)
+    if not data.sums:
+        raise SystemExit("No participant finished both parts")
+    prepared = time.perf_counter()
+    replicated = bootstrap(data, args.replicates, args.seed, args.processes)
+    changes, effects = effect_tables(data, replicated, args.level)
+    print_tables(changes, effects, data.num_scenarios, args.level)
+    print()
+    print("{} {}s in {} strata, {} replicates: data {:.1f} s, bootstrap {:.1f} s".format(
+        sum(len(s) for s in data.sums), args.unit, len(data.sums), args.replicates,
+        prepared - start, time.perf_counter() - prepared))
+
+
+if __name__ == "__main__":
+    main()
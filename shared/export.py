@@ -0,0 +1,152 @@
+"""
+Wide export: one row per participant with role, the choices and draws of both parts,
+treatment and character.
+
+The rows are built from the participant.p1 / participant.p2 records that both
+ResultsWaitPages store (shared/summary.py), so no join of the two apps' player tables is needed.
+Everything here is a generator, one row is built at a time.
+
+Used by custom_export in part_one and part_two, and from the command line to stream the
+whole database (all sessions) with bounded memory:
+
+    python -m shared.export wide.csv [--session CODE] [--database-url URL]
+"""
+
+import argparse
+import binascii
+import csv
+import os
+import pickle
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from shared.scenarios import DEFAULT_SCENARIOS, parse_scenarios
+from shared.summary import CHARACTERS, TREATMENTS, values
+
+
+def header():
+    columns = ["session_code", "participant_code", "participant_label", "id_in_session",
+               "role", "p1_group_id"]
+    for part in ("p1", "p2"):
+        # All choices of a part in one column, bit i = risky in scenario i + 1 (shared/scenarios.py)
+        columns += [part + "_risk_bits", part + "_scenario_random", part + "_risk_random", part + "_lottery_random", part + "_payoff"]
+        if part == "p2":
+            columns += ["p2_treatment", "p2_character_random"]
+    columns += ["payoff"]
+    return columns
+
+
+def _part_columns(stored, with_treatment):
+    if stored is None:
+        return [""] * (5 + (2 if with_treatment else 0))
+
+    v = values(stored)
+    columns = [v.risk_bits, v.scenario_random, int(v.risk_random), v.lottery_random if v.plays_lottery else "", v.payoff]
+    if with_treatment:
+        columns += [TREATMENTS[v.treatment], CHARACTERS[v.character] or ""]
+    return columns
+
+
+def wide_row(session_code, participant_code, label, id_in_session, vars):
+    p1 = vars.get("p1")
+    p2 = vars.get("p2")
+
+    row = [session_code, participant_code, label or "", id_in_session,
+           vars.get("c_role", ""), p1["group_id"] if p1 is not None else ""]
+    row += _part_columns(p1, with_treatment=False)
+    row += _part_columns(p2, with_treatment=True)
+    row += [sum(part["payoff"] for part in (p1, p2) if part is not None)]
+    return row
+
+
+def wide_rows(players):
+    """Generator for custom_export: header, then one row per player (= participant, 1 round)."""
+    yield header()
+    for p in players:
+        participant = p.participant
+        # participant._vars, not participant.vars: every access to the latter marks the vars
+        # as changed, and the export request would then save all participants again
+        yield wide_row(participant._session_code, participant.code, participant.label,
+                       participant.id_in_session, participant._vars)
+
+
+###############################################################################################
+##  Streaming directly from the database
+###############################################################################################
+
+
+def decode_vars(value):
+    # Same encoding as otree.database._PickleField
+    return pickle.loads(binascii.a2b_base64(value.encode("utf-8")))
+
+
+def get_engine(database):
+    """The engine of a database URL; an Engine is used as it is (the worker's, shared/jobs.py)."""
+    return database if isinstance(database, Engine) else create_engine(database)
+
+
+def stream_participants(database, session_code=None, batch_size=1000):
+    """
+    Yield (session_code, code, label, id_in_session, vars) for every participant in database
+    order (database: URL or Engine). Rows are fetched in batches through a server-side cursor
+    where the database supports it, so memory stays bounded whatever the number of sessions.
+    """
+    engine = get_engine(database)
+    query = ("SELECT _session_code, code, label, id_in_session, _vars FROM otree_participant"
+             + (" WHERE _session_code = :session_code" if session_code else "")
+             + " ORDER BY id")
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(
+            text(query), session_code=session_code
+        )
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for session, code, label, id_in_session, vars in rows:
+                yield session, code, label, id_in_session, decode_vars(vars)
+
+
+def count_participants(database, session_code=None):
+    engine = get_engine(database)
+    query = ("SELECT COUNT(*) FROM otree_participant"
+             + (" WHERE _session_code = :session_code" if session_code else ""))
+    with engine.connect() as conn:
+        return conn.execute(text(query), session_code=session_code).scalar()
+
+
+def session_scenarios(database):
+    """Number of scenarios of every session's table (session config), by session code."""
+    engine = get_engine(database)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT code, config FROM otree_session"))
+        return {code: len(parse_scenarios(decode_vars(config).get("scenarios", DEFAULT_SCENARIOS)))
+                for code, config in rows}
+
+
+def default_database_url():
+    return os.environ.get("DATABASE_URL", "sqlite:///db.sqlite3")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the wide participant export to a CSV file.")
+    parser.add_argument("output", help="CSV file, or - for stdout")
+    parser.add_argument("--session", help="only this session code")
+    parser.add_argument("--database-url", default=default_database_url())
+    args = parser.parse_args()
+
+    fp = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        writer = csv.writer(fp)
+        writer.writerow(header())
+        for participant in stream_participants(args.database_url, args.session):
+            writer.writerow(wide_row(*participant))
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+
+if __name__ == "__main__":
+    main()
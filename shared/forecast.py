@@ -0,0 +1,186 @@
+"""
+Payout forecast: the exact distribution of a session's total payment, before the session.
+
+A participant's payment is (part_one + part_two payoff) converted with
+real_world_currency_per_point and rounded to the currency's cents as oTree does, plus the
+participation_fee. Its distribution follows from the constants and the session config alone:
+the payment scenario is drawn uniformly from the scenario table (shared/scenarios.py), the lottery uniformly from (RISK_LOW, RISK_HIGH), JW and E
+realize their choice in the drawn scenario (risky with the assumed share), NE always play
+the lottery.
+
+The session total is the sum over N/3 participants of each role. Its distribution is the
+convolution of the per-participant distributions, computed at once by raising their discrete
+Fourier transforms to the number of participants. Up to a few hundred participants this covers
+the whole range of totals. For larger sessions it covers a window around the mean that is wide
+enough (Hoeffding bound) that less than TAIL_MASS of the probability lies outside, which keeps
+10,000 participants at about a second.
+
+    python -m shared.forecast --participants 18 36 180 9999 [--risky 0.95,0.75,0.4,0.1]
+                              [--risky-part-two ...] [--session-config my_experiment]
+"""
+
+import argparse
+import math
+from decimal import ROUND_HALF_UP, Decimal
+from functools import reduce
+from typing import NamedTuple
+
+import numpy as np
+
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+TAIL_MASS = 1e-12
+ROLES = ["JW", "E", "NE"]
+
+
+def part_distribution(C, safe_options, risky_shares, plays_lottery=False):
+    """{payoff in tokens: probability} of one part; plays_lottery for NE, who cannot choose."""
+    outcomes = [int(C.RISK_LOW), int(C.RISK_HIGH)]
+    endowment = int(C.ENDOWMENT)
+    scenario = 1 / len(safe_options)
+
+    dist = {}
+    for safe, share in zip(safe_options, risky_shares):
+        risky = 1.0 if plays_lottery else share
+        for loss in outcomes:
+            dist[endowment - loss] = dist.get(endowment - loss, 0) + scenario * risky / len(outcomes)
+        dist[endowment - int(safe)] = dist.get(endowment - int(safe), 0) + scenario * (1 - risky)
+    return dist
+
+
+def add(a, b):
+    """Distribution of the sum of two independent payoffs."""
+    dist = {}
+    for x, p in a.items():
+        for y, q in b.items():
+            dist[x + y] = dist.get(x + y, 0) + p * q
+    return dist
+
+
+def payment_cents(tokens, rate, fee, places=2):
+    """Payment of one participant in cents, rounded like otree.currency.RealWorldCurrency."""
+    unit = Decimal(1).scaleb(-places)
+    amount = (Decimal(tokens) * Decimal(str(rate))).quantize(unit, rounding=ROUND_HALF_UP)
+    return int((amount + Decimal(str(fee))).scaleb(places))
+
+
+class Forecast(NamedTuple):
+    participants: int
+    mean: float                 # currency
+    std: float
+    minimum: float              # smallest / largest possible total
+    maximum: float
+    quantiles: dict             # q -> currency
+    window: bool                # True if only a window around the mean was computed
+
+
+def participant_distributions(C1, C2, safe_options, risky_one, risky_two, rate, fee, places=2):
+    """Per role: (payments in cents, probabilities) of one participant."""
+    distributions = []
+    for role in ROLES:
+        forced = role == "NE"
+        tokens = add(part_distribution(C1, safe_options, risky_one, forced),
+                     part_distribution(C2, safe_options, risky_two, forced))
+        cents = {}
+        for value, p in tokens.items():
+            cent = payment_cents(value, rate, fee, places)
+            cents[cent] = cents.get(cent, 0) + p
+        values = np.array(sorted(cents))
+        distributions.append((values, np.array([cents[v] for v in values])))
+    return distributions
+
+
+def forecast(num_participants, distributions, places=2):
+    """Session total for num_participants (a multiple of 3, N/3 per role)."""
+    n = num_participants // len(ROLES)
+    scale = 10 ** places
+
+    # Work in units of the greatest common step, relative to the smallest payment of each role
+    lows = [int(values[0]) for values, _ in distributions]
+    step = reduce(math.gcd, [int(v) - low for (values, _), low in zip(distributions, lows) for v in values]) or 1
+    spans = [(int(values[-1]) - low) // step for (values, _), low in zip(distributions, lows)]
+    offset = n * sum(lows)
+    full_range = n * sum(spans)
+
+    mean = sum(n * float((values * probs).sum()) for values, probs in distributions)
+    var = sum(n * float((values ** 2 * probs).sum() - (values * probs).sum() ** 2) for values, probs in distributions)
+
+    # Length of the transform: the whole range of totals, or a window around the mean outside
+    # of which less than TAIL_MASS lies (Hoeffding: sum of 3n bounded independent payments)
+    half_width = max(spans) * math.sqrt(len(ROLES) * n * math.log(2 / TAIL_MASS) / 2)
+    window = 2 * half_width + 1 < full_range + 1
+    needed = 2 * int(half_width) + 1 if window else full_range + 1
+    length = 1 << max(needed, max(spans) + 1).bit_length()
+
+    spectrum = np.ones(length // 2 + 1, dtype=complex)
+    for (values, probs), low in zip(distributions, lows):
+        pmf = np.zeros(length)
+        np.add.at(pmf, (values - low) // step, probs)
+        spectrum *= np.fft.rfft(pmf) ** n
+    pmf = np.clip(np.fft.irfft(spectrum, length), 0, None)
+
+    # Index j holds the totals congruent to j modulo length; take the one nearest to the mean
+    units = np.arange(length)
+    if window:
+        center = (mean - offset) / step
+        units = units + length * np.round((center - units) / length).astype(np.int64)
+    order = np.argsort(units)
+    units, pmf = units[order], pmf[order] / pmf.sum()
+    cdf = np.cumsum(pmf)
+
+    def currency(unit):
+        return (offset + unit * step) / scale
+
+    return Forecast(
+        num_participants, mean / scale, math.sqrt(var) / scale,
+        currency(0), currency(full_range),
+        {q: currency(units[min(np.searchsorted(cdf, q), len(units) - 1)]) for q in QUANTILES},
+        window,
+    )
+
+
+def parse_shares(text, num_scenarios):
+    shares = [float(x) for x in text.split(",")]
+    if len(shares) != num_scenarios or not all(0 <= x <= 1 for x in shares):
+        raise argparse.ArgumentTypeError("expected {} shares between 0 and 1".format(num_scenarios))
+    return shares
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--participants", type=int, nargs="+", default=[18, 36, 180, 1800, 9999])
+    parser.add_argument("--risky", default="0.95,0.75,0.4,0.1",
+                        help="share of JW/E participants choosing the lottery, per scenario of the table")
+    parser.add_argument("--risky-part-two", help="the same for part_two (default: as --risky)")
+    parser.add_argument("--session-config", default="my_experiment")
+    args = parser.parse_args()
+
+    from settings import SESSION_CONFIG_DEFAULTS, SESSION_CONFIGS, REAL_WORLD_CURRENCY_CODE
+    from part_one import C as C1
+    from part_two import C as C2
+    from shared.scenarios import parse_scenarios
+
+    config = dict(SESSION_CONFIG_DEFAULTS)
+    config.update(next(c for c in SESSION_CONFIGS if c["name"] == args.session_config))
+    rate, fee = config["real_world_currency_per_point"], config["participation_fee"]
+
+    safe_options = parse_scenarios(config["scenarios"])
+    risky_one = parse_shares(args.risky, len(safe_options))
+    risky_two = parse_shares(args.risky_part_two, len(safe_options)) if args.risky_part_two else risky_one
+    distributions = participant_distributions(C1, C2, safe_options, risky_one, risky_two, rate, fee)
+
+    print("Session payment in {} ({} per token, fee {})".format(REAL_WORLD_CURRENCY_CODE, rate, fee))
+    print("{:>8} {:>10} {:>8} ".format("N", "mean", "std")
+          + " ".join("{:>10}".format("p{:g}".format(q * 100)) for q in QUANTILES)
+          + " {:>10} {:>10}".format("min", "max"))
+    for num_participants in args.participants:
+        if num_participants % len(ROLES):
+            parser.error("--participants must be multiples of {}".format(len(ROLES)))
+        f = forecast(num_participants, distributions)
+        print("{:>8} {:>10.2f} {:>8.2f} ".format(f.participants, f.mean, f.std)
+              + " ".join("{:>10.2f}".format(f.quantiles[q]) for q in QUANTILES)
+              + " {:>10.2f} {:>10.2f}".format(f.minimum, f.maximum))
+
+
+if __name__ == "__main__":
+    main()
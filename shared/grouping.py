@@ -0,0 +1,145 @@
+"""
+Group formation for part_one: group_by_arrival_time_method of its first page (Group_Formation).
+
+part_one_intro seats every participant in a slot (group number, position) of the usual fixed
+groups of three; position 1 gets the JW instructions, positions 2 and 3 the UW instructions.
+The groups of part_one are formed from the participants waiting on Group_Formation:
+
+- fixed (default): as soon as the three participants of a slot are waiting, in slot order.
+  Groups and roles are exactly the fixed ones.
+- by arrival (session config p1_group_by_arrival_time): from the first JW participant and the
+  first two UW participants who finished the comprehension quiz. Which of the two UW
+  participants becomes E and which NE is drawn from the session's seed (shared/rng.py).
+
+Either way every group gets one JW, one E and one NE participant (id_in_group 1, 2, 3), so the
+role balance of the session is that of the seats. Arrival and grouping times are kept in
+participant.p1_arrival / participant.p1_grouped for the admin report (wait_report).
+"""
+
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from shared.release import ReleaseWaitPage
+from shared.rng import GROUPING, stream
+
+
+JW_POSITION = 1
+GROUP_SIZE = 3
+
+
+class GroupFormationPage(ReleaseWaitPage):
+    group_by_arrival_time = True
+
+    def inner_dispatch(self, request):
+        # First visit = arrival; the wait page is reloaded until the group is formed.
+        # Reads go through participant._vars, participant.vars would save the vars on every reload.
+        participant = self.participant
+        if participant._vars.get("p1_arrival") is None:
+            participant.p1_arrival = time.time()
+        return super().inner_dispatch(request)
+
+
+def _slot(p):
+    return p.participant._vars["p1_slot"]
+
+
+def _fixed_group(waiting_players):
+    slots = defaultdict(dict)
+    for p in waiting_players:
+        group, position = _slot(p)
+        slots[group][position] = p
+    for group in sorted(slots):
+        seats = slots[group]
+        if len(seats) == GROUP_SIZE:
+            return [seats[position] for position in sorted(seats)]
+    return None
+
+
+def uw_order(seed, jw_number):
+    """Positions (E, NE) of the group's two UW participants in arrival order; seed None = unseeded."""
+    rng = np.random.default_rng() if seed is None else stream(seed, GROUPING, jw_number)
+    return rng.permutation(GROUP_SIZE - 1).tolist()
+
+
+def _arrival_group(waiting_players, seed):
+    waiting = sorted(waiting_players, key=lambda p: (p.participant._vars["p1_arrival"], p.id_in_subsession))
+    jw = [p for p in waiting if _slot(p)[1] == JW_POSITION]
+    uw = [p for p in waiting if _slot(p)[1] != JW_POSITION]
+    if not jw or len(uw) < GROUP_SIZE - 1:
+        return None
+    return [jw[0]] + [uw[i] for i in uw_order(seed, jw[0].id_in_subsession)]
+
+
+def form_group(waiting_players, by_arrival, seed=None):
+    """
+    Players of the next group in id_in_group order (JW, E, NE), or None to keep waiting.
+    seed: the session's seed (shared.rng.session_seed) for the E / NE draw.
+    """
+    if by_arrival:
+        players = _arrival_group(waiting_players, seed)
+    else:
+        players = _fixed_group(waiting_players)
+
+    if players:
+        now = time.time()
+        for p in players:
+            p.participant.p1_grouped = now
+    return players
+
+
+###############################################################################################
+##  Admin report
+###############################################################################################
+
+
+def _wait_row(name, seconds):
+    values = np.array(seconds)
+    return dict(
+        name=name, n=len(values),
+        mean="{:.1f}".format(values.mean()),
+        p50="{:.1f}".format(np.percentile(values, 50)),
+        p95="{:.1f}".format(np.percentile(values, 95)),
+        max="{:.1f}".format(values.max()),
+    )
+
+
+def wait_report(participants, by_arrival):
+    """
+    Wait on Group_Formation in seconds: as it happened, and what the same arrivals would have
+    waited for fixed groups (until the last participant of their slot arrived).
+    """
+    times = []
+    slot_arrivals = defaultdict(list)
+    for participant in participants:
+        vars = participant._vars
+        if vars.get("p1_arrival") is not None:
+            slot = vars["p1_slot"][0]
+            times.append((slot, vars["p1_arrival"], vars.get("p1_grouped")))
+            slot_arrivals[slot].append(vars["p1_arrival"])
+
+    actual = []
+    fixed = []
+    for slot, arrival, grouped in times:
+        if grouped is not None:
+            actual.append(grouped - arrival)
+        members = slot_arrivals[slot]
+        if len(members) == GROUP_SIZE:
+            fixed.append(max(members) - arrival)
+
+    rows = []
+    if actual:
+        rows.append(_wait_row("this session ({})".format("by arrival" if by_arrival else "fixed groups"), actual))
+    if fixed and by_arrival:
+        rows.append(_wait_row("fixed groups, same arrivals", fixed))
+
+    reduction = None
+    if actual and fixed and by_arrival:
+        mean_fixed = np.mean(fixed)
+        p95_fixed = np.percentile(fixed, 95)
+        reduction = dict(
+            mean="{:.0%}".format(1 - np.mean(actual) / mean_fixed) if mean_fixed else "-",
+            p95="{:.0%}".format(1 - np.percentile(actual, 95) / p95_fixed) if p95_fixed else "-",
+        )
+    return dict(grouping_rows=rows, grouping_reduction=reduction)
@@ -0,0 +1,433 @@
+"""
+Background jobs: long exports and reports run on the worker process (shared/worker.py, the
+Procfile's worker) instead of in a web request, where they hold up the admin pages and oTree's
+global view lock while participants are live.
+
+The admin page /jobs submits a job and lists the jobs with their progress; a job can be
+cancelled while it waits or runs, and its result file is downloaded from the page when it is
+done. Kinds (KINDS):
+
+- export     the wide export (custom_export of part_one and part_two, shared/export.py) of all
+             sessions or one, streamed from the database
+- payments   the bulk payment file (shared/payments.py)
+- replay     the replay audit of the payoff draws (shared/replay.py)
+- effects    the bootstrap tables of the treatment effects (shared/effects.py)
+
+The queue is a table of the database the web and worker processes share (shared/models.py), so
+the worker runs on a host of its own (the worker dyno on Heroku / oTree Hub) and the jobs
+survive restarts. Per job one row: kind, parameters, state, progress and, once done, the result
+file's name and path. The result files are in JOBS_DIR (settings.py, <JOBS_DIR>/<job id>/), not
+in the database: the web process streams them from there, so the web and worker processes need
+the same directory (a shared volume or a mounted object store when they run on separate hosts).
+The worker claims a job with a conditional UPDATE of its state, runs the jobs one at a time in
+submission order and writes the result file into the job's directory; the directory of a failed
+or cancelled job is removed. The progress is saved at most every PROGRESS_SECONDS. The job kinds
+read the database through one engine per worker process (database(), disposed by dispose()). Cancelling sets cancel_requested: a waiting job is cancelled right away, a
+running one stops at its next progress report. Jobs left running by a worker that stopped are
+marked failed when the next worker starts. The worker marks itself alive in the shared_worker
+table; jobs submitted while none is alive wait for the next one.
+
+    python -m shared.jobs submit KIND [key=value ...]
+    python -m shared.jobs list | cancel ID | run
+"""
+
+import argparse
+import csv
+import json
+import mimetypes
+import shutil
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import NamedTuple
+
+from otree.database import session_scope
+from sqlalchemy.orm import object_session
+
+from settings import JOBS_DIR
+from shared.models import Job, Worker
+
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+PROGRESS_SECONDS = 0.5
+# The worker marks itself alive at least this often while it waits for jobs
+HEARTBEAT_SECONDS = 5
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Run:
+    """A job while the worker runs it: the job function reports its progress and names its result file here."""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.kind = job.kind
+        self.params = json.loads(job.params)
+        self.done = 0
+        self.total = None
+        self.message = None
+        self.result = None
+        self.cancelled = job.cancel_requested
+        self.directory = Path(JOBS_DIR, str(job.id))
+        # Left over from an earlier attempt of the same job
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True)
+        self._saved = 0.0
+
+    @property
+    def result_path(self):
+        return self.directory / self.result if self.result else None
+
+    def output(self, filename):
+        """Path of the result file (set by the job function)."""
+        self.result = filename
+        return self.result_path
+
+    def progress(self, done, total=None):
+        """Progress report of the job function; raises Cancelled when the job was cancelled."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if time.monotonic() - self._saved >= PROGRESS_SECONDS:
+            self.save()
+
+    def save(self):
+        with session_scope():
+            job = Job.objects_get(id=self.id)
+            job.done = self.done
+            job.total = self.total
+            cancelled = job.cancel_requested
+            heartbeat()
+        self._saved = time.monotonic()
+        if cancelled:
+            raise Cancelled()
+
+
+def all_jobs():
+    """All jobs, oldest first."""
+    return Job.objects_filter().order_by(Job.id).all()
+
+
+def submit(kind, params=None):
+    """Queue a job (in the caller's database session)."""
+    if kind not in KINDS:
+        raise ValueError("unknown job kind {!r}, expected one of {}".format(kind, ", ".join(KINDS)))
+    unknown = set(params or {}) - {param.name for param in KINDS[kind].params}
+    if unknown:
+        raise ValueError("{}: unknown parameters {}".format(kind, ", ".join(sorted(unknown))))
+    job = Job.create(kind=kind, params=json.dumps(dict(params or {})), state=QUEUED, created=time.time(), done=0,
+                     cancel_requested=False)
+    # Assigns the id
+    object_session(job).flush()
+    return job
+
+
+def cancel(job_id):
+    """Cancel a job (in the caller's database session); a waiting one right away."""
+    job = Job.objects_get(id=job_id)
+    job.cancel_requested = True
+    if job.state == QUEUED:
+        # Not started yet: take it from the queue, unless a worker claims it at the same moment
+        Job.objects_filter(id=job_id, state=QUEUED).update(
+            {Job.state: CANCELLED, Job.finished: time.time()}, synchronize_session="evaluate")
+    return job
+
+
+def _claim_next():
+    # The oldest waiting job; the conditional UPDATE decides between workers
+    for job in Job.objects_filter(state=QUEUED).order_by(Job.id).all():
+        if Job.objects_filter(id=job.id, state=QUEUED).update(
+                {Job.state: RUNNING, Job.started: time.time()}, synchronize_session=False):
+            return job
+    return None
+
+
+def _finish(run, state, message=None):
+    with session_scope():
+        job = Job.objects_get(id=run.id)
+        job.state = state
+        job.finished = time.time()
+        job.done = run.done
+        job.total = run.total
+        job.message = message = message if message is not None else run.message
+        kept = state == DONE and run.result
+        if kept:
+            job.result = run.result
+            job.path = str(run.result_path)
+    if not kept:
+        shutil.rmtree(run.directory, ignore_errors=True)
+    return run.id, run.kind, state, message
+
+
+def run(current):
+    """Run a claimed job in this process; returns (id, kind, state, message)."""
+    try:
+        if current.cancelled:
+            raise Cancelled()
+        KINDS[current.kind].run(current, **current.params)
+    except Cancelled:
+        return _finish(current, CANCELLED)
+    except Exception as error:
+        traceback.print_exc()
+        return _finish(current, FAILED, "{}: {}".format(type(error).__name__, error))
+    return _finish(current, DONE)
+
+
+def run_next():
+    """Run the oldest waiting job; returns (id, kind, state, message), or None if the queue is empty."""
+    with session_scope():
+        job = _claim_next()
+        # Read from the row before the scope ends the database session
+        current = Run(job) if job is not None else None
+    return None if current is None else run(current)
+
+
+def heartbeat():
+    """Mark the worker alive (in the caller's database session)."""
+    worker = Worker.objects_first()
+    if worker is None:
+        Worker.create(seen=time.time())
+    else:
+        worker.seen = time.time()
+
+
+def worker_alive():
+    """True if a worker process has marked itself alive recently."""
+    worker = Worker.objects_first()
+    return worker is not None and time.time() - worker.seen < 3 * HEARTBEAT_SECONDS
+
+
+def recover():
+    """Jobs left running by a stopped worker are failed (called when the worker starts)."""
+    with session_scope():
+        Job.objects_filter(state=RUNNING).update(
+            {Job.state: FAILED, Job.finished: time.time(), Job.message: "the worker stopped while the job was running"},
+            synchronize_session=False)
+
+
+###############################################################################################
+##  Kinds
+###############################################################################################
+
+
+_engine = None
+
+
+def database():
+    """The engine the job kinds read the database with, created once per worker process."""
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        from shared.export import default_database_url
+        _engine = create_engine(default_database_url())
+    return _engine
+
+
+def dispose():
+    """Close the connections of the engine (when the worker process stops)."""
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def _date(text):
+    return time.mktime(time.strptime(text, "%Y-%m-%d")) if text else None
+
+
+def run_export(job, session=""):
+    from shared.export import count_participants, header, stream_participants, wide_row
+
+    job.progress(0, count_participants(database(), session or None))
+    with open(job.output("wide_{}.csv".format(session or "all")), "w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header())
+        for done, participant in enumerate(stream_participants(database(), session or None), start=1):
+            writer.writerow(wide_row(*participant))
+            job.progress(done)
+    job.message = "{} participants".format(job.done)
+
+
+def run_payments(job, session_config="my_experiment", since="", until="", room="econ101"):
+    from shared.payments import COLUMNS, room_labels, sessions, write_payments
+
+    engine = database()
+    selected = sessions(engine, session_config, _date(since), _date(until))
+    with open(job.output("payments_{}.csv".format(session_config)), "w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(COLUMNS)
+        total, unknown = write_payments(writer, engine, selected, room_labels(room) if room else None, job.progress)
+    job.message = "{} sessions, {} participants, total {}{}".format(
+        len(selected), total.participants, total.amount,
+        ", {} participants with a label not in {}".format(sum(map(len, unknown.values())), room) if unknown else "")
+
+
+def run_replay(job, session=""):
+    from shared.replay import print_reports, replay_database
+
+    reports = replay_database(database(), session or None, job.progress)
+    with open(job.output("replay_{}.txt".format(session or "all")), "w", encoding="utf-8") as fp:
+        print_reports(reports, fp)
+    job.message = "{} mismatches".format(sum(len(report.mismatches) for report in reports))
+
+
+def run_effects(job, replicates="10000", unit="group", processes="1"):
+    from shared.effects import bootstrap, effect_tables, load_records, prepare, print_tables
+
+    # The number of scenarios comes from the sessions' configs (num_scenarios of the records)
+    data = prepare(load_records([], database()), unit=unit)
+    if not data.sums:
+        raise ValueError("no participant finished both parts")
+    replicated = bootstrap(data, int(replicates), processes=int(processes), progress=job.progress)
+    changes, effects = effect_tables(data, replicated)
+    with open(job.output("effects.txt"), "w", encoding="utf-8") as fp, redirect_stdout(fp):
+        print_tables(changes, effects, data.num_scenarios, 0.95)
+    job.message = "{} {}s, {} replicates".format(sum(len(s) for s in data.sums), unit, replicates)
+
+
+class Param(NamedTuple):
+    name: str
+    default: str
+    help: str
+
+
+class Kind(NamedTuple):
+    title: str
+    run: object
+    params: list
+
+
+KINDS = {
+    "export": Kind("Wide export (custom export of part_one / part_two)", run_export,
+                   [Param("session", "", "session code, empty = all sessions")]),
+    "payments": Kind("Payment file", run_payments, [
+        Param("session_config", "my_experiment", "session config"),
+        Param("since", "", "sessions created from YYYY-MM-DD"),
+        Param("until", "", "sessions created before YYYY-MM-DD"),
+        Param("room", "econ101", "room of the participant labels"),
+    ]),
+    "replay": Kind("Replay audit of the payoff draws", run_replay,
+                   [Param("session", "", "session code, empty = all sessions")]),
+    "effects": Kind("Treatment effects p1 -> p2 (bootstrap)", run_effects, [
+        Param("replicates", "10000", "bootstrap replicates"),
+        Param("unit", "group", "group or participant"),
+        Param("processes", "1", "processes of the worker"),
+    ]),
+}
+
+
+###############################################################################################
+##  Admin page
+###############################################################################################
+
+
+def _describe(job):
+    if job.state == RUNNING and job.total:
+        progress = "{:.0%} ({} / {})".format(job.done / job.total, job.done, job.total)
+    elif job.state == RUNNING:
+        progress = str(job.done or "")
+    else:
+        progress = ""
+    finished = job.finished or time.time()
+    params = json.loads(job.params)
+    return dict(
+        id=job.id, title=KINDS[job.kind].title if job.kind in KINDS else job.kind,
+        params=", ".join("{}={}".format(key, value) for key, value in params.items() if value),
+        state=job.state + (" (cancelling)" if job.state in (QUEUED, RUNNING) and job.cancel_requested else ""),
+        progress=progress, seconds="{:.1f} s".format(finished - job.started) if job.started else "",
+        message=job.message or "", result=job.result if job.state == DONE else "",
+        cancellable=job.state in (QUEUED, RUNNING),
+    )
+
+
+def install():
+    """The /jobs admin pages (called when the apps are imported)."""
+    from otree.channels.routing import websocket_routes
+    from otree.views.cbv import AdminView
+    from starlette.responses import FileResponse, Response
+    from starlette.routing import Route
+
+    class Jobs(AdminView):
+        def get_template_name(self):
+            return "global/Jobs.html"
+
+        def vars_for_template(self):
+            jobs = [_describe(job) for job in reversed(all_jobs())]
+            kinds = [dict(name=name, title=kind.title, params=[param._asdict() for param in kind.params])
+                     for name, kind in KINDS.items()]
+            return dict(jobs=jobs, kinds=kinds, active=any(job["cancellable"] for job in jobs),
+                        worker_alive=worker_alive())
+
+        def post(self, request):
+            data = self.get_post_data()
+            if data.get("cancel"):
+                if data["cancel"].isdigit() and Job.objects_exists(id=int(data["cancel"])):
+                    cancel(int(data["cancel"]))
+            elif data.get("kind") in KINDS:
+                kind = KINDS[data["kind"]]
+                submit(data["kind"], {param.name: data.get(param.name, param.default).strip() for param in kind.params})
+            return self.redirect("Jobs")
+
+    class JobResult(AdminView):
+        def get(self, request, job_id):
+            job = Job.objects_first(id=int(job_id)) if job_id.isdigit() else None
+            if job is None or job.state != DONE or not job.path or not Path(job.path).is_file():
+                return Response(status_code=404)
+            # Streamed from JOBS_DIR, which the worker wrote it to
+            return FileResponse(job.path, media_type=mimetypes.guess_type(job.result)[0] or "text/plain",
+                                filename=job.result)
+
+    # The apps are imported before oTree builds its routes from websocket_routes (otree/urls.py),
+    # which also sets the admin login requirement of the views by class name
+    websocket_routes.append(Route("/jobs", Jobs, name="Jobs"))
+    websocket_routes.append(Route("/jobs/{job_id}/result", JobResult, name="JobResult"))
+
+
+###############################################################################################
+##  Command line
+###############################################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("submit", help="queue a job")
+    command.add_argument("kind", choices=sorted(KINDS))
+    command.add_argument("params", nargs="*", metavar="KEY=VALUE")
+    commands.add_parser("list", help="all jobs")
+    command = commands.add_parser("cancel", help="cancel a waiting or running job")
+    command.add_argument("id", type=int)
+    commands.add_parser("run", help="run the waiting jobs in this process (without a worker)")
+    args = parser.parse_args()
+
+    from otree.main import setup
+    setup()
+
+    if args.command == "run":
+        try:
+            while True:
+                ran = run_next()
+                if ran is None:
+                    break
+                print("Job {} {}: {} {}".format(*ran[:3], ran[3] or ""), file=sys.stderr)
+        finally:
+            dispose()
+        return
+    with session_scope():
+        if args.command == "submit":
+            job = submit(args.kind, dict(param.partition("=")[::2] for param in args.params))
+            print("Job {} queued".format(job.id))
+        elif args.command == "cancel":
+            print("Job {}: {}".format(args.id, cancel(args.id).state))
+        else:
+            for job in map(_describe, all_jobs()):
+                print("{id:>5}  {title:<50} {state:<10} {progress:<20} {seconds:>8}  {params}  {message}  {result}".format(
+                    **job))
+
+
+if __name__ == "__main__":
+    main()
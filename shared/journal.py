@@ -0,0 +1,270 @@
+"""
+Append-only journal of the random draws and payoffs of both apps, kept next to the database
+for audits and payment disputes.
+
+Every treatment / character assignment of part_two (session creation, regrouping by arrival
+time, restore from a snapshot) and every resolved player of both ResultsWaitPages is appended
+as one fixed-size binary record (little endian, 48 bytes):
+
+    d    time           unix time of the callback
+    8s   session        session code
+    8s   participant    participant code
+    B    kind           1 assignment, 2 result
+    B    part           1 or 2
+    H    group          id_in_subsession of the group
+    B    id_in_group
+    3x
+    16s  summary        the record of shared/summary.py (to_bytes()): risk_bits, scenario_random,
+                        flags (risk_random, plays_lottery, role, treatment, character),
+                        lottery_random, safe_option, payoff, group_id. Assignments only set
+                        the treatment and character (and the group_id).
+
+The records go to <JOURNAL_DIR>/<YYYY-MM>.bin, one file per month (UTC). JOURNAL_DIR (settings.py,
+$OTREE_JOURNAL_DIR) is off ("") by default: an audit record needs a directory that outlives the
+server, not the project folder of a Heroku / oTree Hub dyno, which is reset on every restart.
+
+The records of a callback are kept with its database transaction and appended only when that
+commits (after_commit of the SQLAlchemy session), with one write() on a file opened with
+O_APPEND, so server processes can share the journal. A request that is rolled back or retried
+leaves no records of draws that never happened. A crash between the commit and the write loses
+that callback's records. fsync runs at most every FSYNC_SECONDS, on the next append
+(and at exit): after a crash of the machine (not of the process) the last seconds may be
+missing. A record left half-written by a crash is completed with zeros on the next
+open, so the records stay aligned. Nothing is ever rewritten.
+
+The reader maps the files into numpy structured arrays (np.memmap), so scanning months of
+sessions for a session, a participant or a time range is a few vectorized comparisons:
+
+    python -m shared.journal [--session CODE] [--participant CODE] [--since 2026-09-01]
+                             [--until 2026-10-01] [--kind result] [--summary] [--dir _journal]
+"""
+
+import argparse
+import atexit
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session as DBSession, object_session
+
+from settings import JOURNAL_DIR
+from shared.summary import CHARACTERS, LAYOUT, ROLES, TREATMENTS, record as summary_record, to_bytes
+
+
+ASSIGNMENT = 1
+RESULT = 2
+KINDS = {ASSIGNMENT: "assignment", RESULT: "result"}
+
+FSYNC_SECONDS = 5
+# Key of the records waiting for the commit in the database session's info
+PENDING = "journal_pending"
+
+HEADER = struct.Struct("<d8s8sBBHB3x")
+# The same records for the reader
+DTYPE = np.dtype([
+    ("time", "<f8"), ("session", "S8"), ("participant", "S8"),
+    ("kind", "u1"), ("part", "u1"), ("group", "<u2"), ("id_in_group", "u1"), ("pad", "V3"),
+    # shared/summary.py LAYOUT
+    ("risk_bits", "<u4"), ("scenario_random", "u1"), ("flags", "u1"),
+    ("lottery_random", "<i2"), ("safe_option", "<i2"), ("payoff", "<i2"), ("group_id", "<u4"),
+])
+RECORD_SIZE = HEADER.size + LAYOUT.size
+assert DTYPE.itemsize == RECORD_SIZE
+
+
+def encode(timestamp, session_code, participant_code, kind, part, group, id_in_group, summary):
+    return HEADER.pack(timestamp, session_code.encode(), participant_code.encode(), kind, part, group,
+                       id_in_group) + to_bytes(summary)
+
+
+class Journal:
+    def __init__(self, directory, fsync_seconds=FSYNC_SECONDS):
+        self.directory = Path(directory)
+        self.fsync_seconds = fsync_seconds
+        self._lock = threading.Lock()
+        self._fd = None
+        self._month = None
+        self._synced = 0.0
+
+    def _open(self, month):
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / "{}.bin".format(month), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        torn = os.fstat(fd).st_size % RECORD_SIZE
+        if torn:
+            os.write(fd, bytes(RECORD_SIZE - torn))
+        self._fd = fd
+        self._month = month
+
+    def append(self, records, now=None):
+        """Append encoded records (encode()) with one write."""
+        if not records:
+            return
+        now = time.time() if now is None else now
+        data = b"".join(records)
+        with self._lock:
+            month = time.strftime("%Y-%m", time.gmtime(now))
+            if month != self._month:
+                self._open(month)
+            os.write(self._fd, data)
+            if now - self._synced >= self.fsync_seconds:
+                os.fsync(self._fd)
+                self._synced = now
+
+    def close(self):
+        with_fd, self._fd = self._fd, None
+        if with_fd is not None:
+            os.fsync(with_fd)
+            os.close(with_fd)
+
+
+_journal = None
+
+
+def journal():
+    """The journal of this process, None if JOURNAL_DIR is empty."""
+    global _journal
+    if _journal is None and JOURNAL_DIR:
+        _journal = Journal(JOURNAL_DIR)
+        atexit.register(_journal.close)
+    return _journal
+
+
+def _append_on_commit(session, records, now):
+    """Append the records when the transaction that holds session (the oTree Session) commits."""
+    db_session = object_session(session)
+    if db_session is None:
+        journal().append(records, now)
+    else:
+        db_session.info.setdefault(PENDING, []).append((records, now))
+
+
+@event.listens_for(DBSession, "after_commit")
+def _committed(db_session):
+    for records, now in db_session.info.pop(PENDING, ()):
+        journal().append(records, now)
+
+
+@event.listens_for(DBSession, "after_rollback")
+def _rolled_back(db_session):
+    db_session.info.pop(PENDING, None)
+
+
+def log_assignments(session, groups, players):
+    """The treatment and character of every player of part_two's groups."""
+    if journal() is None:
+        return
+    now = time.time()
+    summaries = {group.id: summary_record(0, 0, False, False, 0, 0, 0, role=0, group_id=group.id,
+                                          treatment=group.t_groups,
+                                          character=group.field_maybe_none("character_random"))
+                 for group in groups}
+    groups = {group.id: group for group in groups}
+    _append_on_commit(session, [encode(now, session.code, p.participant.code, ASSIGNMENT, 2,
+                                       groups[p.group_id].id_in_subsession, p.id_in_group, summaries[p.group_id])
+                                for p in players], now)
+
+
+def log_results(session, part, entries):
+    """entries: (player, group, stored record) of every player resolved on a ResultsWaitPage."""
+    if journal() is None:
+        return
+    now = time.time()
+    _append_on_commit(session, [encode(now, session.code, player.participant.code, RESULT, part,
+                                       group.id_in_subsession, player.id_in_group, record)
+                                for player, group, record in entries], now)
+
+
+###############################################################################################
+##  Reader
+###############################################################################################
+
+
+def files(directory=None):
+    return sorted(Path(directory or JOURNAL_DIR).glob("*.bin"))
+
+
+def load(path):
+    """The records of one journal file, memory-mapped (read-only)."""
+    count = path.stat().st_size // RECORD_SIZE
+    if not count:
+        return np.zeros(0, DTYPE)
+    return np.memmap(path, DTYPE, mode="r", shape=(count,))
+
+
+def scan(directory=None, session=None, participant=None, since=None, until=None, kind=None):
+    """The matching records of all journal files, oldest first, as one structured array."""
+    found = []
+    for path in files(directory):
+        records = load(path)
+        mask = records["kind"] != 0
+        if session:
+            mask &= records["session"] == session.encode()
+        if participant:
+            mask &= records["participant"] == participant.encode()
+        if since is not None:
+            mask &= records["time"] >= since
+        if until is not None:
+            mask &= records["time"] < until
+        if kind:
+            mask &= records["kind"] == kind
+        found.append(np.array(records[mask]))
+    return np.concatenate(found) if found else np.zeros(0, DTYPE)
+
+
+def describe(record):
+    flags = int(record["flags"])
+    role, treatment, character = flags >> 2 & 3, flags >> 4 & 3, flags >> 6 & 3
+    text = "{} {} {} part {} {:<10} group {:>3}/{}  {}{}".format(
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"])),
+        record["session"].decode(), record["participant"].decode(), record["part"],
+        KINDS.get(int(record["kind"]), "?"), record["group"], record["id_in_group"],
+        TREATMENTS[treatment] if record["part"] == 2 else "", " " + CHARACTERS[character] if character else "")
+    if record["kind"] == RESULT:
+        text += "  {} scenario {} {}, safe {}, lottery {}, payoff {}".format(
+            ROLES[role], record["scenario_random"], "risky" if flags & 1 else "safe", record["safe_option"],
+            record["lottery_random"] if flags >> 1 & 1 else "-", record["payoff"])
+    return text
+
+
+def _date(text):
+    return time.mktime(time.strptime(text, "%Y-%m-%d"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dir", default=JOURNAL_DIR)
+    parser.add_argument("--session")
+    parser.add_argument("--participant")
+    parser.add_argument("--since", type=_date, help="YYYY-MM-DD, local time")
+    parser.add_argument("--until", type=_date, help="YYYY-MM-DD, local time, exclusive")
+    parser.add_argument("--kind", choices=sorted(KINDS.values()))
+    parser.add_argument("--summary", action="store_true", help="one line per session instead of the records")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    kind = {name: number for number, name in KINDS.items()}.get(args.kind)
+    records = scan(args.dir, args.session, args.participant, args.since, args.until, kind)
+    seconds = time.perf_counter() - start
+
+    if args.summary:
+        results = records[records["kind"] == RESULT]
+        sessions, index = np.unique(results["session"], return_inverse=True)
+        print("{:<10} {:>6} {:>6} {:>12}".format("session", "part 1", "part 2", "payoff total"))
+        for i, code in enumerate(sessions):
+            mine = results[index == i]
+            print("{:<10} {:>6} {:>6} {:>12}".format(code.decode(), np.sum(mine["part"] == 1),
+                                                     np.sum(mine["part"] == 2), int(mine["payoff"].sum())))
+    else:
+        for record in records:
+            print(describe(record))
+    total = sum(path.stat().st_size // RECORD_SIZE for path in files(args.dir))
+    print("{} of {} records in {:.1f} ms".format(len(records), total, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Live aggregates of the choices for the admin report: share of risky choices per scenario and
+the p1 -> p2 switching rate, by role (JW / E / NE) and by part_two arm (T0, T1 Samantha,
+T1 Daniel, T2).
+
+Every submitted Choices page adds the player's risk_bits to the counters of its session
+(count_choice, from Choices.before_next_page of both apps). That is a fixed amount of work per
+submission: one counter per scenario of the table, nothing is read from the player tables.
+Part 1 choices are counted by role only, since the part_two groups and treatments may still
+change until the end of part_one (arrival-time grouping). A part 2 choice is also
+compared with the participant's part 1 record (participant.p1) for the switching counts.
+
+The counters are kept in memory by the server process and persisted in session.live_counts:
+at most every PERSIST_SECONDS during the choices, and when the last group of a part is resolved
+on its ResultsWaitPage, where settle() recounts the part exactly from the records stored for
+all participants. After a restart the counters resume from the last persisted state. Once part 2
+is settled the session is finished: its counters leave the memory, and its reports read the
+persisted state.
+
+The admin report (vars_for_admin_report of both apps) reads the counters only. Its page
+(_templates/global/live_report.html) then polls /live/<session code> every POLL_SECONDS, a small
+admin view (install()) that returns the counters' tables as JSON, so the rest of the report
+(part_one's group formation table, the timings) is not rendered again.
+"""
+
+import threading
+import time
+
+from shared.rng import PART_ONE, PART_TWO
+from shared.scenarios import scenario_table
+from shared.summary import CHARACTERS, ROLES, TREATMENTS
+
+
+PERSIST_SECONDS = 10
+# The admin report fetches the counters this often (one session row, no player query)
+POLL_SECONDS = 10
+
+ROLE_LABELS = {"Just World": "JW", "Elite": "E", "Non Elite": "NE"}
+ARMS = ["T0", "T1 Samantha", "T1 Daniel", "T2"]
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def arm(treatment, character):
+    return "{} {}".format(treatment, character) if character else treatment
+
+
+class Counters:
+    """
+    choices[(part, role, arm)] = [n, risky in scenario 1, ..., risky in scenario S]
+    switches[(role, arm)] = [n, to risky in scenario 1..S, to safe in scenario 1..S]
+    arm is "" for part 1.
+    """
+
+    def __init__(self, num_scenarios, state=None):
+        self.num_scenarios = num_scenarios
+        self.choices = {}
+        self.switches = {}
+        self.persisted = 0.0
+        if state and state["num_scenarios"] == num_scenarios:
+            self.choices = {key: list(counts) for key, counts in state["choices"].items()}
+            self.switches = {key: list(counts) for key, counts in state["switches"].items()}
+
+    def add_choice(self, part, role, arm, bits):
+        counts = self.choices.setdefault((part, role, arm), [0] * (1 + self.num_scenarios))
+        counts[0] += 1
+        for i in range(self.num_scenarios):
+            if bits >> i & 1:
+                counts[1 + i] += 1
+
+    def add_switch(self, role, arm, bits_one, bits_two):
+        num_scenarios = self.num_scenarios
+        counts = self.switches.setdefault((role, arm), [0] * (1 + 2 * num_scenarios))
+        counts[0] += 1
+        for i in range(num_scenarios):
+            if bits_two >> i & 1 and not bits_one >> i & 1:
+                counts[1 + i] += 1
+            elif bits_one >> i & 1 and not bits_two >> i & 1:
+                counts[1 + num_scenarios + i] += 1
+
+    def state(self):
+        return dict(num_scenarios=self.num_scenarios, choices=dict(self.choices), switches=dict(self.switches))
+
+
+def _session_counters(session):
+    counters = _counters.get(session.code)
+    if counters is None:
+        # First use in this process: resume from the persisted state.
+        # session._vars, not session.vars, which would save the vars again.
+        counters = Counters(len(scenario_table(session)), session._vars.get("live_counts"))
+        _counters[session.code] = counters
+    return counters
+
+
+def _current(session):
+    """The counters in memory, else the persisted state without keeping it (finished sessions)."""
+    counters = _counters.get(session.code)
+    if counters is None:
+        counters = Counters(len(scenario_table(session)), session._vars.get("live_counts"))
+    return counters
+
+
+def _persist(session, counters):
+    session.live_counts = counters.state()
+    counters.persisted = time.monotonic()
+
+
+def count_choice(player, part):
+    """Add a submitted Choices page (Choices.before_next_page of part_one / part_two)."""
+    session = player.session
+    participant = player.participant
+    with _lock:
+        counters = _session_counters(session)
+        if part == PART_ONE:
+            counters.add_choice(PART_ONE, player.role, "", player.risk_bits)
+        else:
+            group = player.group
+            player_arm = arm(group.t_groups, group.field_maybe_none("character_random"))
+            counters.add_choice(PART_TWO, participant.c_role, player_arm, player.risk_bits)
+            counters.add_switch(participant.c_role, player_arm, participant._vars["p1"]["risk_bits"], player.risk_bits)
+
+        if time.monotonic() - counters.persisted >= PERSIST_SECONDS:
+            _persist(session, counters)
+
+
+def settle(session, part):
+    """
+    Recount one part exactly from the records of the participants (shared/summary.py)
+    and persist it (after_all_players_arrive of the part's ResultsWaitPage, last group).
+    """
+    participants = session.get_participants()
+    if part == PART_ONE:
+        records = [participant._vars["p1"] for participant in participants if "p1" in participant._vars]
+    else:
+        records = [(participant._vars["p1"], participant._vars["p2"]) for participant in participants
+                   if "p2" in participant._vars]
+    with _lock:
+        counters = _session_counters(session)
+        counters.choices = {key: counts for key, counts in counters.choices.items() if key[0] != part}
+        if part == PART_ONE:
+            for p1 in records:
+                counters.add_choice(PART_ONE, ROLES[p1["role"]], "", p1["risk_bits"])
+        else:
+            counters.switches = {}
+            for p1, p2 in records:
+                record_arm = arm(TREATMENTS[p2["treatment"]], CHARACTERS[p2["character"]])
+                counters.add_choice(PART_TWO, ROLES[p2["role"]], record_arm, p2["risk_bits"])
+                counters.add_switch(ROLES[p2["role"]], record_arm, p1["risk_bits"], p2["risk_bits"])
+        _persist(session, counters)
+        if part == PART_TWO:
+            # The last choices of the session are counted
+            del _counters[session.code]
+
+
+###############################################################################################
+##  Admin report
+###############################################################################################
+
+
+def _percent(count, n):
+    return "{:.0f}%".format(100 * count / n) if n else "-"
+
+
+def _sum(rows):
+    total = None
+    for counts in rows:
+        total = list(counts) if total is None else [a + b for a, b in zip(total, counts)]
+    return total
+
+
+def _marginals(table, label, key_role, key_arm, arms):
+    """Rows by role, by arm and overall, summed over the counters (not over the players)."""
+    groups = [("{} {}".format(label, ROLE_LABELS[role]), lambda key, role=role: key_role(key) == role)
+              for role in ROLES]
+    groups += [("{} {}".format(label, name), lambda key, name=name: key_arm(key) == name) for name in arms]
+    groups.append(("{} all".format(label), lambda key: True))
+
+    rows = []
+    for name, selected in groups:
+        total = _sum(counts for key, counts in table.items() if selected(key))
+        if total is not None:
+            rows.append((name, total))
+    return rows
+
+
+def _report(counters):
+    num_scenarios = counters.num_scenarios
+    choice_rows = []
+    for part, label, arms in [(PART_ONE, "Part 1", []), (PART_TWO, "Part 2", ARMS)]:
+        table = {key: counts for key, counts in counters.choices.items() if key[0] == part}
+        for name, (n, *risky) in _marginals(table, label, lambda key: key[1], lambda key: key[2], arms):
+            choice_rows.append(dict(label=name, n=n, cells=[_percent(count, n) for count in risky]))
+
+    switch_rows = []
+    for name, (n, *counts) in _marginals(counters.switches, "p1 -> p2", lambda key: key[0], lambda key: key[1], ARMS):
+        to_risky, to_safe = counts[:num_scenarios], counts[num_scenarios:]
+        switch_rows.append(dict(
+            label=name, n=n, rate=_percent(sum(counts), n * num_scenarios),
+            cells=["{} / {}".format(_percent(a, n), _percent(b, n)) for a, b in zip(to_risky, to_safe)],
+        ))
+    return dict(live_scenarios=list(range(1, num_scenarios + 1)),
+                live_choice_rows=choice_rows, live_switch_rows=switch_rows)
+
+
+def counts(session):
+    """The counters' tables of the session."""
+    with _lock:
+        return _report(_current(session))
+
+
+def report(session):
+    """vars_for_admin_report: the current counters, no query on the player tables."""
+    return dict(**counts(session), live_url="/live/{}".format(session.code), live_poll_ms=POLL_SECONDS * 1000)
+
+
+def install():
+    """The /live/<code> counters of the admin report (called when the apps are imported)."""
+    from otree.channels.routing import websocket_routes
+    from otree.models import Session
+    from otree.views.cbv import AdminView
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+
+    class LiveCounts(AdminView):
+        def get(self, request, code):
+            session = Session.objects_first(code=code)
+            if session is None:
+                return Response(status_code=404)
+            return JSONResponse(counts(session))
+
+    # The apps are imported before oTree builds its routes from websocket_routes (otree/urls.py),
+    # which also sets the admin login requirement of the views by class name
+    websocket_routes.append(Route("/live/{code}", LiveCounts, name="LiveCounts"))
+
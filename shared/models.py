@@ -0,0 +1,33 @@
+"""
+Database tables of the background jobs (shared/jobs.py), in the database the web and worker
+processes share: the queue with the state, progress and result of every job, and the heartbeat
+of the worker. The result files themselves are on disk (JOBS_DIR), the rows only name them.
+
+They are oTree ExtraModels without links, created with oTree's own tables (shared_job,
+shared_worker) because part_one_intro imports this module through shared.install(). They live
+apart from shared/jobs.py so that `python -m shared.jobs` does not define them a second time.
+"""
+
+from otree.api import ExtraModel, models
+
+
+class Job(ExtraModel):
+    kind = models.StringField()
+    # JSON object of the parameters, all strings
+    params = models.LongStringField()
+    state = models.StringField()
+    created = models.FloatField()
+    started = models.FloatField()
+    finished = models.FloatField()
+    done = models.IntegerField()
+    total = models.IntegerField()
+    message = models.LongStringField()
+    cancel_requested = models.BooleanField()
+    # File name of the result and its path in JOBS_DIR (settings.py), set when the job is done
+    result = models.StringField()
+    path = models.StringField()
+
+
+class Worker(ExtraModel):
+    # Last sign of life of a worker process (time.time())
+    seen = models.FloatField()
@@ -0,0 +1,198 @@
+"""
+Bulk payment file: the payments of all sessions of a session config (e.g. a week of
+my_experiment) in one CSV, instead of the payments page of every session.
+
+    python -m shared.payments payments.csv [--session-config my_experiment] [--since 2026-10-12]
+                              [--until 2026-10-19] [--room econ101] [--database-url URL]
+
+The amount of a participant is computed like oTree's payments page: the tokens of part one and
+part two (the participant.p1 / participant.p2 records, shared/summary.py) converted with
+the session's real_world_currency_per_point, rounded to the currency, plus the session's
+participation_fee. Only participants who have started (visited) are paid. Rows of the file:
+
+    kind         participant, session (subtotal after the session's participants),
+                 label (total per room label over all sessions), total
+    session_code, session_label, session_created, participant_label, participant_code,
+    participants, tokens, payoff, participation_fee, amount
+
+The participants are streamed from the database session by session, in batches, so memory
+stays bounded: only the session list and the totals per label are kept. Labels
+that are missing or not in the room's participant_label_file (settings.ROOMS) are reported at
+the end, they cannot be matched to a person.
+"""
+
+import argparse
+import csv
+import sys
+import time
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from otree import settings as otree_settings
+from sqlalchemy import create_engine, text
+
+from settings import ROOMS
+from shared.export import decode_vars, default_database_url
+
+
+# Sessions per participant query: keeps the bound parameters below SQLite's limit
+SESSIONS_PER_QUERY = 500
+# The currency's places as oTree rounds them (settings.py or the default of the currency)
+CENT = Decimal(1).scaleb(-otree_settings.REAL_WORLD_CURRENCY_DECIMAL_PLACES)
+NO_LABEL = "(no label)"
+
+COLUMNS = ["kind", "session_code", "session_label", "session_created", "participant_label", "participant_code",
+           "participants", "tokens", "payoff", "participation_fee", "amount"]
+
+
+def currency(value):
+    # As RealWorldCurrency: from the float value, rounded half up (a RealWorldCurrency as is)
+    value = Decimal(value) if isinstance(value, Decimal) else Decimal.from_float(float(value))
+    return value.quantize(CENT, ROUND_HALF_UP)
+
+
+def room_labels(room_name):
+    room = next(room for room in ROOMS if room["name"] == room_name)
+    with open(room["participant_label_file"], encoding="utf-8") as fp:
+        return {line.strip() for line in fp if line.strip()}
+
+
+def sessions(engine, session_config, since=None, until=None):
+    """(id, code, label, created, config) of the config's sessions, oldest first."""
+    found = []
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, code, label, _created, config, is_demo FROM otree_session ORDER BY id"))
+        for session_id, code, label, created, config, is_demo in rows:
+            if is_demo or (since is not None and created < since) or (until is not None and created >= until):
+                continue
+            config = decode_vars(config)
+            if config.get("name") == session_config:
+                found.append((session_id, code, label or "", created, config))
+    return found
+
+
+def stream_payable(engine, session_ids, batch_size=1000):
+    """Yield (session_id, code, label, tokens) of the participants who have started, session by session."""
+    for start in range(0, len(session_ids), SESSIONS_PER_QUERY):
+        chunk = session_ids[start:start + SESSIONS_PER_QUERY]
+        query = text("SELECT session_id, code, label, _vars FROM otree_participant "
+                     "WHERE visited AND session_id IN ({}) ORDER BY session_id, id".format(
+                         ", ".join(":s{}".format(i) for i in range(len(chunk)))))
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(
+                query, **{"s{}".format(i): session_id for i, session_id in enumerate(chunk)})
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                for session_id, code, label, vars in rows:
+                    vars = decode_vars(vars)
+                    tokens = sum(vars[part]["payoff"] for part in ("p1", "p2") if vars.get(part) is not None)
+                    yield session_id, code, label, tokens
+
+
+class Totals:
+    __slots__ = ("participants", "tokens", "payoff", "participation_fee", "amount")
+
+    def __init__(self):
+        self.participants = 0
+        self.tokens = 0
+        self.payoff = self.participation_fee = self.amount = Decimal(0)
+
+    def add(self, participants, tokens, payoff, participation_fee, amount):
+        self.participants += participants
+        self.tokens += tokens
+        self.payoff += payoff
+        self.participation_fee += participation_fee
+        self.amount += amount
+
+    def columns(self):
+        return [self.participants, self.tokens, self.payoff, self.participation_fee, self.amount]
+
+
+def write_payments(writer, engine, selected, known_labels=None, progress=None):
+    """
+    Write the rows for the selected sessions (sessions()); returns (total, unknown labels).
+    progress(sessions done, sessions) is called at every session (shared/jobs.py).
+    """
+    by_id = {session[0]: session for session in selected}
+    by_label = defaultdict(Totals)
+    total = Totals()
+    sessions_done = 0
+    unknown = defaultdict(list)
+    current = None
+    subtotal = None
+
+    def session_columns(session):
+        _, code, label, created, _ = session
+        return [code, label, time.strftime("%Y-%m-%d %H:%M", time.localtime(created))]
+
+    def close_session():
+        if current is not None:
+            writer.writerow(["session"] + session_columns(current) + ["", ""] + subtotal.columns())
+
+    for session_id, code, label, tokens in stream_payable(engine, [session[0] for session in selected]):
+        if current is None or current[0] != session_id:
+            close_session()
+            if progress is not None:
+                progress(sessions_done, len(selected))
+            sessions_done += 1
+            current = by_id[session_id]
+            config = current[4]
+            rate = config["real_world_currency_per_point"]
+            fee = currency(config["participation_fee"])
+            subtotal = Totals()
+
+        payoff = currency(tokens * rate)
+        amount = fee + payoff
+        values = (1, tokens, payoff, fee, amount)
+        writer.writerow(["participant"] + session_columns(current) + [label or "", code] + list(values))
+        subtotal.add(*values)
+        total.add(*values)
+        by_label[label or NO_LABEL].add(*values)
+        if not label or (known_labels is not None and label not in known_labels):
+            unknown[label or NO_LABEL].append(code)
+    close_session()
+
+    for label in sorted(by_label):
+        writer.writerow(["label", "", "", "", label, ""] + by_label[label].columns())
+    writer.writerow(["total", "", "", "", "", ""] + total.columns())
+    return total, unknown
+
+
+def _date(text):
+    return time.mktime(time.strptime(text, "%Y-%m-%d"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="CSV file, or - for stdout")
+    parser.add_argument("--session-config", default="my_experiment")
+    parser.add_argument("--since", type=_date, help="sessions created from YYYY-MM-DD (local time)")
+    parser.add_argument("--until", type=_date, help="sessions created before YYYY-MM-DD (local time)")
+    parser.add_argument("--room", default="econ101", help="room whose participant labels are expected")
+    parser.add_argument("--database-url", default=default_database_url())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = create_engine(args.database_url)
+    selected = sessions(engine, args.session_config, args.since, args.until)
+    known_labels = room_labels(args.room) if args.room else None
+
+    fp = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        writer = csv.writer(fp)
+        writer.writerow(COLUMNS)
+        total, unknown = write_payments(writer, engine, selected, known_labels)
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+    print("{} sessions, {} participants, {} tokens, total {} in {:.1f} s".format(
+        len(selected), total.participants, total.tokens, total.amount, time.perf_counter() - start), file=sys.stderr)
+    for label, codes in sorted(unknown.items()):
+        print("label {!r} not in room {}: participants {}".format(label, args.room, ", ".join(codes)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
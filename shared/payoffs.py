@@ -0,0 +1,168 @@
+"""
+Payoff engine used by the ResultsWaitPage of part_one and part_two.
+
+The choices of the groups to resolve are collected into a single boolean matrix of shape
+(groups, 3, scenarios). The roles follow the order of the players inside the group (index 0 =
+JW, 1 = E, 2 = NE), exactly as the wait pages assigned them before. Scenario draws, lottery
+draws and payoffs are then computed for all of them in one batch: one group on the wait pages,
+which resolve every group as soon as it is complete, whole sessions in the replay and the
+simulator.
+
+The draws come either from one generator for the whole batch, or from one generator per group
+(the seeded streams of shared/rng.py, which make every group's draws reproducible). With the
+group streams, resolving the groups one at a time gives exactly the draws and payoffs of one
+batch over the subsession (shared/test_payoffs.py). The wait pages therefore keep resolving per
+group instead of waiting for all groups: a subsession-wide batch would hold every participant
+until the slowest one arrives, for the same result.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+from otree.api import cu
+
+from shared.bulk import DirectWrites
+from shared.scenarios import decode_matrix
+
+
+# Position of each role inside a group (player.id_in_group - 1)
+JW = 0
+E = 1
+NE = 2
+
+RISKY_STR = "Risky Lottery"
+SAFE_STR = "Safe Option"
+EMPTY_STR = " "
+
+
+class Resolution(NamedTuple):
+    # All arrays have shape (groups, 3)
+    scenario_random: np.ndarray     # drawn scenario, 1-based as stored on the player
+    risk_random: np.ndarray         # choice of the participant in the drawn scenario
+    plays_lottery: np.ndarray       # True if the lottery is realized (risky choice or NE)
+    lottery_random: np.ndarray      # lottery outcome, only meaningful where plays_lottery
+    payoff: np.ndarray
+
+
+def resolve(choices, safe_options, endowment, lottery_outcomes, rng=None):
+    """
+    Resolve the payoffs of all groups at once.
+
+    choices: bool array (groups, 3, scenarios), True = risky lottery chosen.
+    safe_options: loss of the safe option per scenario.
+    lottery_outcomes: possible losses of the risky lottery, drawn with equal probability.
+    rng: a numpy Generator for all groups, or a list with one Generator per group.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    choices = np.asarray(choices, dtype=bool)
+    num_groups, group_size, num_scenarios = choices.shape
+    lottery_outcomes = np.asarray([int(x) for x in lottery_outcomes])
+    safe_options = np.asarray([int(x) for x in safe_options])
+
+    # First, select a random scenario for payment (and the lottery index, used below)
+    scenario_random, lottery_index = _draw(rng, num_groups, group_size, num_scenarios, len(lottery_outcomes))
+    risk_random = np.take_along_axis(choices, scenario_random[..., None] - 1, axis=2)[..., 0]
+
+    # Second, JW and E realize the option they chose, NE ALWAYS play the lottery
+    plays_lottery = risk_random.copy()
+    plays_lottery[:, NE] = True
+
+    # Last, draw the lottery and compute the payoffs
+    lottery_random = lottery_outcomes[lottery_index]
+    loss = np.where(plays_lottery, lottery_random, safe_options[scenario_random - 1])
+    payoff = int(endowment) - loss
+
+    return Resolution(scenario_random, risk_random, plays_lottery, lottery_random, payoff)
+
+
+def _draw(rng, num_groups, group_size, num_scenarios, num_outcomes):
+    shape = (num_groups, group_size)
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(1, num_scenarios + 1, size=shape), rng.integers(0, num_outcomes, size=shape)
+
+    # One stream per group: scenarios first, then lotteries, as from the shared generator
+    if len(rng) != num_groups:
+        raise ValueError("expected {} group streams, got {}".format(num_groups, len(rng)))
+    scenario_random = np.empty(shape, dtype=np.int64)
+    lottery_index = np.empty(shape, dtype=np.int64)
+    for g, group_rng in enumerate(rng):
+        scenario_random[g] = group_rng.integers(1, num_scenarios + 1, size=group_size)
+        lottery_index[g] = group_rng.integers(0, num_outcomes, size=group_size)
+    return scenario_random, lottery_index
+
+
+def choice_matrix(players, num_scenarios):
+    """Decode the risk_bits of every player into a (groups, 3, scenarios) bool matrix."""
+    return decode_matrix([[p.risk_bits for p in group_players] for group_players in players], num_scenarios)
+
+
+def resolve_groups(groups, C, safe_options, rng=None, batch=None):
+    """
+    Resolve and store the payoff variables of all players of the given groups.
+    safe_options is the session's scenario table (shared/scenarios.py).
+    batch: a shared.bulk.WriteBatch collecting the writes, by default they are set directly.
+    Returns the players as a list of lists (one list per group) together with the resolution,
+    so that the calling app can store whatever it needs at the participant level.
+    """
+    players = [group.get_players() for group in groups]
+    res = resolve(
+        choice_matrix(players, len(safe_options)),
+        safe_options, C.ENDOWMENT, [C.RISK_LOW, C.RISK_HIGH], rng,
+    )
+
+    # Converting the whole arrays once is much cheaper than indexing numpy scalars per field
+    scenario_random = res.scenario_random.tolist()
+    risk_random = res.risk_random.tolist()
+    plays_lottery = res.plays_lottery.tolist()
+    lottery_random = res.lottery_random.tolist()
+    payoff = res.payoff.tolist()
+
+    # Only a handful of distinct values exist, so build the currencies and strings once
+    safe_str = [str(x) for x in safe_options]
+    currencies = {}
+    for value in set(res.payoff.flat) | set(res.lottery_random.flat):
+        currencies[int(value)] = cu(int(value))
+    lottery_str = {value: str(currency) for value, currency in currencies.items()}
+
+    if batch is None:
+        batch = DirectWrites()
+
+    for g, group_players in enumerate(players):
+        for i, p in enumerate(group_players):
+            risky = risk_random[g][i]
+            scenario = scenario_random[g][i]
+            fields = dict(scenario_random=scenario, risk_random=risky)
+
+            # Define results as strings --> for convenience while writing results template
+            if risky:
+                fields.update(risk_random_str=RISKY_STR, safe_random_str=EMPTY_STR)
+            else:
+                fields.update(risk_random_str=SAFE_STR, safe_random_str=safe_str[scenario - 1])
+
+            if i == NE:
+                fields.update(safe_random_str=EMPTY_STR)
+
+            if plays_lottery[g][i]:
+                fields.update(lottery_random=currencies[lottery_random[g][i]],
+                              lottery_random_str=lottery_str[lottery_random[g][i]])
+            else:
+                fields.update(lottery_random_str=EMPTY_STR)
+
+            batch.set(p, **fields)
+            batch.set_payoff(p, currencies[payoff[g][i]])
+
+    return players, res
+
+
+
+def last_group_resolved(session, part, players):
+    """
+    Count the players of a group resolved on the ResultsWaitPage of part; True for the group
+    that completes the part for all participants of the session (session-wide follow-ups).
+    """
+    resolved = dict(session._vars.get("resolved_players") or {})
+    resolved[part] = resolved.get(part, 0) + len(players)
+    session.resolved_players = resolved
+    return resolved[part] >= session.num_participants
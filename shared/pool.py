@@ -0,0 +1,234 @@
+"""
+Pre-warmed sessions for rooms: the worker process creates the sessions of SESSION_POOLS
+(settings.py) ahead of time, and the admin opens the room with a ready one.
+
+Creating a large session (participants, players, creating_session of every app) takes a while,
+and in the lab it happens while the room is already full. With a pool, e.g.
+
+    SESSION_POOLS = [dict(room="econ101", session_config="my_experiment", size=1, max_age_hours=24)]
+
+the worker keeps `size` sessions of the config ready: created with the normal create_session,
+archived (hidden from the session list) and labelled POOL_LABEL. num_participants defaults to
+the number of the room's labels, rounded down to whole groups. The participants are not
+labelled in advance: oTree gives the labels out on arrival, as in a new session, so the
+participants who show up fill the first seats and groups.
+
+Claiming is an explicit action, nothing in oTree's session creation is replaced: the admin page
+/pools lists the pools with their ready sessions and opens an empty room with the oldest one
+("Open the room"), or from the command line
+
+    python -m shared.pool --claim econ101 [--label LABEL]
+
+The claim is one conditional UPDATE of the session's label, so two admins never get the same
+session. Its creation time (Session._created, read by shared.payments --since/--until) is set to
+the claim, and it is put in the room. Creating a session on oTree's own room page (or over the
+REST API) still creates a new one, e.g. with another config or when the pool is empty.
+
+Pooled sessions older than max_age_hours, or created with a config that has changed since, are
+deleted by the worker.
+
+    python -m shared.pool [--once] [--interval 30]
+
+refills the pools alone; the worker process (shared/worker.py, the Procfile's worker) refills
+them between its background jobs. The /pools page is added by shared.install().
+"""
+
+import argparse
+import json
+import time
+from urllib.parse import urlencode
+
+import otree.session
+from otree.database import db, session_scope
+from otree.models import Session
+from otree.room import ROOM_DICT
+from otree.session import SESSION_CONFIGS_DICT
+
+from settings import SESSION_POOLS
+from shared.shards import owns_room
+
+
+POOL_LABEL = "pool:{}"
+MAX_AGE_HOURS = 24
+
+
+def _fingerprint(config):
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class Pool:
+    def __init__(self, room, session_config, size=1, num_participants=None, max_age_hours=MAX_AGE_HOURS):
+        self.room = ROOM_DICT[room]
+        self.config_name = session_config
+        self.config = SESSION_CONFIGS_DICT[session_config]
+        self.size = size
+        self.max_age = max_age_hours * 3600
+        labels = self.room.get_participant_labels() if self.room.has_participant_labels else []
+
+        if num_participants is None:
+            if not labels:
+                raise ValueError("SESSION_POOLS: room {} has no participant labels, set num_participants".format(room))
+            lcm = self.config.get_lcm()
+            num_participants = len(labels) // lcm * lcm
+        self.num_participants = num_participants
+        self.label = POOL_LABEL.format(room)
+
+    def is_current(self, session, now):
+        pool = session._vars.get("pool") or {}
+        return (session.num_participants == self.num_participants
+                and pool.get("fingerprint") == _fingerprint(self.config)
+                and now - pool.get("created", 0) < self.max_age)
+
+    def pooled(self):
+        return Session.objects_filter(label=self.label).order_by(Session.id).all()
+
+    def create(self):
+        session = otree.session.create_session(self.config_name, num_participants=self.num_participants,
+                                               label=self.label)
+        session.archived = True
+        session.pool = dict(created=time.time(), fingerprint=_fingerprint(self.config))
+        db.commit()
+        return session
+
+    def ready(self):
+        now = time.time()
+        return sum(self.is_current(session, now) for session in self.pooled())
+
+    def claim(self, label):
+        now = time.time()
+        for session in self.pooled():
+            if not self.is_current(session, now):
+                continue
+            # The session counts as created now (payments by date, session list)
+            created = int(now)
+            claimed = Session.objects_filter(id=session.id, label=self.label).update(
+                {Session.label: label, Session.archived: False, Session._created: created},
+                synchronize_session=False)
+            if claimed:
+                session.label = label
+                session.archived = False
+                session._created = created
+                self.room.set_session(session)
+                db.commit()
+                return session
+        return None
+
+    def refill(self):
+        """Delete expired pooled sessions and create the missing ones; returns (created, deleted)."""
+        now = time.time()
+        expired = [session.id for session in self.pooled() if not self.is_current(session, now)]
+        if expired:
+            Session.objects_filter(Session.id.in_(expired)).delete(synchronize_session=False)
+            db.commit()
+
+        missing = self.size - len(self.pooled())
+        for _ in range(missing):
+            self.create()
+        return max(missing, 0), len(expired)
+
+
+_pools = None
+
+
+def pools():
+    # Built on first use: the number of participants needs the apps' constants. In the sharded
+    # mode only the rooms of this shard
+    global _pools
+    if _pools is None:
+        _pools = {pool["room"]: Pool(**pool) for pool in SESSION_POOLS if owns_room(pool["room"])}
+    return _pools
+
+
+###############################################################################################
+##  Hand-over
+###############################################################################################
+
+
+def claim(room_name, label=""):
+    """Open the room with the oldest ready session of its pool; None if there is none."""
+    pool = pools().get(room_name)
+    if pool is None:
+        raise ValueError("room {} has no session pool in SESSION_POOLS (on this shard)".format(room_name))
+    if pool.room.has_session():
+        raise ValueError("room {} has a session, close it first".format(room_name))
+    return pool.claim(label)
+
+
+def install():
+    """The /pools admin page (called when the apps are imported)."""
+    from otree.channels.routing import websocket_routes
+    from otree.views.cbv import AdminView
+    from starlette.responses import RedirectResponse
+    from starlette.routing import Route
+
+    class Pools(AdminView):
+        def get_template_name(self):
+            return "global/Pools.html"
+
+        def vars_for_template(self):
+            return dict(pools=[
+                dict(room=room, config=pool.config_name, participants=pool.num_participants, size=pool.size,
+                     ready=pool.ready(), room_has_session=pool.room.has_session())
+                for room, pool in pools().items()
+            ], error=self.request.query_params.get("error", ""))
+
+        def post(self, request):
+            data = self.get_post_data()
+            room = data.get("room", "")
+            try:
+                session = claim(room, data.get("label", "").strip())
+            except ValueError as error:
+                return self.redirect_error(str(error))
+            if session is None:
+                return self.redirect_error("room {}: no ready session in the pool".format(room))
+            return self.redirect("RoomWithSession", room_name=room)
+
+        def redirect_error(self, message):
+            return RedirectResponse("{}?{}".format(self.request.url_for("Pools"), urlencode(dict(error=message))),
+                                    status_code=302)
+
+    # The apps are imported before oTree builds its routes from websocket_routes (otree/urls.py),
+    # which also sets the admin login requirement of the views by class name
+    websocket_routes.append(Route("/pools", Pools, name="Pools"))
+
+
+###############################################################################################
+##  Worker
+###############################################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="refill the pools once and exit")
+    parser.add_argument("--interval", type=float, default=30, help="seconds between refills")
+    parser.add_argument("--claim", metavar="ROOM", help="open the room with a ready pooled session and exit")
+    parser.add_argument("--label", default="", help="label of the claimed session")
+    args = parser.parse_args()
+
+    from otree.main import setup
+    setup()
+
+    if args.claim:
+        with session_scope():
+            try:
+                session = claim(args.claim, args.label)
+            except ValueError as error:
+                raise SystemExit(error)
+            if session is None:
+                raise SystemExit("room {}: no ready session in the pool".format(args.claim))
+            print("Room {}: session {}".format(args.claim, session.code))
+        return
+
+    while True:
+        for room, pool in pools().items():
+            with session_scope():
+                created, deleted = pool.refill()
+            if created or deleted:
+                print("{}: {} pooled session(s) created, {} expired deleted".format(room, created, deleted), flush=True)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
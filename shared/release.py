@@ -0,0 +1,183 @@
+"""
+Batched release of the wait pages: the websocket notification that sends the waiting browsers
+on to the next page.
+
+oTree notifies the browsers of every completed group right away, from inside the request that
+completed it: the sends run while that request holds the global view lock, every group of
+part_one.Waiting_for_Others is its own fan-out, and all the browsers of a session reload at
+the same moment after the ResultsWaitPages. Wait pages that subclass ReleaseWaitPage hand the
+notification to the releaser on the server's event loop instead:
+
+- coalesce  the notifications of one session and page within wait_page_coalesce_ms (session
+            config) are one release; a browser of several completed groups gets one message
+- stagger   the browsers of a release are notified in slices spread over wait_page_stagger_ms,
+            in the order the groups completed and the browsers connected (longest waiting
+            first), so the page after the barrier is not requested by all of them at once.
+            0 = all at once
+- stats     per release: groups, browsers notified, the delay until the first message and the
+            fan-out time until the last one, kept in a ring buffer of this server process and
+            shown in the admin report (release_report())
+
+oTree stores the completion of the wait page as before, so a browser that connects or reloads
+meanwhile is released by oTree itself. Pages run on a worker thread; the loop is taken in the
+page's dispatch(), which runs on it, and a notification without one goes through oTree's own
+send. The releaser is installed by shared.install().
+
+This relies on private oTree internals, checked with 6.0.15 (the pin in requirements.txt):
+WaitPage._mark_completed_and_notify, channel_layer._get_sockets and the module-level
+channel_utils.sync_group_send that install() replaces.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import otree.channels.utils as channel_utils
+from otree.common2 import json_dumps
+
+from shared.timing import TimedWaitPage
+
+
+RING_SIZE = 10000
+# Shortest interval between two slices of a staggered release
+SLICE_SECONDS = 0.01
+
+Release = namedtuple("Release", ["session_code", "page", "groups", "clients", "stagger", "delay", "seconds"])
+
+releases = deque(maxlen=RING_SIZE)
+
+# The release of the wait page whose request is running on this thread
+_local = threading.local()
+_send = channel_utils.sync_group_send
+
+
+class Batch:
+    """The notifications of one session and page collected within the coalescing window."""
+
+    __slots__ = ("session_code", "page", "data", "stagger", "notified", "groups")
+
+    def __init__(self, session_code, page, data, stagger, notified):
+        self.session_code = session_code
+        self.page = page
+        self.data = data
+        self.stagger = stagger
+        self.notified = notified
+        self.groups = []
+
+
+class Releaser:
+    """Collects the notifications and sends them; runs on the event loop only."""
+
+    def __init__(self):
+        self.pending = {}
+
+    def add(self, channel_group, data, session_code, page, coalesce, stagger, notified):
+        key = (session_code, page)
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = Batch(session_code, page, data, stagger, notified)
+            asyncio.get_running_loop().call_later(coalesce, self._start, key)
+        if channel_group not in batch.groups:
+            batch.groups.append(channel_group)
+
+    def _start(self, key):
+        asyncio.ensure_future(self.release(self.pending.pop(key)))
+
+    async def release(self, batch):
+        # Channel groups keep their sockets in connection order
+        sockets = {}
+        for channel_group in batch.groups:
+            for socket in channel_utils.channel_layer._get_sockets(channel_group):
+                sockets.setdefault(id(socket), socket)
+        sockets = list(sockets.values())
+        text = json_dumps(batch.data)
+
+        slices = max(1, min(len(sockets), int(batch.stagger / SLICE_SECONDS)))
+        start = time.perf_counter()
+        for i in range(slices):
+            part = sockets[i * len(sockets) // slices:(i + 1) * len(sockets) // slices]
+            await asyncio.gather(*(socket.send_text(text) for socket in part), return_exceptions=True)
+            if i + 1 < slices:
+                await asyncio.sleep(max(0.0, start + (i + 1) * batch.stagger / slices - time.perf_counter()))
+        releases.append(Release(batch.session_code, batch.page, len(batch.groups), len(sockets), batch.stagger,
+                                start - batch.notified, time.perf_counter() - batch.notified))
+
+
+releaser = Releaser()
+
+
+def sync_group_send(*, group, data):
+    """Replaces oTree's channel_utils.sync_group_send: notifications of a ReleaseWaitPage go to the releaser."""
+    release = getattr(_local, "release", None)
+    if release is not None:
+        loop, args = release
+        try:
+            loop.call_soon_threadsafe(releaser.add, group, data, *args)
+            return
+        except RuntimeError:
+            # The loop has stopped (bots)
+            pass
+    _send(group=group, data=data)
+
+
+class ReleaseWaitPage(TimedWaitPage):
+    _event_loop = None
+
+    async def dispatch(self):
+        # On the event loop; the page itself runs on a worker thread (run_in_threadpool)
+        self._event_loop = asyncio.get_running_loop()
+        await super().dispatch()
+
+    def _mark_completed_and_notify(self, group):
+        if self._event_loop is None:
+            return super()._mark_completed_and_notify(group)
+        # Arguments of Releaser.add after the channel group and data
+        config = self.session.config
+        page = "{}.{} #{}".format(type(self).__module__, type(self).__name__, self._index_in_pages)
+        _local.release = (self._event_loop, (self.participant._session_code, page,
+                                             config.get("wait_page_coalesce_ms", 0) / 1000,
+                                             config.get("wait_page_stagger_ms", 0) / 1000, time.perf_counter()))
+        try:
+            super()._mark_completed_and_notify(group)
+        finally:
+            _local.release = None
+
+
+def install():
+    """Route the notifications of the wait pages through the releaser (called when the apps are imported)."""
+    channel_utils.sync_group_send = sync_group_send
+
+
+###############################################################################################
+##  Admin report
+###############################################################################################
+
+
+def _ms(seconds):
+    return "{:.1f}".format(seconds * 1000)
+
+
+def release_report(session_code, prefix=""):
+    """Every release of the session's pages whose name starts with prefix, and percentiles per page."""
+    rows = [release for release in list(releases)
+            if release.session_code == session_code and release.page.startswith(prefix)]
+    by_page = {}
+    for release in rows:
+        by_page.setdefault(release.page, []).append(release)
+
+    summary = []
+    for page, page_rows in sorted(by_page.items()):
+        seconds = np.array([release.seconds for release in page_rows])
+        summary.append(dict(
+            page=page, n=len(page_rows), groups=sum(release.groups for release in page_rows),
+            clients=sum(release.clients for release in page_rows),
+            p50=_ms(np.percentile(seconds, 50)), p95=_ms(np.percentile(seconds, 95)), max=_ms(seconds.max()),
+        ))
+    return dict(
+        release_rows=[dict(page=release.page, groups=release.groups, clients=release.clients,
+                           stagger=_ms(release.stagger), delay=_ms(release.delay), seconds=_ms(release.seconds))
+                      for release in rows],
+        release_summary_rows=summary,
+    )
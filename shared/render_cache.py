@@ -0,0 +1,108 @@
+"""
+Render cache for pages whose HTML depends only on the session and a few fields of the player.
+
+Introduction, the instructions pages, Group_Assignment and End_Part_I render the same HTML for
+every participant who shares the same role, treatment and character. A page subclasses
+CachedPage and lists every field its templates read in cache_fields ("participant.c_role",
+"group.t_groups", ...). The page is then rendered once per key and served from memory:
+
+    (session, page and index, the session's scenario table, the values of cache_fields)
+
+The scenario table stands for vars_for_template of these pages (num_scenarios). The other
+inputs are the constants C, the same for the whole app. shared/test_render_cache.py reads the
+templates of every CachedPage, with their includes, and fails when one reads a participant,
+player or group field that is missing from cache_fields.
+
+The only participant-specific part of these pages is the participant code in the URLs, which
+is swapped in on every hit. The cache is bounded (least recently used entries are evicted) and
+is skipped in DEBUG mode, where oTree appends per-participant debug tables, and when the session
+config sets render_cache=False. It hooks oTree's Page.render_page (see requirements.txt).
+"""
+
+import threading
+from collections import OrderedDict
+
+from otree import settings
+from starlette.responses import HTMLResponse
+
+from shared.scenarios import scenario_table
+from shared.timing import TimedPage
+
+
+CODE_PLACEHOLDER = "\x00participant_code\x00"
+MAX_ENTRIES = 256
+
+
+class RenderCache:
+    def __init__(self, maxsize=MAX_ENTRIES):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # pages are rendered in starlette's thread pool
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = RenderCache()
+
+
+def field_value(player, path):
+    """Value of a cache field: participant.<var>, group.<field> or player.<field>."""
+    owner, name = path.split(".")
+    if owner == "participant":
+        # participant._vars, not participant.vars, which would mark all vars as changed
+        return player.participant._vars.get(name)
+    obj = player.group if owner == "group" else player
+    return obj.field_maybe_none(name)
+
+
+def cache_key(session_code, page_name, page_index, safe_options, fields):
+    return session_code, page_name, page_index, tuple(safe_options), tuple(fields)
+
+
+class CachedPage(TimedPage):
+    # Fields the templates read besides C and the scenario table, see above
+    cache_fields = []
+
+    def render_page(self, context):
+        session = self.session
+        if settings.DEBUG or not session.config.get("render_cache", True):
+            return super().render_page(context)
+
+        player = self.player
+        key = cache_key(session.code, "{}.{}".format(type(self).__module__, type(self).__name__),
+                        self._index_in_pages, scenario_table(session),
+                        [field_value(player, path) for path in self.cache_fields])
+
+        code = self.participant.code
+        html = cache.get(key)
+        if html is None:
+            response = super().render_page(context)
+            cache.put(key, response.body.decode("utf-8").replace(code, CODE_PLACEHOLDER))
+            return response
+        return HTMLResponse(html.replace(CODE_PLACEHOLDER, code))
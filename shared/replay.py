@@ -0,0 +1,169 @@
+"""
+Replay: recompute the payoff draws of finished sessions from their seed and the stored choices.
+
+Every group draws from its own stream of the session seed (shared/rng.py), so the scenario,
+lottery and payoff of every player can be recomputed without knowing in which order the groups
+were resolved. The replay reads the player tables of both parts for all sessions at once,
+recomputes all groups of a part in one batch per scenario table (shared.payoffs.resolve; the
+table comes from each session's config, shared/scenarios.py) and compares the result with what
+was stored:
+
+    python -m shared.replay [--session CODE] [--database-url URL]
+
+Exits with status 1 if any stored value differs. Sessions created before the seed was stored
+are skipped.
+"""
+
+import argparse
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import text
+
+from shared.export import decode_vars, default_database_url, get_engine
+from shared.payoffs import resolve
+from shared.rng import PART_ONE, PART_TWO, stream
+from shared.scenarios import DEFAULT_SCENARIOS, decode_matrix, parse_scenarios
+
+
+APPS = [("part_one", PART_ONE), ("part_two", PART_TWO)]
+GROUP_SIZE = 3
+
+
+class Mismatch(NamedTuple):
+    session_code: str
+    group: int
+    id_in_group: int
+    field: str
+    stored: int
+    replayed: int
+
+
+class Report(NamedTuple):
+    app: str
+    sessions: int
+    groups: int
+    skipped_sessions: int
+    mismatches: list
+    seconds: float
+
+
+def replay(seeds, part, group_numbers, choices, C, safe_options):
+    """Draws and payoffs of the given groups; seeds and group_numbers have one entry per group."""
+    rngs = [stream(seed, part, number) for seed, number in zip(seeds, group_numbers)]
+    return resolve(choices, safe_options, C.ENDOWMENT, [C.RISK_LOW, C.RISK_HIGH], rngs)
+
+
+def session_seeds(conn, session_code=None):
+    """{session id: (code, seed or None, scenario table)}"""
+    query = ("SELECT id, code, _vars, config FROM otree_session"
+             + (" WHERE code = :session_code" if session_code else ""))
+    seeds = {}
+    for session_id, code, vars, config in conn.execute(text(query), session_code=session_code):
+        config = decode_vars(config) if config else {}
+        seeds[session_id] = (code, decode_vars(vars).get("rng_seed") if vars else None,
+                             tuple(parse_scenarios(config.get("scenarios", DEFAULT_SCENARIOS))))
+    return seeds
+
+
+def _player_rows(conn, app, session_id=None):
+    query = (
+        "SELECT p.session_id, g.id_in_subsession, p.id_in_group, p.risk_bits, "
+        "p.scenario_random, p.lottery_random, p._payoff "
+        "FROM {app}_player p JOIN {app}_group g ON g.id = p.group_id "
+        "WHERE p.scenario_random IS NOT NULL {where}"
+        "ORDER BY p.session_id, g.id_in_subsession, p.id_in_group"
+    ).format(app=app, where="AND p.session_id = :session_id " if session_id else "")
+    return conn.execute(text(query), session_id=session_id).fetchall()
+
+
+def replay_app(conn, app, part, C, seeds, session_id=None):
+    start = time.perf_counter()
+    seeded = {session_id for session_id, (_, seed, _) in seeds.items() if seed is not None}
+    rows = _player_rows(conn, app, session_id)
+
+    # Only complete groups (all players resolved), GROUP_SIZE rows each in id_in_group order
+    groups = {}
+    for row in rows:
+        if row[0] not in seeded:
+            continue
+        groups.setdefault((row[0], row[1]), []).append(row)
+    groups = {key: members for key, members in groups.items() if len(members) == GROUP_SIZE}
+
+    # Sessions with the same scenario table are replayed together
+    batches = {}
+    for key in sorted(groups):
+        batches.setdefault(seeds[key[0]][2], []).append(key)
+
+    mismatches = []
+    for safe_options, keys in batches.items():
+        table = np.array([[list(row) for row in groups[key]] for key in keys], dtype=object)
+        choices = decode_matrix(table[:, :, 3].astype(np.int64), len(safe_options))
+        stored_scenario = table[:, :, 4].astype(np.int64)
+        stored_lottery = table[:, :, 5]
+        stored_payoff = np.rint(table[:, :, 6].astype(float)).astype(np.int64)
+
+        res = replay([seeds[session_id][1] for session_id, _ in keys], part,
+                     [number for _, number in keys], choices, C, safe_options)
+
+        lottery = np.where(res.plays_lottery, res.lottery_random, -1)
+        stored_lottery = np.array([[-1 if v is None else int(round(float(v))) for v in row]
+                                   for row in stored_lottery], dtype=np.int64)
+        stored_lottery = np.where(res.plays_lottery, stored_lottery, -1)
+
+        for field, stored, replayed in [("scenario_random", stored_scenario, res.scenario_random),
+                                        ("lottery_random", stored_lottery, lottery),
+                                        ("payoff", stored_payoff, res.payoff)]:
+            for g, i in zip(*np.nonzero(stored != replayed)):
+                session_id, number = keys[g]
+                mismatches.append(Mismatch(seeds[session_id][0], number, int(i) + 1, field,
+                                           int(stored[g, i]), int(replayed[g, i])))
+
+    return Report(app, len({session_id for session_id, _ in groups}), len(groups),
+                  len(seeds) - len(seeded), mismatches, time.perf_counter() - start)
+
+
+def replay_database(database, session_code=None, progress=None):
+    """Reports of both apps (database: URL or Engine); progress(apps done, apps) after each app (shared/jobs.py)."""
+    from part_one import C as C1
+    from part_two import C as C2
+
+    constants = {"part_one": C1, "part_two": C2}
+    engine = get_engine(database)
+    reports = []
+    with engine.connect() as conn:
+        seeds = session_seeds(conn, session_code)
+        session_id = next(iter(seeds), None) if session_code else None
+        for app, part in APPS:
+            reports.append(replay_app(conn, app, part, constants[app], seeds, session_id))
+            if progress is not None:
+                progress(len(reports), len(APPS))
+    return reports
+
+
+def print_reports(reports, file=None, max_mismatches=20):
+    for report in reports:
+        print("{}: {} sessions, {} groups replayed in {:.2f} s, {} mismatches ({} sessions without seed skipped)".format(
+            report.app, report.sessions, report.groups, report.seconds, len(report.mismatches),
+            report.skipped_sessions), file=file)
+        for mismatch in report.mismatches[:max_mismatches]:
+            print("  session {} group {} player {}: {} stored {}, replayed {}".format(*mismatch), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the payoffs of finished sessions from their seed.")
+    parser.add_argument("--session", help="only this session code")
+    parser.add_argument("--database-url", default=default_database_url())
+    args = parser.parse_args()
+
+    reports = replay_database(args.database_url, args.session)
+    print_reports(reports)
+
+    if any(report.mismatches for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Seeded random streams for the payoff draws of both parts.
+
+Every session gets a 64-bit seed when it is created: session.rng_seed, taken from the session
+config rng_seed if set (to reproduce a session), otherwise fresh entropy. The scenario and
+lottery draws of a group come from a stream of its own, derived from the seed, the part and
+the number of the group in its subsession:
+
+    stream(seed, part, group) = default_rng(SeedSequence(seed, spawn_key=(part, group)))
+
+The streams are statistically independent of each other, so a group's draws depend neither on
+the order in which groups reach the ResultsWaitPage nor on the worker process, and any payoff
+can be recomputed from the seed and the stored choices (shared/replay.py). The E / NE draw of a
+group formed by arrival time (shared/grouping.py) comes from stream(seed, GROUPING, n), n being
+the id_in_subsession of the group's JW participant, so the roles are reproducible as well, and
+the blocked randomization of part_two's treatments (shared/assignment.py) from
+stream(seed, GROUPING, 0).
+"""
+
+import secrets
+
+import numpy as np
+
+
+PART_ONE = 1
+PART_TWO = 2
+GROUPING = 3
+
+
+def session_seed(session):
+    """The session's seed, drawn (or taken from the config) on first use."""
+    # session._vars: session.vars marks the vars as changed and would save them again
+    seed = session._vars.get("rng_seed")
+    if seed is None:
+        seed = session.config.get("rng_seed")
+        if seed in (None, ""):
+            seed = secrets.randbits(64)
+        session.rng_seed = seed = int(seed)
+    return seed
+
+
+def stream(seed, part, group_number):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(part, group_number)))
+
+
+def group_streams(session, part, groups):
+    """One stream per group, for shared.payoffs.resolve_groups."""
+    seed = session_seed(session)
+    return [stream(seed, part, group.id_in_subsession) for group in groups]
@@ -0,0 +1,146 @@
+"""
+Scenario table of both parts, from the session config.
+
+The session config lists the loss of the safe option in every scenario, in the order the
+scenarios are shown:
+
+    scenarios="775, 600, 500, 400"
+
+The risky lottery (RISK_LOW / RISK_HIGH with equal probability) is the same in every scenario,
+so this list is the whole table. Both parts present the same scenarios.
+
+A player's choices are stored in one integer field, risk_bits: bit i is set if the risky
+lottery was chosen in scenario i + 1. The player table, the exports and the
+participant records (shared/summary.py) therefore keep the same width whether a session has
+4, 12 or 20 scenarios. The choice page renders one pair of radio buttons per row of the table
+(_templates/global/scenario_choices.html), named risk_1 ... risk_n. They are posted as they are
+and combined into risk_bits on the server (ChoicesPage): a scenario without an answer is an
+error on risk_bits, and the page is shown again with the answers given so far. On a timeout
+the unanswered scenarios count as safe.
+"""
+
+import numpy as np
+from otree.api import cu
+from starlette.datastructures import FormData
+
+from shared.timing import TimedPage
+
+
+DEFAULT_SCENARIOS = "775, 600, 500, 400"
+
+# Player.risk_bits is an IntegerField, a signed 32-bit column on PostgreSQL: 31 scenarios keep
+# every choice set positive (and within the unsigned 32 bits of shared/summary.py and the journal)
+MAX_SCENARIOS = 31
+# safe_option and payoff are int16 in the journal record (shared/summary.py) and payoff in the
+# columnar export: a loss up to this keeps both in range, the payoff being ENDOWMENT - loss
+MAX_LOSS = 2 ** 15 - 1
+
+CHOICES_TEMPLATE = "global/scenario_choices.html"
+
+MISSING_ERROR = "Please choose an option in every scenario (missing: scenario {})."
+
+
+def parse_scenarios(text):
+    """Parse "775, 600, 500, 400" into [775, 600, 500, 400]."""
+    try:
+        losses = [int(entry) for entry in str(text).split(",")]
+    except ValueError:
+        raise ValueError("scenarios: expected comma-separated token amounts, got {!r}".format(text))
+
+    if not 1 <= len(losses) <= MAX_SCENARIOS:
+        raise ValueError("scenarios: expected 1 to {} entries, got {}".format(MAX_SCENARIOS, len(losses)))
+    if any(loss < 0 for loss in losses):
+        raise ValueError("scenarios: the losses must not be negative: {!r}".format(text))
+    if any(loss > MAX_LOSS for loss in losses):
+        raise ValueError("scenarios: the losses must be at most {}: {!r}".format(MAX_LOSS, text))
+    return losses
+
+
+def scenario_table(session):
+    """Loss of the safe option per scenario (currency), from the session config."""
+    return [cu(loss) for loss in parse_scenarios(session.config.get("scenarios", DEFAULT_SCENARIOS))]
+
+
+def encode(risks):
+    """[True, False, ...] (scenario 1, 2, ...) into risk_bits."""
+    bits = 0
+    for i, risk in enumerate(risks):
+        if risk:
+            bits |= 1 << i
+    return bits
+
+
+def decode(bits, num_scenarios):
+    return [bool(bits >> i & 1) for i in range(num_scenarios)]
+
+
+def decode_matrix(bits, num_scenarios):
+    """risk_bits of any shape into a bool array with a trailing scenario axis."""
+    bits = np.asarray(bits, dtype=np.int64)
+    return ((bits[..., None] >> np.arange(num_scenarios)) & 1).astype(bool)
+
+
+def max_bits(session):
+    """Largest valid risk_bits of the session (all scenarios risky)."""
+    return (1 << len(scenario_table(session))) - 1
+
+
+def choice_rows(C, safe_options, answers=None):
+    """One row per scenario for the choice page; answers: {scenario: risk} to check again."""
+    answers = answers or {}
+    risky = "A: -{} tokens with 50% probability, or -{} tokens with 50% probability".format(
+        int(C.RISK_LOW), int(C.RISK_HIGH))
+    return [
+        dict(number=number, risky=risky, safe="B: -{} tokens with 100% probability".format(int(safe)),
+             risky_checked="checked" if answers.get(number) is True else "",
+             safe_checked="checked" if answers.get(number) is False else "")
+        for number, safe in enumerate(safe_options, 1)
+    ]
+
+
+def read_answers(formdata, num_scenarios):
+    """{scenario: risk} of the radios risk_1 ... risk_n that were answered."""
+    answers = {}
+    for number in range(1, num_scenarios + 1):
+        value = formdata.get("risk_{}".format(number))
+        if value in ("True", "False"):
+            answers[number] = value == "True"
+    return answers
+
+
+def choice_post(risks):
+    """The radios of the choice page as a browser posts them, for [True, False, ...] (bots)."""
+    return {"risk_{}".format(number): risk for number, risk in enumerate(risks, 1)}
+
+
+class ChoicesPage(TimedPage):
+    """Choice page of both parts: renders the scenario table and builds risk_bits from the posted radios."""
+
+    form_model = "player"
+    form_fields = ["risk_bits"]
+
+    _answers = None
+    _missing = ()
+
+    def get_form(self, instance, formdata=None):
+        if formdata is not None:
+            num_scenarios = len(scenario_table(self.session))
+            self._answers = read_answers(formdata, num_scenarios)
+            self._missing = [number for number in range(1, num_scenarios + 1) if number not in self._answers]
+            # risk_bits only comes from the radios; left empty (required) while a scenario is missing
+            items = [(key, value) for key, value in formdata.multi_items() if key != "risk_bits"]
+            if not self._missing or self.timeout_happened:
+                risks = [self._answers.get(number, False) for number in range(1, num_scenarios + 1)]
+                items.append(("risk_bits", str(encode(risks))))
+            formdata = FormData(items)
+        return super().get_form(instance, formdata)
+
+    def form_invalid(self, form):
+        if self._missing:
+            form.risk_bits.errors = [MISSING_ERROR.format(", ".join(map(str, self._missing)))]
+        return super().form_invalid(form)
+
+    def get_context_data(self, **context):
+        context = super().get_context_data(**context)
+        context["scenarios"] = choice_rows(self._Constants, scenario_table(self.session), self._answers)
+        return context
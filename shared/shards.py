@@ -0,0 +1,445 @@
+"""
+Sharded deployment on one host: several oTree server processes (shards), each with its own
+database and a subset of the rooms and sessions, behind a local router on the web port.
+
+One prodserver process runs every page and wait page of all sessions (oTree serializes the
+views with a global lock), so several classrooms at once saturate one core. With
+
+    python -m shared.shards [port]
+
+the shards of SHARDS (settings.py) are started as `otree prodserver` processes on port+1,
+port+2, ..., each in its own directory _shards/<index> (symlinks to the project) with its own
+database: db.sqlite3 in that directory, or the shard's database_url for PostgreSQL. With
+DATABASE_URL set in the environment every shard needs a database_url (shard_env()). Each shard
+has its own worker process next to it (shared/worker.py: session pools, background jobs, queued
+in the shard's database). The router listens on port ($PORT, 8000) and forwards every request
+and websocket to one shard:
+
+- rooms (/room/<name>, the room admin pages and sockets, room_name in a REST body) go to the
+  shard that owns the room: the first one listing it in SHARDS, else the first shard
+- session, participant and join codes carry their shard (install(), called by shared.install()):
+  the first character of the 8-character codes is the shard index, the first syllable of the
+  join code is the index-th syllable. So /p/<code>/..., /SessionMonitor/<code>, /join/<code>,
+  /api/get_session/<code> and sockets with a code in the query string go to that shard
+- anything else (wait-page sockets, which only carry database ids, the admin pages without a
+  code) goes to the shard of the client's last routed request, remembered in a cookie; new
+  clients go to the first shard. Sessions created over REST without a room go round-robin
+
+The router itself serves /shards, the admin overview of all shards (status, rooms, sessions,
+requests and open websockets, links to switch the admin pages to a shard), with the access of
+oTree's session list, and GET /api/sessions, the sessions of all shards with their "shard".
+
+Only local processes and the standard library: the router is an asyncio byte proxy that reads
+the request head, rewrites it to one request per connection (websocket upgrades pass as is) and
+copies the bytes both ways.
+"""
+
+import argparse
+import asyncio
+import html
+import http.client
+import itertools
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from otree.common import SYLLABLES, random_chars, rng
+
+from settings import SHARDS
+
+
+SHARD_ENV = "OTREE_SHARD"
+COOKIE = "otree_shard"
+SHARDS_DIR = Path("_shards")
+MARKS = "0123456789"
+
+# First path segment followed by a room name
+ROOM_PATHS = {"room", "room_without_session", "room_with_session", "CloseRoom"}
+CODE = re.compile(r"^[a-z0-9]{8}$")
+MAX_HEAD = 1 << 16
+# REST bodies read for routing (room_name, code)
+MAX_BODY = 1 << 20
+CHUNK = 1 << 16
+
+
+class Shard:
+    def __init__(self, index, port, rooms=(), database_url=None):
+        self.index = index
+        self.port = port
+        self.rooms = list(rooms)
+        self.database_url = database_url
+        self.directory = SHARDS_DIR / str(index)
+        self.requests = 0
+        self.websockets = 0
+
+
+def configured(port=8000):
+    if len(SHARDS) > len(MARKS):
+        raise ValueError("SHARDS: at most {} shards".format(len(MARKS)))
+    urls = [shard["database_url"] for shard in SHARDS if shard.get("database_url")]
+    if len(set(urls)) < len(urls):
+        raise ValueError("SHARDS: every shard needs its own database_url")
+    return [Shard(index, shard.get("port", port + 1 + index), shard.get("rooms", ()), shard.get("database_url"))
+            for index, shard in enumerate(SHARDS)]
+
+
+def shard_env(shard, environ):
+    """
+    Environment of the shard's processes, with the shard's own database: its database_url, else
+    db.sqlite3 in its directory. An inherited DATABASE_URL would put all shards on one database.
+    """
+    env = dict(environ, **{SHARD_ENV: str(shard.index)})
+    if shard.database_url:
+        env["DATABASE_URL"] = shard.database_url
+    elif env.pop("DATABASE_URL", None):
+        raise ValueError("DATABASE_URL is set: set a database_url for shard {} in SHARDS as well, "
+                         "every shard needs its own database".format(shard.index))
+    return env
+
+
+def current():
+    """Index of the shard this process belongs to, None outside the sharded mode."""
+    index = os.environ.get(SHARD_ENV)
+    return int(index) if index else None
+
+
+def owner(room_name):
+    for index, shard in enumerate(SHARDS):
+        if room_name in shard.get("rooms", ()):
+            return index
+    return 0
+
+
+def owns_room(room_name):
+    index = current()
+    return index is None or owner(room_name) == index
+
+
+###############################################################################################
+##  Codes
+###############################################################################################
+
+
+def marked_code(index):
+    return MARKS[index] + random_chars(7)
+
+
+def marked_join_code(index):
+    return SYLLABLES[index] + "".join(rng.sample(SYLLABLES, 3))
+
+
+def shard_of_code(code, num_shards):
+    if CODE.match(code) and code[0] in MARKS[:num_shards]:
+        return MARKS.index(code[0])
+    return None
+
+
+def is_local_code(code):
+    """Whether a session or participant code belongs to this shard (always outside the sharded mode)."""
+    index = current()
+    return index is None or code[:1] == MARKS[index]
+
+
+def shard_of_join_code(code, num_shards):
+    if code[:2] in SYLLABLES[:num_shards]:
+        return SYLLABLES.index(code[:2])
+    return None
+
+
+def install():
+    """Generate the codes of this shard's sessions and participants (called when the apps are imported)."""
+    index = current()
+    if index is None:
+        return
+    from otree.models import Participant, Session
+
+    # Column defaults, evaluated on every insert: the codes are never set explicitly
+    Session.__table__.c.code.default.arg = lambda context: marked_code(index)
+    Participant.__table__.c.code.default.arg = lambda context: marked_code(index)
+    Session.__table__.c._anonymous_code.default.arg = lambda context: marked_join_code(index)
+
+
+###############################################################################################
+##  Router
+###############################################################################################
+
+
+class Request:
+    def __init__(self, head):
+        lines = head.decode("latin-1").split("\r\n")
+        self.method, self.target, self.version = lines[0].split(" ", 2)
+        self.headers = [tuple(part.strip() for part in line.split(":", 1)) for line in lines[1:] if ":" in line]
+        url = urlsplit(self.target)
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+        self.body = b""
+
+    def header(self, name, default=""):
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def is_upgrade(self):
+        return self.header("upgrade").lower() == "websocket"
+
+    def cookie_shard(self):
+        for part in self.header("cookie").split(";"):
+            key, _, value = part.strip().partition("=")
+            if key == COOKIE and value.isdigit():
+                return int(value)
+        return None
+
+    def head(self):
+        # One request per connection: the next one may belong to another shard
+        headers = [(key, value) for key, value in self.headers if key.lower() not in ("connection", "keep-alive")]
+        headers.append(("Connection", "Upgrade" if self.is_upgrade else "close"))
+        lines = ["{} {} {}".format(self.method, self.target, self.version)]
+        lines += ["{}: {}".format(key, value) for key, value in headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class Router:
+    def __init__(self, shards):
+        self.shards = shards
+        self.round_robin = itertools.cycle(range(len(shards)))
+
+    def route(self, request):
+        """(shard index, whether the client should be pinned to it by the cookie)"""
+        num_shards = len(self.shards)
+        segments = [segment for segment in request.path.split("/") if segment]
+        values = dict(request.query)
+        if request.body:
+            try:
+                values.update((key, value) for key, value in json.loads(request.body).items() if isinstance(value, str))
+            except (ValueError, AttributeError):
+                pass
+
+        if len(segments) > 1 and segments[0] in ROOM_PATHS:
+            return owner(segments[1]), True
+        if values.get("room_name"):
+            return owner(values["room_name"]), True
+        if len(segments) > 1 and segments[0] == "join":
+            index = shard_of_join_code(segments[1], num_shards)
+            if index is not None:
+                return index, True
+        for value in segments[1:] + [value for key, value in values.items() if key.endswith("code")]:
+            index = shard_of_code(value, num_shards)
+            if index is not None:
+                return index, True
+
+        if request.method == "POST" and request.path == "/api/sessions":
+            return next(self.round_robin), False
+        index = request.cookie_shard()
+        return (index if index is not None and index < num_shards else 0), False
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request = Request(head)
+            if request.method == "POST" and request.path.startswith("/api/"):
+                length = int(request.header("content-length", "0") or 0)
+                if length <= MAX_BODY:
+                    request.body = await reader.readexactly(length)
+
+            if request.path == "/shards" or request.path.startswith("/shards/"):
+                await self.serve_overview(request, writer)
+            elif request.method == "GET" and request.path == "/api/sessions":
+                await self.serve_sessions(request, writer)
+            else:
+                await self.forward(request, reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def forward(self, request, reader, writer):
+        index, pin = self.route(request)
+        shard = self.shards[index]
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", shard.port, limit=MAX_HEAD)
+        except OSError:
+            writer.write(response(502, "text/plain", "Shard {} is not running".format(index).encode()))
+            await writer.drain()
+            return
+
+        shard.requests += 1
+        upstream_writer.write(request.head() + request.body)
+        sending = asyncio.ensure_future(_copy(reader, upstream_writer, close=True))
+        try:
+            response_head = await upstream_reader.readuntil(b"\r\n\r\n")
+            if pin and request.cookie_shard() != index:
+                response_head = response_head[:-2] + "Set-Cookie: {}={}; Path=/; HttpOnly; SameSite=Lax\r\n\r\n".format(
+                    COOKIE, index).encode()
+            writer.write(response_head)
+            if request.is_upgrade:
+                shard.websockets += 1
+            try:
+                await _copy(upstream_reader, writer)
+            finally:
+                if request.is_upgrade:
+                    shard.websockets -= 1
+        finally:
+            sending.cancel()
+            upstream_writer.close()
+
+    def fetch(self, shard, path, headers):
+        conn = http.client.HTTPConnection("127.0.0.1", shard.port, timeout=10)
+        try:
+            conn.request("GET", path, headers=headers)
+            result = conn.getresponse()
+            return result.status, result.getheader("location"), result.read()
+        finally:
+            conn.close()
+
+    async def fetch_all(self, path, headers):
+        async def one(shard):
+            try:
+                return await asyncio.to_thread(self.fetch, shard, path, headers)
+            except OSError as exc:
+                return None, None, str(exc).encode()
+        return await asyncio.gather(*(one(shard) for shard in self.shards))
+
+    async def serve_sessions(self, request, writer):
+        headers = {key: value for key, value in request.headers if key.lower() in ("host", "otree-rest-key")}
+        sessions = []
+        for shard, (status, _, body) in zip(self.shards, await self.fetch_all("/api/sessions", headers)):
+            if status != 200:
+                writer.write(response(status or 502, "text/plain", body))
+                await writer.drain()
+                return
+            sessions += [dict(session, shard=shard.index) for session in json.loads(body)]
+        writer.write(response(200, "application/json", json.dumps(sessions).encode()))
+        await writer.drain()
+
+    async def serve_overview(self, request, writer):
+        # Same access as the session list of the shards (they share SECRET_KEY and the login cookie)
+        headers = {key: value for key, value in request.headers if key.lower() in ("host", "cookie")}
+        answers = [result for result in await self.fetch_all("/sessions", headers) if result[0] is not None]
+        status, location, _ = answers[0] if answers else (None, None, b"")
+        if status in (301, 302, 303, 307):
+            writer.write(response(302, "text/plain", b"", location=location))
+        elif request.path.startswith("/shards/use/"):
+            index = int(request.path.rsplit("/", 1)[1]) % len(self.shards)
+            writer.write(response(302, "text/plain", b"", location="/sessions",
+                                  cookie="{}={}; Path=/; HttpOnly; SameSite=Lax".format(COOKIE, index)))
+        else:
+            rest_headers = dict(headers, **{"otree-rest-key": os.environ.get("OTREE_REST_KEY", "")})
+            writer.write(response(200, "text/html; charset=utf-8",
+                                  self.overview(await self.fetch_all("/api/sessions", rest_headers)).encode()))
+        await writer.drain()
+
+    def overview(self, results):
+        rows = []
+        for shard, (status, _, body) in zip(self.shards, results):
+            sessions = json.loads(body) if status == 200 else []
+            state = "up" if status == 200 else "down" if status is None else "HTTP {}".format(status)
+            rows.append(
+                "<h3>Shard {index} (port {port}): {state}</h3>"
+                "<p>Rooms: {rooms}. Requests: {requests}, open websockets: {websockets}. "
+                "<a href=\"/shards/use/{index}\">Admin pages of this shard</a></p>"
+                "<table class=\"table table-sm\"><tr><th>Session</th><th>Config</th><th>Label</th>"
+                "<th>Participants</th><th>Created</th></tr>{sessions}</table>".format(
+                    index=shard.index, port=shard.port, state=state,
+                    rooms=", ".join(shard.rooms) or "-", requests=shard.requests, websockets=shard.websockets,
+                    sessions="".join(
+                        "<tr><td><a href=\"/SessionMonitor/{code}\">{code}</a></td><td>{config}</td>"
+                        "<td>{label}</td><td>{n}</td><td>{created}</td></tr>".format(
+                            code=html.escape(session["code"]), config=html.escape(session["config_name"]),
+                            label=html.escape(session["label"] or ""), n=session["num_participants"],
+                            created=time.strftime("%Y-%m-%d %H:%M", time.localtime(session["created_at"])))
+                        for session in sessions),
+                ))
+        return "<!DOCTYPE html><html><head><title>Shards</title></head><body><h2>Shards</h2>{}</body></html>".format(
+            "".join(rows))
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+        async with server:
+            await server.serve_forever()
+
+
+async def _copy(reader, writer, close=False):
+    try:
+        while True:
+            data = await reader.read(CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    if close:
+        writer.close()
+
+
+def response(status, content_type, body, location=None, cookie=None):
+    lines = ["HTTP/1.1 {} {}".format(status, http.client.responses.get(status, "")),
+             "Content-Type: {}".format(content_type), "Content-Length: {}".format(len(body)), "Connection: close"]
+    if location:
+        lines.append("Location: {}".format(location))
+    if cookie:
+        lines.append("Set-Cookie: {}".format(cookie))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+###############################################################################################
+##  Launcher
+###############################################################################################
+
+
+def prepare(shard):
+    """The shard's working directory: symlinks to the project, its own db.sqlite3."""
+    shard.directory.mkdir(parents=True, exist_ok=True)
+    for entry in Path.cwd().iterdir():
+        link = shard.directory / entry.name
+        if entry.name in (SHARDS_DIR.name, "db.sqlite3", "__pycache__", ".git") or link.is_symlink() or link.exists():
+            continue
+        link.symlink_to(entry.resolve())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("port", nargs="?", type=int, default=int(os.environ.get("PORT") or 8000))
+    parser.add_argument("--host", default="0.0.0.0")
+    args = parser.parse_args()
+
+    try:
+        shards = configured(args.port)
+        envs = [shard_env(shard, os.environ) for shard in shards]
+    except ValueError as error:
+        raise SystemExit(error)
+    # The template check of the deploy (shared/warmup.py), once for all shards
+    if subprocess.run([sys.executable, "-m", "shared.warmup"]).returncode:
+        raise SystemExit("broken templates, not starting the shards")
+    processes = []
+    for shard, env in zip(shards, envs):
+        prepare(shard)
+        processes.append(subprocess.Popen(["otree", "prodserver", "127.0.0.1:{}".format(shard.port)],
+                                          cwd=shard.directory, env=env))
+        # The shard's worker, on the shard's database (shared/worker.py)
+        processes.append(subprocess.Popen([sys.executable, "-m", "shared.worker"], cwd=shard.directory, env=env))
+        print("Shard {}: port {}, rooms {}".format(shard.index, shard.port, ", ".join(shard.rooms) or "-"), flush=True)
+
+    print("Router on {}:{}".format(args.host, args.port), flush=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(Router(shards).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
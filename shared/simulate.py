@@ -0,0 +1,308 @@
+"""
+Headless session simulator: plays complete sessions of part_one_intro -> part_one -> part_two
+without oTree or a database, to size sessions and check designs before booking the lab.
+
+Every simulated session goes through the same logic as the apps, imported from here, not copied:
+
+- seating in fixed groups of three and group formation on Group_Formation (shared/grouping.py),
+  fixed or by arrival time; arrivals come from a lognormal quiz duration
+- roles JW / E / NE by position in the group, part_two grouped like part_one
+- treatment and character schedule (shared/assignment.py) from the session config
+- scenario and lottery draws of both parts from the seeded per-group streams (shared/rng.py) and
+  the batched payoff engine (shared/payoffs.py)
+
+Choices come from a behavior model (BEHAVIORS): the probability of choosing the lottery in a
+scenario is logistic in the difference between the safe loss and the expected lottery loss,
+shifted by a risk premium and, in part two, by a treatment effect.
+
+    python -m shared.simulate --sessions 20000 --participants 18 36 [--behavior risk_averse]
+                              [--arrival] [--config assignment_blocked_randomization=true]
+                              [--processes N] [--seed 0]
+
+Sessions are split into chunks that run on a process pool; every session has its own seed
+derived from --seed, so the results do not depend on the number of processes.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import NamedTuple
+
+import numpy as np
+
+from shared.assignment import build_schedule
+from shared.grouping import GROUP_SIZE, form_group
+from shared.payoffs import E, JW, NE, resolve
+from shared.rng import PART_ONE, PART_TWO, stream
+
+
+ROLE_NAMES = ["JW", "E", "NE"]
+# Stream of the session's participants (quiz durations, choices); parts 1 and 2 are the payoff draws
+PARTICIPANTS = 0
+
+
+class Behavior(NamedTuple):
+    premium: float              # tokens of expected loss a participant gives up to avoid the lottery
+    noise: float                # logistic scale in tokens, larger = more random choices
+    treatment_effects: dict     # part two: treatment -> shift of the premium
+    quiz_mean: float = 300.0    # seconds until the comprehension quiz is passed
+    quiz_sigma: float = 0.5
+
+
+BEHAVIORS = {
+    "coin": Behavior(premium=0, noise=1e9, treatment_effects={}),
+    "risk_neutral": Behavior(premium=0, noise=25, treatment_effects={}),
+    "risk_averse": Behavior(premium=150, noise=50, treatment_effects={}),
+    # the design's hypothesis: the narratives make participants more risk averse in part two
+    "treatment_effect": Behavior(premium=100, noise=50, treatment_effects={"T1": 75, "T2": 40}),
+}
+
+
+def constants(C, safe_options):
+    """
+    The constants the simulation needs, as plain numbers (picklable for the process pool).
+    safe_options is the scenario table of the session config (shared/scenarios.py).
+    """
+    return SimpleNamespace(
+        SAFE_OPTIONS=[int(x) for x in safe_options], ENDOWMENT=int(C.ENDOWMENT),
+        RISK_LOW=int(C.RISK_LOW), RISK_HIGH=int(C.RISK_HIGH),
+        TREATMENTS=list(getattr(C, "TREATMENTS", [])), CHARACTERS=list(getattr(C, "CHARACTERS", [])),
+        CHARACTER_TREATMENT=getattr(C, "CHARACTER_TREATMENT", None),
+    )
+
+
+###############################################################################################
+##  One session
+###############################################################################################
+
+
+class _Participant:
+    # What form_group reads and writes on participant
+    def __init__(self, slot, arrival):
+        self._vars = dict(p1_slot=slot, p1_arrival=arrival)
+
+
+class _Player:
+    def __init__(self, participant, id_in_subsession):
+        self.participant = participant
+        self.id_in_subsession = id_in_subsession
+
+
+def form_groups(arrivals, by_arrival, seed):
+    """
+    Group_Formation of part_one: participants arrive in time order and are seated like in
+    part_one_intro (consecutive groups of three, position 1 = JW seat). After every arrival
+    groups are formed as long as form_group finds one, as the page reloads of the waiting
+    participants would. Returns the groups (participant indices, JW/E/NE order) and the wait
+    of every participant in seconds.
+    """
+    players = [_Player(_Participant((i // GROUP_SIZE + 1, i % GROUP_SIZE + 1), arrival), i + 1)
+               for i, arrival in enumerate(arrivals)]
+    waits = np.zeros(len(players))
+    groups = []
+    waiting = []
+    for index in np.argsort(arrivals, kind="stable"):
+        waiting.append(players[index])
+        now = arrivals[index]
+        while True:
+            group = form_group(waiting, by_arrival, seed)
+            if not group:
+                break
+            for p in group:
+                waiting.remove(p)
+                waits[p.id_in_subsession - 1] = now - p.participant._vars["p1_arrival"]
+            groups.append([p.id_in_subsession - 1 for p in group])
+    return groups, waits
+
+
+def choose(rng, behavior, C, num_groups, treatments=None):
+    """Risky choices (groups, 3, scenarios) drawn from the behavior model."""
+    safe = np.asarray(C.SAFE_OPTIONS, dtype=float)
+    expected_lottery = (C.RISK_LOW + C.RISK_HIGH) / 2
+    premium = np.full((num_groups, 1, 1), float(behavior.premium))
+    if treatments is not None:
+        premium += np.array([behavior.treatment_effects.get(t, 0) for t in treatments])[:, None, None]
+    gain = (safe[None, None, :] - expected_lottery - premium) / behavior.noise
+    p_risky = 1 / (1 + np.exp(-np.clip(gain, -50, 50)))
+    return rng.random((num_groups, GROUP_SIZE, len(safe))) < p_risky
+
+
+class SessionResult(NamedTuple):
+    roles: np.ndarray           # per participant, index into ROLE_NAMES
+    group: np.ndarray           # per participant, index of the group (same in both parts)
+    risky: np.ndarray           # (participants, 2 parts, scenarios)
+    payoff: np.ndarray          # (participants, 2 parts)
+    wait: np.ndarray            # per participant, seconds on Group_Formation
+    treatments: list            # per group: (treatment, character)
+
+
+def simulate_session(seed, num_participants, behavior, C1, C2, config):
+    num_groups = num_participants // GROUP_SIZE
+    rng = stream(seed, PARTICIPANTS, 0)
+
+    arrivals = rng.lognormal(np.log(behavior.quiz_mean), behavior.quiz_sigma, size=num_participants)
+    groups, wait = form_groups(arrivals, config.get("p1_group_by_arrival_time", False), seed)
+    members = np.array(groups)
+
+    # part_two has the same groups, each with the treatment that creating_session gave the seat
+    # group of its JW participant (group_like_part_one)
+    seat_schedule = build_schedule(num_groups, config, C2, seed)
+    schedule = [seat_schedule[jw // GROUP_SIZE] for jw in members[:, 0]]
+    treatments = [treatment for treatment, _ in schedule]
+
+    roles = np.empty(num_participants, dtype=np.int8)
+    roles[members] = [JW, E, NE]
+    group = np.empty(num_participants, dtype=np.int16)
+    group[members] = np.arange(num_groups)[:, None]
+    risky = np.empty((num_participants, 2, len(C1.SAFE_OPTIONS)), dtype=bool)
+    payoff = np.empty((num_participants, 2), dtype=np.int64)
+    for column, part, C, part_treatments in [(0, PART_ONE, C1, None), (1, PART_TWO, C2, treatments)]:
+        choices = choose(rng, behavior, C, num_groups, part_treatments)
+        res = resolve(choices, C.SAFE_OPTIONS, C.ENDOWMENT, [C.RISK_LOW, C.RISK_HIGH],
+                      [stream(seed, part, number) for number in range(1, num_groups + 1)])
+        risky[members, column] = choices
+        payoff[members, column] = res.payoff
+    return SessionResult(roles, group, risky, payoff, wait, schedule)
+
+
+###############################################################################################
+##  Many sessions on a process pool
+###############################################################################################
+
+
+def session_seed(seed, index):
+    return int(np.random.SeedSequence(seed, spawn_key=(index,)).generate_state(1, np.uint64)[0])
+
+
+def simulate_chunk(seed, start, count, num_participants, behavior, C1, C2, config):
+    """Sessions start..start+count-1, stacked: arrays with a leading session axis."""
+    results = [simulate_session(session_seed(seed, index), num_participants, behavior, C1, C2, config)
+               for index in range(start, start + count)]
+    return SessionResult(
+        np.stack([r.roles for r in results]), np.stack([r.group for r in results]),
+        np.stack([r.risky for r in results]),
+        np.stack([r.payoff for r in results]), np.stack([r.wait for r in results]),
+        [r.treatments for r in results],
+    )
+
+
+def simulate(num_sessions, num_participants, behavior, C1, C2, config, seed=0, processes=None, chunk_size=500):
+    chunks = [(start, min(chunk_size, num_sessions - start)) for start in range(0, num_sessions, chunk_size)]
+    args = (num_participants, behavior, C1, C2, config)
+    if processes == 1:
+        parts = [simulate_chunk(seed, start, count, *args) for start, count in chunks]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(simulate_chunk, seed, start, count, *args) for start, count in chunks]
+            parts = [future.result() for future in futures]
+    return SessionResult(
+        np.concatenate([p.roles for p in parts]), np.concatenate([p.group for p in parts]),
+        np.concatenate([p.risky for p in parts]),
+        np.concatenate([p.payoff for p in parts]), np.concatenate([p.wait for p in parts]),
+        [schedule for p in parts for schedule in p.treatments],
+    )
+
+
+###############################################################################################
+##  Report
+###############################################################################################
+
+
+def _quantiles(values):
+    return "{:8.1f} {:8.1f} {:8.1f} {:8.1f}".format(np.mean(values), *np.percentile(values, [5, 50, 95]))
+
+
+def print_report(result, config, seconds):
+    num_sessions, num_participants = result.roles.shape
+    print()
+    print("{} sessions of {} participants in {:.1f} s ({:.0f} sessions/s)".format(
+        num_sessions, num_participants, seconds, num_sessions / seconds))
+
+    print("{:<28} {:>8} {:>8} {:>8} {:>8}".format("payoff (tokens)", "mean", "p5", "p50", "p95"))
+    total = result.payoff.sum(axis=2)
+    for role, name in enumerate(ROLE_NAMES):
+        mask = result.roles == role
+        print("{:<28} {}".format("  part one " + name, _quantiles(result.payoff[:, :, 0][mask])))
+        print("{:<28} {}".format("  part two " + name, _quantiles(result.payoff[:, :, 1][mask])))
+        print("{:<28} {}".format("  total " + name, _quantiles(total[mask])))
+
+    rate = config.get("real_world_currency_per_point", 0)
+    fee = config.get("participation_fee", 0)
+    budget = (total * rate + fee).sum(axis=1)
+    print("{:<28} {}".format("session payment (currency)", _quantiles(budget)))
+    print("{:<28} {}".format("group formation wait (s)", _quantiles(result.wait.ravel())))
+
+    counts = {}
+    for schedule in result.treatments:
+        for treatment, character in schedule:
+            counts[(treatment, character)] = counts.get((treatment, character), 0) + 1
+    print("groups per treatment: " + ", ".join(
+        "{}{}: {:.2f}".format(t, ":" + c if c else "", n / num_sessions) for (t, c), n in sorted(counts.items())))
+
+    print("risky share by scenario   part one / part two")
+    for role, name in enumerate(ROLE_NAMES):
+        mask = result.roles == role
+        shares = result.risky[mask].mean(axis=0)
+        print("  {:<4} {}   /   {}".format(name, " ".join("{:.2f}".format(s) for s in shares[0]),
+                                         " ".join("{:.2f}".format(s) for s in shares[1])))
+
+    # Treatment of every participant, from the schedule of their session
+    treatment_names = sorted({t for schedule in result.treatments for t, _ in schedule})
+    codes = np.array([[treatment_names.index(t) for t, _ in schedule] for schedule in result.treatments])
+    treatment = np.take_along_axis(codes, result.group.astype(np.int64), axis=1)
+    print("risky share part two by treatment (change against part one)")
+    for code, name in enumerate(treatment_names):
+        mask = treatment == code
+        shares = result.risky[mask].mean(axis=0)
+        print("  {:<4} {}   ({:+.3f})".format(name, " ".join("{:.2f}".format(s) for s in shares[1]),
+                                            shares[1].mean() - shares[0].mean()))
+
+
+def parse_config(item):
+    key, _, value = item.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--participants", type=int, nargs="+", default=[18], help="multiples of 3")
+    parser.add_argument("--session-config", default="my_experiment")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="session config override (JSON value)")
+    parser.add_argument("--arrival", action="store_true", help="form part_one groups by arrival time")
+    parser.add_argument("--behavior", choices=sorted(BEHAVIORS), default="risk_averse")
+    parser.add_argument("--processes", type=int, help="default: number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Constants and session config come from the apps and settings (no oTree server is started)
+    from settings import SESSION_CONFIG_DEFAULTS, SESSION_CONFIGS
+    from part_one import C as C1
+    from part_two import C as C2
+    from shared.scenarios import parse_scenarios
+
+    config = dict(SESSION_CONFIG_DEFAULTS)
+    config.update(next(c for c in SESSION_CONFIGS if c["name"] == args.session_config))
+    config.update(parse_config(item) for item in args.config)
+    if args.arrival:
+        config["p1_group_by_arrival_time"] = True
+    safe_options = parse_scenarios(config["scenarios"])
+
+    for num_participants in args.participants:
+        if num_participants % GROUP_SIZE:
+            parser.error("--participants must be multiples of {}".format(GROUP_SIZE))
+        start = time.perf_counter()
+        result = simulate(args.sessions, num_participants, BEHAVIORS[args.behavior],
+                          constants(C1, safe_options), constants(C2, safe_options),
+                          config, seed=args.seed, processes=args.processes)
+        print_report(result, config, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Session snapshots at an app boundary: the state of a session after part_one, written to one
+compact file, and restored into a new session that starts at part_two.
+
+On part_one's SnapshotWaitPage, the last page of the app and the point where all participants
+have finished it, the session is written to <snapshot_dir>/<session code>.snap (session config
+snapshot_dir, "" = off by default; my_experiment_snapshot in settings.py writes to _snapshots).
+A snapshot holds:
+
+- the session config and SESSION_FIELDS (rng_seed, live_counts, ...)
+- per participant: code, label, payoff and the PARTICIPANT_FIELDS (c_role, p1, ...)
+- the groups of the next app, as participants by id_in_group, and the non-empty fields of its
+  groups and players (t_groups, character_random, treatment_0..2, ...)
+
+pickled and zlib-compressed, about 80 bytes per participant. The file is a pickle like
+participant.vars in the database: only restore snapshots of your own servers.
+
+A session config whose app_sequence starts at the next app and names a snapshot restores it in
+that app's creating_session (restore()): the experiment parameters of the original config
+(everything in SESSION_CONFIG_DEFAULTS), the session fields, the groups and their fields with
+bulk UPDATEs (shared/bulk.py). Participant codes are kept if no other session uses them (and
+they belong to this shard, shared/shards.py), so the original start links keep working. With
+the original rng_seed, part_two draws the same scenarios and lotteries as the original session
+would have. my_experiment_part_two in settings.py restores part_two/tests.snap, so the
+part_two bots start at Instructions_T0/T1/T2:
+
+    otree test my_experiment_part_two
+
+and from the command line (a recovery drill: a new session in the room, ready at part_two):
+
+    python -m shared.snapshot show FILE
+    python -m shared.snapshot restore FILE [--room econ101] [--label LABEL]
+"""
+
+import argparse
+import os
+import pickle
+import time
+import zlib
+from importlib import import_module
+from pathlib import Path
+
+from otree.database import db, session_scope
+
+from settings import PARTICIPANT_FIELDS, SESSION_CONFIG_DEFAULTS, SESSION_CONFIGS, SESSION_FIELDS
+from shared.bulk import batched_writes
+from shared.shards import is_local_code
+
+
+MAGIC = b"OTSNAP1\n"
+# Not carried over: pool is the pooled state of the original session (shared/pool.py)
+SKIPPED_SESSION_FIELDS = {"pool"}
+# Columns oTree sets itself when it creates the groups and players
+INTERNAL_COLUMNS = {"id", "session_id", "subsession_id", "group_id", "participant_id",
+                    "round_number", "id_in_group", "id_in_subsession"}
+
+
+def _fields(obj):
+    """The non-empty model fields of a group or player."""
+    values = {}
+    for column in obj.__table__.columns:
+        if column.name in INTERNAL_COLUMNS or column.name.startswith("_"):
+            continue
+        value = obj.field_maybe_none(column.name)
+        if value is not None:
+            values[column.name] = value
+    return values
+
+
+def capture(session, after_app):
+    """The session's state once all participants have finished after_app, as a dict."""
+    app_sequence = session.config["app_sequence"]
+    next_app = app_sequence[app_sequence.index(after_app) + 1]
+    subsession = import_module(next_app).Subsession.objects_get(session=session, round_number=1)
+    groups = subsession.get_groups()
+    participants = session.get_participants()
+
+    return dict(
+        session_code=session.code,
+        created=time.time(),
+        after_app=after_app,
+        next_app=next_app,
+        config=dict(session.config),
+        session_fields={name: session._vars[name] for name in SESSION_FIELDS
+                        if name in session._vars and name not in SKIPPED_SESSION_FIELDS},
+        participants=[
+            dict(code=participant.code, label=participant.label, payoff=participant.payoff,
+                 vars={name: participant._vars[name] for name in PARTICIPANT_FIELDS if name in participant._vars})
+            for participant in participants
+        ],
+        groups=[[player.participant.id_in_session for player in group.get_players()] for group in groups],
+        group_fields=[_fields(group) for group in groups],
+        player_fields={player.participant.id_in_session: _fields(player) for player in subsession.get_players()},
+    )
+
+
+def dumps(snapshot):
+    return MAGIC + zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), 9)
+
+
+def loads(data):
+    if not data.startswith(MAGIC):
+        raise ValueError("not a session snapshot")
+    return pickle.loads(zlib.decompress(data[len(MAGIC):]))
+
+
+def load(path):
+    return loads(Path(path).read_bytes())
+
+
+def save(session, after_app):
+    """Write the snapshot to the session config's snapshot_dir, if set; returns the path."""
+    directory = session.config.get("snapshot_dir")
+    if not directory:
+        return None
+    path = Path(directory) / "{}.snap".format(session.code)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and renamed, so a crash never leaves half a snapshot
+    partial = path.with_suffix(".partial")
+    partial.write_bytes(dumps(capture(session, after_app)))
+    os.replace(partial, path)
+    return path
+
+
+def restore(subsession, path):
+    """
+    Restore a snapshot into a new session (creating_session of the snapshot's next app, which
+    must be the first app of the session).
+    """
+    snapshot = load(path)
+    session = subsession.session
+    if session.config["app_sequence"][0] != snapshot["next_app"]:
+        raise ValueError("snapshot {}: the session must start with {}".format(path, snapshot["next_app"]))
+    participants = session.get_participants()
+    saved = snapshot["participants"]
+    if len(participants) != len(saved):
+        raise ValueError("snapshot {}: {} participants, the session has {}".format(path, len(saved), len(participants)))
+
+    # The experiment parameters of the original session (scenarios, seed, ...)
+    config = type(session.config)(session.config)
+    config.update((key, value) for key, value in snapshot["config"].items() if key in SESSION_CONFIG_DEFAULTS)
+    session.config = config
+    for name, value in snapshot["session_fields"].items():
+        setattr(session, name, value)
+
+    # The groups of the original session: the players are moved between the groups oTree has
+    # created, with the other writes (set_group_matrix would commit and reload the session)
+    groups = subsession.get_groups()
+    if len(groups) != len(snapshot["groups"]):
+        raise ValueError("snapshot {}: {} groups, the session has {}".format(path, len(snapshot["groups"]), len(groups)))
+    players = {player.participant.id_in_session: player for player in subsession.get_players()}
+
+    # Keep the original codes unless another session (e.g. the original one, still in the
+    # database) has them, or they belong to another shard (shared/shards.py)
+    codes = [participant["code"] for participant in saved]
+    Participant = type(participants[0])
+    keep_codes = (all(is_local_code(code) for code in codes)
+                  and not Participant.objects_filter(Participant.code.in_(codes)).count())
+
+    with batched_writes() as batch:
+        for participant, values in zip(participants, saved):
+            if keep_codes:
+                batch.set(participant, code=values["code"])
+            batch.set(participant, label=values["label"], payoff=values["payoff"])
+            batch.set_vars(participant, **values["vars"])
+        for group, members, fields in zip(groups, snapshot["groups"], snapshot["group_fields"]):
+            batch.set(group, **fields)
+            for id_in_group, id_in_session in enumerate(members, start=1):
+                batch.set(players[id_in_session], group_id=group.id, id_in_group=id_in_group,
+                          **snapshot["player_fields"][id_in_session])
+    return snapshot
+
+
+###############################################################################################
+##  Command line
+###############################################################################################
+
+
+def restore_config(snapshot):
+    """The session config that runs the original app sequence from the snapshot's next app."""
+    app_sequence = snapshot["config"]["app_sequence"]
+    remaining = app_sequence[app_sequence.index(snapshot["next_app"]):]
+    for config in SESSION_CONFIGS:
+        if config["app_sequence"] == remaining and "snapshot" in config:
+            return config["name"]
+    raise SystemExit("No session config in settings.py starts at {} with a snapshot field".format(snapshot["next_app"]))
+
+
+def show(path):
+    data = Path(path).read_bytes()
+    snapshot = loads(data)
+    print("{}: session {} after {}, {} participants in {} groups, {} bytes".format(
+        path, snapshot["session_code"], snapshot["after_app"], len(snapshot["participants"]),
+        len(snapshot["groups"]), len(data)))
+    print("created {}, config {}, restore with {}".format(
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["created"])), snapshot["config"]["name"],
+        restore_config(snapshot)))
+    for group, fields in zip(snapshot["groups"], snapshot["group_fields"]):
+        print("  group {}: {}".format(group, ", ".join("{}={}".format(key, value) for key, value in fields.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("show", help="summary of a snapshot file")
+    command.add_argument("path")
+    command = commands.add_parser("restore", help="create a session from a snapshot")
+    command.add_argument("path")
+    command.add_argument("--room", help="put the session in this room")
+    command.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        show(args.path)
+        return
+
+    from otree.main import setup
+    setup()
+    import otree.session
+
+    snapshot = load(args.path)
+    start = time.perf_counter()
+    with session_scope():
+        session = otree.session.create_session(
+            restore_config(snapshot), num_participants=len(snapshot["participants"]), room_name=args.room,
+            label=args.label, modified_session_config_fields=dict(snapshot=str(Path(args.path).resolve())))
+        code = session.code
+        kept = [participant.code for participant in session.get_participants()] == [
+            participant["code"] for participant in snapshot["participants"]]
+        db.commit()
+    print("Session {} restored from {} in {:.0f} ms, participant codes {}".format(
+        code, snapshot["session_code"], (time.perf_counter() - start) * 1000, "kept" if kept else "new"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Compact per-part summary stored at the participant level (participant.p1 / participant.p2).
+
+All results of one part are kept in a single dict of plain ints and bools (record()), which is
+written with one assignment in ResultsWaitPage. participant.vars is pickled and saved on every
+request, so one small dict per part is much cheaper than a dozen separate keys. Plain values
+keep the stored data independent of this module (nothing is imported to unpickle it) and
+readable in oTree's participant export. Keys, the fields of Values:
+
+    risk_bits        bit i set = risky lottery chosen in scenario i + 1 (up to 31 scenarios)
+    scenario_random  1-based
+    risk_random      choice in the drawn scenario
+    plays_lottery    the lottery is realized (risky choice or NE)
+    role             0 JW, 1 E, 2 NE
+    treatment        0 T0, 1 T1, 2 T2 (part 2; 0 in part 1)
+    character        0 none, 1 Samantha, 2 Daniel
+    lottery_random   loss of the lottery (only meaningful if plays_lottery)
+    safe_option      loss of the safe option in the drawn scenario
+    payoff
+    group_id         Group.id of the player's group in the part
+
+Summary(record) decodes a record for templates and bots (currencies, names, result strings).
+The audit journal stores the same values as a fixed-layout binary record (to_bytes(), little
+endian, 16 bytes):
+
+    I  risk_bits
+    B  scenario_random
+    B  flags            bit 0 risk_random, bit 1 plays_lottery, bits 2-3 role,
+                        bits 4-5 treatment, bits 6-7 character
+    h  lottery_random
+    h  safe_option
+    h  payoff
+    I  group_id
+"""
+
+import struct
+from typing import NamedTuple
+
+from otree.api import cu
+
+
+LAYOUT = struct.Struct("<IBBhhhI")
+
+ROLES = ["Just World", "Elite", "Non Elite"]
+NE_ROLE = 2
+TREATMENTS = ["T0", "T1", "T2"]
+CHARACTERS = [None, "Samantha", "Daniel"]
+
+RISKY_STR = "Risky Lottery"
+SAFE_STR = "Safe Option"
+EMPTY_STR = " "
+
+
+class Values(NamedTuple):
+    # Plain ints/bools, for bulk readers (exports) that do not need currencies or strings
+    risk_bits: int
+    scenario_random: int
+    risk_random: bool
+    plays_lottery: bool
+    role: int
+    treatment: int
+    character: int
+    lottery_random: int
+    safe_option: int
+    payoff: int
+    group_id: int
+
+
+def record(risk_bits, scenario_random, risk_random, plays_lottery, lottery_random,
+           safe_option, payoff, role, group_id, treatment=0, character=None):
+    """The stored dict; risk_bits: the player's choices (shared/scenarios.py); role/treatment: index or name."""
+    if isinstance(role, str):
+        role = ROLES.index(role)
+    if isinstance(treatment, str):
+        treatment = TREATMENTS.index(treatment)
+    return Values(
+        int(risk_bits), int(scenario_random), bool(risk_random), bool(plays_lottery), role, treatment,
+        CHARACTERS.index(character), int(lottery_random or 0), int(safe_option), int(payoff), int(group_id),
+    )._asdict()
+
+
+def values(stored):
+    """A stored record as Values."""
+    return Values(**stored)
+
+
+def to_bytes(stored):
+    """A stored record in the journal's 16-byte layout."""
+    v = values(stored)
+    flags = v.risk_random | v.plays_lottery << 1 | v.role << 2 | v.treatment << 4 | v.character << 6
+    return LAYOUT.pack(v.risk_bits, v.scenario_random, flags, v.lottery_random, v.safe_option, v.payoff, v.group_id)
+
+
+class Summary:
+    """Read-only view of a stored record with the decoded values (not stored itself)."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, stored):
+        self._values = values(stored)
+
+    def __repr__(self):
+        return "Summary(role={!r}, scenario={}, risk_random={}, payoff={})".format(
+            self.role, self.scenario_random, self.risk_random, int(self.payoff))
+
+    def risk(self, scenario):
+        """Choice in the given (1-based) scenario."""
+        return bool(self._values.risk_bits >> (scenario - 1) & 1)
+
+    @property
+    def risk_bits(self):
+        return self._values.risk_bits
+
+    @property
+    def scenario_random(self):
+        return self._values.scenario_random
+
+    @property
+    def risk_random(self):
+        return self._values.risk_random
+
+    @property
+    def plays_lottery(self):
+        return self._values.plays_lottery
+
+    @property
+    def role(self):
+        return ROLES[self._values.role]
+
+    @property
+    def treatment(self):
+        return TREATMENTS[self._values.treatment]
+
+    @property
+    def character(self):
+        return CHARACTERS[self._values.character]
+
+    @property
+    def lottery_random(self):
+        return cu(self._values.lottery_random) if self.plays_lottery else None
+
+    @property
+    def safe_option(self):
+        return cu(self._values.safe_option)
+
+    @property
+    def payoff(self):
+        return cu(self._values.payoff)
+
+    @property
+    def group_id(self):
+        return self._values.group_id
+
+    # Strings for the results template (same values as the player fields)
+
+    @property
+    def risk_random_str(self):
+        return RISKY_STR if self.risk_random else SAFE_STR
+
+    @property
+    def safe_random_str(self):
+        if self.risk_random or self._values.role == NE_ROLE:
+            return EMPTY_STR
+        return str(self.safe_option)
+
+    @property
+    def lottery_random_str(self):
+        return str(self.lottery_random) if self.plays_lottery else EMPTY_STR
+
+
+def summarize(p, safe_options, role, group_id, treatment=0, character=None):
+    """The record of a player after ResultsWaitPage; safe_options: the scenario table."""
+    return record(
+        risk_bits=p.risk_bits,
+        scenario_random=p.scenario_random,
+        risk_random=p.risk_random,
+        plays_lottery=p.field_maybe_none("lottery_random") is not None,
+        lottery_random=p.field_maybe_none("lottery_random"),
+        safe_option=safe_options[p.scenario_random - 1],
+        payoff=p.payoff,
+        role=role,
+        group_id=group_id,
+        treatment=treatment,
+        character=character,
+    )
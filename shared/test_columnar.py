@@ -0,0 +1,38 @@
+"""
+Tests of the columnar export (shared/columnar.py) with participants as stream_participants
+yields them, written to a temporary directory:
+
+    python -m pytest shared
+"""
+
+import pytest
+
+from shared import columnar
+
+
+def participants(labels):
+    return [("s1", "p{}".format(i), label, i, {}) for i, label in enumerate(labels, start=1)]
+
+
+def test_label_width(tmp_path):
+    # 20 characters, 40 bytes in UTF-8: wider than LABEL_WIDTH in bytes, not in characters
+    labels = ["short", "é" * 20, None, "x" * 33, "last"]
+    path = tmp_path / "choices.npy"
+    assert columnar.write(path, iter(participants(labels)), len(labels), batch_size=2) == len(labels)
+
+    array = columnar.load(path)
+    assert array.dtype["participant_label"].itemsize == 40
+    assert [label.decode("utf-8") for label in array["participant_label"]] == [label or "" for label in labels]
+    assert list(array["id_in_session"]) == [1, 2, 3, 4, 5]
+    assert not (tmp_path / "choices.npy.partial").exists()
+
+
+def test_usual_labels(tmp_path):
+    path = tmp_path / "choices.npy"
+    columnar.write(path, iter(participants(["a", "b"])), 2)
+    assert columnar.load(path).dtype == columnar.dtype(columnar.LABEL_WIDTH)
+
+
+def test_fixed_label_width(tmp_path):
+    with pytest.raises(ValueError):
+        columnar.write(tmp_path / "choices.npy", iter(participants(["é" * 20])), 1, label_width=32)
@@ -0,0 +1,41 @@
+"""
+Tests of the payoff engine (shared/payoffs.py) with the seeded group streams of shared/rng.py:
+
+    python -m pytest shared
+"""
+
+import numpy as np
+import pytest
+
+from shared.payoffs import NE, resolve
+from shared.rng import PART_ONE, PART_TWO, stream
+
+SAFE_OPTIONS = [100, 200, 300, 400]
+ENDOWMENT = 1000
+LOTTERY = [0, 800]
+
+
+def choices(num_groups):
+    return np.random.default_rng(7).random((num_groups, 3, len(SAFE_OPTIONS))) < 0.5
+
+
+@pytest.mark.parametrize("part", [PART_ONE, PART_TWO])
+def test_per_group_equals_subsession(part):
+    # The wait pages resolve each group on its own, the replay the whole subsession at once
+    matrix = choices(50)
+    whole = resolve(matrix, SAFE_OPTIONS, ENDOWMENT, LOTTERY,
+                    [stream(1234, part, n) for n in range(1, 51)])
+    # Groups complete in any order
+    for g in np.random.default_rng(1).permutation(50):
+        single = resolve(matrix[g:g + 1], SAFE_OPTIONS, ENDOWMENT, LOTTERY, [stream(1234, part, g + 1)])
+        for field, values in zip(whole._fields, whole):
+            assert np.array_equal(getattr(single, field)[0], values[g]), field
+
+
+def test_payoffs():
+    matrix = choices(20)
+    res = resolve(matrix, SAFE_OPTIONS, ENDOWMENT, LOTTERY, np.random.default_rng(3))
+    assert res.plays_lottery[:, NE].all()
+    safe = np.asarray(SAFE_OPTIONS)[res.scenario_random - 1]
+    assert np.array_equal(res.payoff, ENDOWMENT - np.where(res.plays_lottery, res.lottery_random, safe))
+    assert np.array_equal(res.risk_random, np.take_along_axis(matrix, res.scenario_random[..., None] - 1, 2)[..., 0])
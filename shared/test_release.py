@@ -0,0 +1,62 @@
+"""
+Tests of the wait page releaser (shared/release.py) on an event loop of their own, with
+stand-in sockets in oTree's channel layer:
+
+    python -m pytest shared
+"""
+
+import asyncio
+import time
+
+import otree.channels.utils as channel_utils
+
+from shared.release import Releaser, releases
+
+
+class Socket:
+    def __init__(self):
+        self.received = []
+
+    async def send_text(self, text):
+        self.received.append((time.perf_counter(), text))
+
+
+def _run(groups, coalesce, stagger, session_code):
+    """Notify the channel groups one after the other and wait until the release is sent."""
+    async def main():
+        releaser = Releaser()
+        for channel_group in groups:
+            releaser.add(channel_group, {"status": "ready"}, session_code, "app.WaitPage #3",
+                         coalesce, stagger, time.perf_counter())
+        await asyncio.sleep(coalesce + stagger + 0.1)
+    asyncio.run(main())
+    return [release for release in releases if release.session_code == session_code]
+
+
+def _connect(group, sockets):
+    for socket in sockets:
+        channel_utils.channel_layer.add(group, socket)
+
+
+def test_coalesced():
+    a, b, both = Socket(), Socket(), Socket()
+    _connect("release-test-1", [a, both])
+    _connect("release-test-2", [b, both])
+
+    (release,) = _run(["release-test-1", "release-test-2", "release-test-1"], 0.02, 0, "coalesced")
+    assert (release.groups, release.clients) == (2, 3)
+    # One message per browser, also for the browser of both groups
+    assert [len(socket.received) for socket in (a, b, both)] == [1, 1, 1]
+    assert release.delay >= 0.02
+
+
+def test_staggered():
+    sockets = [Socket() for _ in range(10)]
+    _connect("release-test-3", sockets)
+
+    (release,) = _run(["release-test-3"], 0, 0.2, "staggered")
+    times = [socket.received[0][0] for socket in sockets]
+    # Longest connected first, spread over the window
+    assert times == sorted(times)
+    assert 0.15 <= times[-1] - times[0] <= 0.35
+    assert release.clients == 10
@@ -0,0 +1,119 @@
+"""
+Tests of the render cache (shared/render_cache.py): hits and misses of CachedPage.render_page
+with stand-in pages, and the cache_fields of every CachedPage of the apps against the fields
+their templates read:
+
+    python -m pytest shared
+"""
+
+import re
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from otree import settings
+from starlette.responses import HTMLResponse
+
+import part_one
+import part_one_intro
+import part_two
+from shared import render_cache
+from shared.render_cache import CachedPage
+from shared.timing import TimedPage
+
+APPS = [part_one_intro, part_one, part_two]
+
+INCLUDE = re.compile(r"{{\s*include\s+(C\.\w+|\"[^\"]+\")\s*}}")
+FIELD = re.compile(r"\b(participant|player|group)\.(\w+)")
+
+
+class Page(CachedPage):
+    cache_fields = ["participant.c_role"]
+    # Plain attributes instead of oTree's properties, set by make_page
+    session = participant = player = None
+
+
+class Group:
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def field_maybe_none(self, name):
+        return self.fields.get(name)
+
+
+def make_page(code, role, scenarios="100,200", session_code="s1"):
+    page = Page.__new__(Page)
+    page._index_in_pages = 3
+    page.session = SimpleNamespace(code=session_code, config=dict(scenarios=scenarios))
+    page.participant = SimpleNamespace(code=code, _vars=dict(c_role=role))
+    page.player = SimpleNamespace(participant=page.participant, group=Group())
+    return page
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """Codes of the participants whose page was rendered, not served from the cache."""
+    calls = []
+
+    def render_page(self, context):
+        calls.append(self.participant.code)
+        return HTMLResponse('<p>{}</p><a href="/p/{}/">'.format(self.participant._vars["c_role"], self.participant.code))
+
+    monkeypatch.setattr(TimedPage, "render_page", render_page, raising=False)
+    monkeypatch.setattr(settings, "DEBUG", False)
+    render_cache.cache.clear()
+    return calls
+
+
+def test_hit(rendered):
+    make_page("aaaa", "Elite").render_page({})
+    response = make_page("bbbb", "Elite").render_page({})
+    assert rendered == ["aaaa"]
+    assert render_cache.cache.hits == 1
+    # The participant code is swapped in on the hit
+    assert response.body.decode() == '<p>Elite</p><a href="/p/bbbb/">'
+
+
+def test_invalidation(rendered):
+    make_page("aaaa", "Elite").render_page({})
+    # Another value of a cache field, another scenario table, another session: rendered again
+    make_page("bbbb", "Non Elite").render_page({})
+    make_page("cccc", "Elite", scenarios="100,300").render_page({})
+    make_page("dddd", "Elite", session_code="s2").render_page({})
+    assert rendered == ["aaaa", "bbbb", "cccc", "dddd"]
+    assert render_cache.cache.hits == 0
+
+
+def test_eviction():
+    cache = render_cache.RenderCache(maxsize=2)
+    for key in "abc":
+        cache.put(key, key)
+    assert cache.get("a") is None
+    assert [cache.get("b"), cache.get("c")] == ["b", "c"]
+
+
+def _template_fields(app, page):
+    """Fields read by the page's template and the templates it includes (literal names and C.*)."""
+    C = app.C
+    queue = [Path(page.template_name) if page.template_name else Path(app.__name__, page.__name__ + ".html")]
+    fields = set()
+    seen = set()
+    while queue:
+        path = queue.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        # global/x.html lives in _templates, <app>/x.html in the app folder
+        source = (Path("_templates", path) if path.parts[0] == "global" else path).read_text()
+        fields.update("{}.{}".format(*match) for match in FIELD.findall(source))
+        for name in INCLUDE.findall(source):
+            queue.append(Path(getattr(C, name[2:]) if name.startswith("C.") else name.strip('"')))
+    return fields
+
+
+@pytest.mark.parametrize("app, page", [
+    (app, page) for app in APPS for page in app.page_sequence if issubclass(page, CachedPage)
+], ids=lambda value: getattr(value, "__name__", None))
+def test_cache_fields(app, page):
+    # Every field the templates read is part of the key; more is allowed (e.g. the treatment)
+    assert _template_fields(app, page) <= set(page.cache_fields)
@@ -0,0 +1,31 @@
+"""
+Tests of the scenario table of the session config (shared/scenarios.py) against the record
+layout of shared/summary.py:
+
+    python -m pytest shared
+"""
+
+import pytest
+
+import part_one
+import part_two
+from shared.scenarios import MAX_LOSS, parse_scenarios
+from shared.summary import LAYOUT, record, to_bytes
+
+
+@pytest.mark.parametrize("text", ["-1, 400", "775, {}".format(MAX_LOSS + 1), "775, x", ""])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        parse_scenarios(text)
+
+
+@pytest.mark.parametrize("C", [part_one.C, part_two.C], ids=["part_one", "part_two"])
+def test_extremes_fit_the_record(C):
+    # The largest losses and the lowest payoffs a valid table allows, as the journal stores them
+    assert parse_scenarios("0, {}".format(MAX_LOSS)) == [0, MAX_LOSS]
+    for safe_option in (0, MAX_LOSS):
+        for lottery in (C.RISK_LOW, C.RISK_HIGH):
+            loss = max(safe_option, int(lottery))
+            stored = record(0, 1, False, True, lottery, safe_option, int(C.ENDOWMENT) - loss, role=0, group_id=1)
+            unpacked = LAYOUT.unpack(to_bytes(stored))
+            assert unpacked[3:6] == (int(lottery), safe_option, int(C.ENDOWMENT) - loss)
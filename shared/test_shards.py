@@ -0,0 +1,38 @@
+"""
+Tests of the sharded mode's launcher and codes (shared/shards.py), without starting shards:
+
+    python -m pytest shared
+"""
+
+import pytest
+
+from shared.shards import Shard, marked_code, marked_join_code, shard_env, shard_of_code, shard_of_join_code
+
+
+def test_local_databases():
+    # Without DATABASE_URL every shard gets db.sqlite3 in its own directory
+    local = [Shard(0, 8001), Shard(1, 8002)]
+    envs = [shard_env(shard, {"PATH": "/bin"}) for shard in local]
+    assert [env.get("DATABASE_URL") for env in envs] == [None, None]
+    assert len({shard.directory for shard in local}) == 2
+    assert [env["OTREE_SHARD"] for env in envs] == ["0", "1"]
+
+
+def test_remote_databases():
+    remote = [Shard(0, 8001, database_url="postgres://one"), Shard(1, 8002, database_url="postgres://two")]
+    envs = [shard_env(shard, {"DATABASE_URL": "postgres://web"}) for shard in remote]
+    assert [env["DATABASE_URL"] for env in envs] == ["postgres://one", "postgres://two"]
+
+
+def test_inherited_database():
+    # A shard without its own URL must not inherit the web database
+    with pytest.raises(ValueError):
+        shard_env(Shard(0, 8001), {"DATABASE_URL": "postgres://web"})
+
+
+def test_codes():
+    assert [shard_of_code(marked_code(index), 3) for index in range(3)] == [0, 1, 2]
+    assert [shard_of_join_code(marked_join_code(index), 3) for index in range(3)] == [0, 1, 2]
+    # Codes of another shard count or of oTree itself belong to no shard
+    assert shard_of_code(marked_code(5), 3) is None
+    assert shard_of_code("not-a-code", 3) is None
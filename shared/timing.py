@@ -0,0 +1,163 @@
+"""
+Hot-path timings of both apps, kept in an in-memory ring buffer and shown in the admin report.
+
+Recorded per session:
+
+    page      server handler time of every page request ("part_one.Choices POST")
+    db        time spent in database queries during that request
+    callback  after_all_players_arrive and creating_session
+    wait      how long a participant sat on a wait page until it released them
+
+Pages subclass TimedPage / TimedWaitPage, callbacks are decorated with @timed(name). The
+buffer keeps the last RING_SIZE samples of this server process (the web process in
+production), so memory is fixed and recording is a single deque append. The arrival times of
+the participants on wait pages are bounded the same way: the oldest of MAX_ARRIVALS are
+dropped, which only forgets participants who left (dropouts, abandoned sessions).
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+import numpy as np
+from sqlalchemy import event
+
+from otree.api import Page, WaitPage
+from otree.constants import wait_page_http_header
+from otree.database import engine
+
+
+RING_SIZE = 100000
+MAX_ARRIVALS = 10000
+PERCENTILES = (50, 95, 99)
+
+Sample = namedtuple("Sample", ["session_code", "kind", "name", "role", "seconds"])
+
+samples = deque(maxlen=RING_SIZE)
+
+# (participant code, page index) -> time the participant first saw the wait page, oldest first
+_arrivals = OrderedDict()
+_local = threading.local()
+
+
+def record(session_code, kind, name, role, seconds):
+    # deque.append is atomic, no lock needed between request threads
+    samples.append(Sample(session_code, kind, name, role or "", seconds))
+
+
+# Database time of the current request: summed per thread from the engine's cursor events
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _local.query_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(_local, "query_start", None)
+    if start is not None:
+        _local.db_time = getattr(_local, "db_time", 0.0) + time.perf_counter() - start
+
+
+def _role(page):
+    # participant._vars, not participant.vars, which would mark all vars as changed
+    return page.participant._vars.get("c_role") or page.player.role
+
+
+def _page_name(page):
+    return "{}.{}".format(type(page).__module__, type(page).__name__)
+
+
+def _record_request(page, request, start):
+    elapsed = time.perf_counter() - start
+    session_code = page.participant._session_code
+    role = _role(page)
+    name = _page_name(page)
+    record(session_code, "page", "{} {}".format(name, request.method), role, elapsed)
+    record(session_code, "db", name, role, _local.db_time)
+
+
+class TimedPage(Page):
+    def inner_dispatch(self, request):
+        _local.db_time = 0.0
+        start = time.perf_counter()
+        response = super().inner_dispatch(request)
+        _record_request(self, request, start)
+        return response
+
+
+class TimedWaitPage(WaitPage):
+    def inner_dispatch(self, request):
+        _local.db_time = 0.0
+        start = time.perf_counter()
+        response = super().inner_dispatch(request)
+        _record_request(self, request, start)
+
+        # Dwell time: from the first time the wait page is shown until the reload that
+        # redirects onwards. The participant who completes the group never waits.
+        participant = self.participant
+        key = (participant.code, self._index_in_pages)
+        now = time.perf_counter()
+        if response.headers.get(wait_page_http_header):
+            if key not in _arrivals:
+                _arrivals[key] = now
+                while len(_arrivals) > MAX_ARRIVALS:
+                    _arrivals.popitem(last=False)
+        else:
+            arrived = _arrivals.pop(key, now)
+            record(participant._session_code, "wait", "{} #{}".format(_page_name(self), self._index_in_pages),
+                   _role(self), now - arrived)
+        return response
+
+
+def timed(name):
+    """Decorator for after_all_players_arrive(group or subsession) / creating_session(subsession)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            # oTree passes the group or subsession by keyword
+            (target,) = args or tuple(kwargs.values())
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(target.session.code, "callback", name, "", time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+###############################################################################################
+##  Admin report
+###############################################################################################
+
+
+def _row(kind, name, role, seconds):
+    values = np.array(seconds) * 1000
+    quantiles = np.percentile(values, PERCENTILES)
+    return dict(
+        kind=kind, name=name, role=role, n=len(values),
+        **{"p{}".format(q): "{:.1f}".format(v) for q, v in zip(PERCENTILES, quantiles)},
+        max="{:.1f}".format(values.max()),
+    )
+
+
+def report(session_code, prefix=""):
+    """
+    Percentiles (ms) for the samples of one session whose name starts with prefix:
+    one list of rows per page/callback, and one per page and role.
+    """
+    by_name = {}
+    by_role = {}
+    for sample in list(samples):
+        if sample.session_code != session_code or not sample.name.startswith(prefix):
+            continue
+        by_name.setdefault((sample.kind, sample.name), []).append(sample.seconds)
+        if sample.role:
+            by_role.setdefault((sample.kind, sample.name, sample.role), []).append(sample.seconds)
+
+    return dict(
+        timing_rows=[_row(kind, name, "", values) for (kind, name), values in sorted(by_name.items())],
+        timing_role_rows=[_row(*key, values) for key, values in sorted(by_role.items())],
+        timing_ring_size=RING_SIZE,
+    )
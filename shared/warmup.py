@@ -0,0 +1,175 @@
+"""
+Template check before the server starts: every template the apps' pages render is compiled, with
+the compile times, and a broken template stops the deploy instead of failing a page in the
+middle of a session.
+
+oTree compiles a template the first time it is rendered and keeps it for the life of the process
+(otree.templating.ibis_loader), so a broken one is only found when the first participant reaches
+it, and the first wave on Introduction, Choices or Final_Results, which is everybody at once,
+pays the compile of the page template, its extends chain and the fragments it includes.
+warm_up() walks the page_sequence of every app (settings.OTREE_APPS) and compiles:
+
+- the template of every page, resolved and typed as the page does it (template_name or
+  <app>/<Page>.html, the wait page fallbacks; the type adds the implicit extends)
+- every C.*_TEMPLATE of the app (the temp_*.html instructions, results and choice fragments)
+- every include with a literal name in these templates and their base templates, recursively
+- the other .html files of the app folders and _templates/global (admin reports, fragments
+  no page has reached yet), so that a broken file is found as well
+
+Includes whose name is computed otherwise at render time are not known in advance. Templates are
+compiled, not rendered (that needs a participant), so syntax errors and missing files are found,
+undefined variables are not. All errors are collected and reported together.
+
+It is used in two places, and nothing in oTree is replaced for it:
+
+- the check   a deploy step in its own process, before the server starts:
+
+                  python -m shared.warmup [--all]     (exit status 1 if a template is broken)
+
+              The Procfile runs it in the release phase, so a broken template stops the deploy,
+              and the Dockerfile before `otree prodserver`. It only checks: its compiled
+              templates go away with its process.
+- the cache   warm_server(), in the server process itself: shared.install() starts it when
+              the apps are imported by a server command (SERVER_COMMANDS). A thread waits until
+              the apps are imported and fills the loader the pages render from, so the first
+              wave does not compile. Broken templates are printed to the server log; the server
+              keeps running.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from otree import settings
+from otree.common import get_constants, get_pages_module
+from otree.pypage import get_pypage_path
+from otree.templating import ibis_loader
+from otree.templating.nodes import IncludeNode, IncludeSiblingNode
+
+
+GLOBAL_TEMPLATES = Path("_templates", "global")
+# otree commands that serve the pages; devserver serves from devserver_inner
+SERVER_COMMANDS = ("prodserver", "prodserver1of2", "devserver_inner")
+
+
+class Compiled(NamedTuple):
+    name: str
+    source: str     # the page, C.*_TEMPLATE, the including template, or "file"
+    seconds: float
+
+
+def _includes(node):
+    """Names of the includes with a literal name below node (extends chains included)."""
+    for child in node.children:
+        if isinstance(child, (IncludeNode, IncludeSiblingNode)):
+            expr = child.template_expr
+            if expr.is_literal and isinstance(expr.literal, str):
+                yield child.expand_template_name(expr.literal)
+        yield from _includes(child)
+
+
+def page_template(page):
+    """(template name, template type) the page renders, as oTree resolves them."""
+    app_name = page.__module__.split(".")[0]
+    if get_pypage_path(app_name, page.__name__):
+        return "otree/Py{}.html".format(page._template_type), None
+    # get_template_name only reads class attributes and the files; no request is needed
+    return page.get_template_name(page.__new__(page)), page._template_type
+
+
+def warm_up(app_names=None):
+    """Compile the templates; returns (compiled, errors) with errors as (name, source, message)."""
+    compiled = []
+    errors = []
+    seen = set()
+    queue = []
+
+    def load(name, source, template_type=None):
+        if name in seen:
+            return
+        seen.add(name)
+        start = time.perf_counter()
+        try:
+            template = ibis_loader.load(name, template_type=template_type)
+        except Exception as error:
+            errors.append((name, source, "{}: {}".format(type(error).__name__, error)))
+            return
+        compiled.append(Compiled(name, source, time.perf_counter() - start))
+        queue.extend((include, name) for include in _includes(template.root_node))
+
+    def load_includes():
+        while queue:
+            load(*queue.pop(0))
+
+    app_names = list(app_names or settings.OTREE_APPS)
+    # Pages first: the loader caches by name, and a page template needs the page's type
+    for app_name in app_names:
+        for page in get_pages_module(app_name).page_sequence:
+            name, template_type = page_template(page)
+            load(name, "{}.{}".format(app_name, page.__name__), template_type)
+    for app_name in app_names:
+        C = get_constants(app_name)
+        for attr in sorted(vars(C)):
+            if attr.endswith("_TEMPLATE") and isinstance(getattr(C, attr), str):
+                load(getattr(C, attr), "{}.C.{}".format(app_name, attr))
+    load_includes()
+
+    # Names as the loader resolves them: <app>/x.html from the project folder, global/x.html from _templates
+    for app_name in app_names:
+        for path in sorted(Path(app_name).glob("*.html")):
+            load("{}/{}".format(app_name, path.name), "file")
+    for path in sorted(GLOBAL_TEMPLATES.glob("*.html")):
+        load("{}/{}".format(GLOBAL_TEMPLATES.name, path.name), "file")
+    load_includes()
+    return compiled, errors
+
+
+def print_report(compiled, errors, show_all=False, file=None):
+    total = sum(entry.seconds for entry in compiled)
+    print("Templates: {} compiled in {:.1f} ms".format(len(compiled), total * 1000), file=file)
+    entries = sorted(compiled, key=lambda entry: -entry.seconds)
+    for entry in entries if show_all else entries[:5]:
+        print("  {:>7.1f} ms  {:<50} {}".format(entry.seconds * 1000, entry.name, entry.source), file=file)
+    for name, source, message in errors:
+        print("  BROKEN  {} ({}): {}".format(name, source, message), file=file)
+    (file or sys.stdout).flush()
+
+
+def check(show_all=False):
+    """Warm up and report; exits the process if a template is broken."""
+    compiled, errors = warm_up()
+    print_report(compiled, errors, show_all)
+    if errors:
+        raise SystemExit("{} broken template(s), not starting".format(len(errors)))
+
+
+def is_server():
+    """Whether this process is an oTree server (otree <command>), whose pages render the templates."""
+    return len(sys.argv) > 1 and sys.argv[1] in SERVER_COMMANDS
+
+
+def warm_server():
+    """Fill the template cache of this server process on a thread, once the apps are imported."""
+    def run():
+        # get_pages_module waits for the imports of the apps that are running on the main thread
+        compiled, errors = warm_up()
+        print_report(compiled, errors)
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--all", action="store_true", help="list the compile time of every template")
+    args = parser.parse_args()
+
+    from otree.main import setup
+    setup()
+    check(args.all)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+The worker process: keeps the session pools filled (shared/pool.py) and runs the background
+jobs queued from the /jobs admin page (shared/jobs.py), so the web process only serves pages.
+
+The Procfile's worker runs it (the worker dyno on Heroku / oTree Hub), next to the web process
+and on the same database, which holds the job queue:
+
+    python -m shared.worker [--once] [--pool-interval 30] [--poll 1]
+
+In the sharded mode the launcher starts one per shard (shared/shards.py). Jobs run one at a
+time in this process; the pools are refilled between jobs, at most every --pool-interval
+seconds. --once refills the pools, runs the waiting jobs and exits. The worker marks itself
+alive in the database while it waits and at every progress report of a job, so the /jobs page
+knows whether one is running.
+"""
+
+import argparse
+import time
+
+from otree.database import session_scope
+
+from shared import jobs
+from shared.pool import pools
+
+
+def refill_pools():
+    for room, pool in pools().items():
+        with session_scope():
+            created, deleted = pool.refill()
+        if created or deleted:
+            print("{}: {} pooled session(s) created, {} expired deleted".format(room, created, deleted), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="refill the pools, run the waiting jobs and exit")
+    parser.add_argument("--pool-interval", type=float, default=30, help="seconds between pool refills")
+    parser.add_argument("--poll", type=float, default=1, help="seconds between looks at the job queue")
+    args = parser.parse_args()
+
+    from otree.main import setup
+    setup()
+
+    jobs.recover()
+    next_refill = next_beat = 0
+    try:
+        while True:
+            if time.monotonic() >= next_beat:
+                with session_scope():
+                    jobs.heartbeat()
+                next_beat = time.monotonic() + jobs.HEARTBEAT_SECONDS
+            if time.monotonic() >= next_refill:
+                refill_pools()
+                next_refill = time.monotonic() + args.pool_interval
+            ran = jobs.run_next()
+            if ran is not None:
+                print("Job {} {}: {} {}".format(*ran[:3], ran[3] or ""), flush=True)
+            elif args.once:
+                break
+            else:
+                time.sleep(args.poll)
+    finally:
+        # The engine of the job kinds, one for the life of this process
+        jobs.dispose()
+
+
+if __name__ == "__main__":
+    main()